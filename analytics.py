@@ -0,0 +1,184 @@
+# 支出分析汇总
+# spending_rollup 表按 (开票月份, 使用途径, 物品类型, 购买人, 状态) 保存申请数量与发票金额合计，
+# 由 applications 和归档表上的触发器增量维护: 提交、修改、审批、删除申请时只更新受影响的汇总行，
+# 归档和恢复时从一张表减去、在另一张表加上，合计不变（分析覆盖全部历史数据）。
+# 分析页面和 API 只对汇总行分组求和，行数只与月份数和各维度取值数有关，不随申请数增长。
+# 金额以“分”为单位的整数累加，避免浮点数反复加减产生误差
+import archive
+
+ROLLUP_TABLE = 'spending_rollup'
+
+# 汇总维度，及其在申请行（NEW / OLD / 表别名）上的取值表达式；月份为开票日期的 'YYYY-MM'
+ROLLUP_DIMENSIONS = ('month', 'usage_type', 'item_type', 'purchaser', 'status')
+_SOURCE_COLUMNS = {'month': 'invoice_date', 'usage_type': 'usage_type', 'item_type': 'item_type',
+                   'purchaser': 'purchaser', 'status': 'status'}
+
+DIMENSION_LABELS = {'month': '开票月份', 'usage_type': '使用途径', 'item_type': '物品类型',
+                    'purchaser': '购买人', 'status': '状态'}
+
+# 未指定分组时按月份和使用途径汇总
+DEFAULT_GROUP_BY = ('month', 'usage_type')
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+    month TEXT NOT NULL,
+    usage_type TEXT NOT NULL,
+    item_type TEXT NOT NULL,
+    purchaser TEXT NOT NULL,
+    status TEXT NOT NULL,
+    app_count INTEGER NOT NULL DEFAULT 0,
+    amount_cents INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, usage_type, item_type, purchaser, status)
+) WITHOUT ROWID
+'''
+
+
+def _cents(expr):
+    return f'CAST(ROUND({expr} * 100) AS INTEGER)'
+
+
+def dimension_expression(dimension, row):
+    if dimension == 'month':
+        return f"COALESCE(substr({row}.invoice_date, 1, 7), '')"
+    return f"COALESCE({row}.{_SOURCE_COLUMNS[dimension]}, '')"
+
+
+def _key_condition(row):
+    return ' AND '.join(f'{dimension} = {dimension_expression(dimension, row)}' for dimension in ROLLUP_DIMENSIONS)
+
+
+# 生成对某一行（NEW 或 OLD）加/减计数的触发器语句
+def _apply_row_sql(row, sign):
+    values = ', '.join(dimension_expression(dimension, row) for dimension in ROLLUP_DIMENSIONS)
+    return '\n    '.join((
+        f"INSERT OR IGNORE INTO {ROLLUP_TABLE} ({', '.join(ROLLUP_DIMENSIONS)}) VALUES ({values});",
+        f"UPDATE {ROLLUP_TABLE} SET app_count = app_count {sign} 1, "
+        f"amount_cents = amount_cents {sign} {_cents(f'{row}.invoice_amount')} "
+        f"WHERE {_key_condition(row)};",
+    ))
+
+
+_UPDATE_COLUMNS = ', '.join(sorted(set(_SOURCE_COLUMNS.values()) | {'invoice_amount'}))
+
+TRIGGERS = {
+    'trg_rollup_insert': f'''
+CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON applications
+BEGIN
+    {_apply_row_sql('NEW', '+')}
+END''',
+    'trg_rollup_delete': f'''
+CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON applications
+BEGIN
+    {_apply_row_sql('OLD', '-')}
+END''',
+    'trg_rollup_update': f'''
+CREATE TRIGGER IF NOT EXISTS trg_rollup_update
+AFTER UPDATE OF {_UPDATE_COLUMNS} ON applications
+BEGIN
+    {_apply_row_sql('OLD', '-')}
+    {_apply_row_sql('NEW', '+')}
+END''',
+    # 归档表只有移入（归档）和移出（恢复）
+    'trg_rollup_archive_insert': f'''
+CREATE TRIGGER IF NOT EXISTS trg_rollup_archive_insert AFTER INSERT ON {archive.ARCHIVE_TABLE}
+BEGIN
+    {_apply_row_sql('NEW', '+')}
+END''',
+    'trg_rollup_archive_delete': f'''
+CREATE TRIGGER IF NOT EXISTS trg_rollup_archive_delete AFTER DELETE ON {archive.ARCHIVE_TABLE}
+BEGIN
+    {_apply_row_sql('OLD', '-')}
+END''',
+}
+
+
+# 创建汇总表和触发器（SQLite 迁移调用，PostgreSQL 见 postgres.py）
+def create_schema(c):
+    c.execute(SCHEMA)
+    for sql in TRIGGERS.values():
+        c.execute(sql)
+
+
+# 按 applications 和归档表当前数据计算的汇总结果 {(维度值, ...): (count, amount_cents)}
+def _compute(c):
+    result = {}
+    keys = ', '.join(dimension_expression(dimension, 'a') for dimension in ROLLUP_DIMENSIONS)
+    for table in archive.APPLICATION_TABLES:
+        c.execute(f"SELECT {keys}, COUNT(*), COALESCE(SUM({_cents('a.invoice_amount')}), 0) "
+                  f"FROM {table} a GROUP BY {', '.join(str(i + 1) for i in range(len(ROLLUP_DIMENSIONS)))}")
+        for row in c.fetchall():
+            key = tuple(row[:len(ROLLUP_DIMENSIONS)])
+            count, cents = result.get(key, (0, 0))
+            result[key] = (count + row[-2], cents + row[-1])
+    return result
+
+
+def _stored(c):
+    c.execute(f"SELECT {', '.join(ROLLUP_DIMENSIONS)}, app_count, amount_cents FROM {ROLLUP_TABLE}")
+    return {tuple(row[:len(ROLLUP_DIMENSIONS)]): (row[-2], row[-1]) for row in c.fetchall() if row[-2] or row[-1]}
+
+
+# 全量重建汇总表（在调用方的事务中执行，用于回填历史数据或修复不一致）
+def rebuild(c):
+    c.execute(f'DELETE FROM {ROLLUP_TABLE}')
+    placeholders = ', '.join('?' * (len(ROLLUP_DIMENSIONS) + 2))
+    c.executemany(
+        f"INSERT INTO {ROLLUP_TABLE} ({', '.join(ROLLUP_DIMENSIONS)}, app_count, amount_cents) "
+        f"VALUES ({placeholders})",
+        [(*key, count, cents) for key, (count, cents) in _compute(c).items()])
+
+
+# 一致性检查，返回不一致的项 [(维度值, 汇总表中的值, 实际值)]，为空表示一致
+def check(c):
+    expected = _compute(c)
+    stored = _stored(c)
+    return [(key, stored.get(key, (0, 0)), expected.get(key, (0, 0)))
+            for key in sorted(set(expected) | set(stored))
+            if expected.get(key, (0, 0)) != stored.get(key, (0, 0))]
+
+
+# 解析 group_by 参数（逗号分隔的维度名），未指定时返回默认分组；包含未知维度时抛出 ValueError
+def parse_group_by(value):
+    if value is None:
+        return list(DEFAULT_GROUP_BY)
+    group_by = list(dict.fromkeys(item.strip() for item in value.split(',') if item.strip()))
+    unknown = [item for item in group_by if item not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"未知的分组维度: {', '.join(unknown)}")
+    return group_by
+
+
+# 按分组维度汇总，filters 可包含 month_start / month_end（'YYYY-MM'）、usage_type、item_type、status
+# （精确匹配）和 purchaser（模糊匹配）。返回 [(各分组维度值..., 申请数, 金额)]，按分组维度排序
+def query(c, group_by, filters):
+    where = ' WHERE 1=1'
+    params = []
+    if filters.get('month_start'):
+        where += ' AND month >= ?'
+        params.append(filters['month_start'])
+    if filters.get('month_end'):
+        where += ' AND month <= ?'
+        params.append(filters['month_end'])
+    for dimension in ('usage_type', 'item_type', 'status'):
+        if filters.get(dimension):
+            where += f' AND {dimension} = ?'
+            params.append(filters[dimension])
+    if filters.get('purchaser'):
+        where += ' AND purchaser LIKE ?'
+        params.append(f"%{filters['purchaser']}%")
+    columns = ', '.join(group_by)
+    select = f'{columns}, ' if group_by else ''
+    sql = f'SELECT {select}SUM(app_count), SUM(amount_cents) FROM {ROLLUP_TABLE}{where}'
+    if group_by:
+        sql += f' GROUP BY {columns} HAVING SUM(app_count) > 0 ORDER BY {columns}'
+    c.execute(sql, params)
+    return [(*row[:-2], int(row[-2]), int(row[-1]) / 100) for row in c.fetchall() if row[-2]]
+
+
+# 分析页面筛选下拉框的可选值 {维度: [值, ...]}（不含月份和购买人）
+def dimension_values(c):
+    values = {}
+    for dimension in ('usage_type', 'item_type', 'status'):
+        c.execute(f'SELECT DISTINCT {dimension} FROM {ROLLUP_TABLE} WHERE app_count > 0 ORDER BY 1')
+        values[dimension] = [row[0] for row in c.fetchall()]
+    return values
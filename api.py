@@ -0,0 +1,39 @@
+# 只读 JSON API 的列投影
+# 客户端用 fields 参数（逗号分隔）选择需要的列，结果以列名数组 + 行数组的紧凑形式返回:
+#   {"columns": ["app_number", "status"], "rows": [["FB...", "待审批"], ...]}
+# 只查询选中的列，列表默认不包含较长的文本列（商品参数及用途说明、商品链接、审批意见）
+
+# applications 中可以选择的列（与 SELECT * 的顺序一致）
+APPLICATION_FIELDS = ('id', 'app_number', 'purchaser', 'purchase_details', 'item_name',
+                      'product_link', 'usage_type', 'item_type', 'quantity', 'purchase_time',
+                      'invoice_number', 'invoice_amount', 'invoice_date', 'status',
+                      'approval_comment', 'created_at', 'updated_at')
+
+LONG_TEXT_FIELDS = ('purchase_details', 'product_link', 'approval_comment')
+
+# 列表默认返回的列（与后台列表显示的列一致）
+DEFAULT_LIST_FIELDS = ('app_number', 'purchaser', 'item_name', 'invoice_number', 'invoice_amount',
+                       'purchase_time', 'invoice_date', 'status', 'created_at')
+
+# 附件元数据（不返回服务器上的文件路径）
+ATTACHMENT_FIELDS = ('id', 'original_filename', 'stored_filename', 'content_hash')
+
+
+# 解析 fields 参数，未指定时返回默认列；包含未知列时抛出 ValueError
+def parse_fields(value, allowed, default):
+    if not value:
+        return list(default)
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+    return fields or list(default)
+
+
+def select_list(fields, table='applications'):
+    return ', '.join(f'{table}.{field}' for field in fields)
+
+
+# 保持 SELECT * 列顺序（模板按位置取值），不需要的列以 NULL 代替，不读取其内容
+def projected_select(columns, skip, table='applications'):
+    return ', '.join('NULL' if column in skip else f'{table}.{column}' for column in columns)
@@ -0,0 +1,78 @@
+# 审批状态与批量审批
+# 批量审批以集合方式执行：申请编号写入临时表，一次查询取得当前状态，一条 UPDATE 完成更新，
+# 全部在同一个写事务中，代替逐条 SELECT COUNT(*) + UPDATE。
+# 读取状态到更新之间其他事务不能修改这些申请: SQLite 由 BEGIN IMMEDIATE 的写锁保证，PostgreSQL 先锁定这些行
+import db
+
+VALID_STATUSES = ['待审批', '报销中', '已报销', '驳回']
+
+# 允许的状态流转（当前状态 -> 可设置的状态），保持原状态视为允许（可用于更新审批意见）
+# 已报销为终态；驳回的申请需重新进入待审批或报销中，不能直接报销
+ALLOWED_TRANSITIONS = {
+    '待审批': {'待审批', '报销中', '已报销', '驳回'},
+    '报销中': {'待审批', '报销中', '已报销', '驳回'},
+    '驳回': {'待审批', '报销中', '驳回'},
+    '已报销': {'已报销'},
+}
+
+# 批量审批使用的临时表（每个连接一个）、读取当前状态和更新状态的语句。
+# 以输入顺序 position 为主键，按输入顺序读取当前状态时不需要再排序
+BULK_TABLE = '''CREATE TEMP TABLE IF NOT EXISTS bulk_app_numbers (
+                    position INTEGER PRIMARY KEY,
+                    app_number TEXT NOT NULL UNIQUE,
+                    allowed INTEGER NOT NULL DEFAULT 0
+                )'''
+CURRENT_STATUS_QUERY = '''SELECT bulk_app_numbers.app_number, applications.status FROM bulk_app_numbers
+                          LEFT JOIN applications ON applications.app_number = bulk_app_numbers.app_number
+                          ORDER BY bulk_app_numbers.position'''
+UPDATE_STATUS_QUERY = '''UPDATE applications SET status = ?, approval_comment = ?, updated_at = ?
+                         WHERE app_number IN (SELECT app_number FROM bulk_app_numbers WHERE allowed = 1)'''
+
+RESULT_UPDATED = 'updated'
+RESULT_NOT_FOUND = 'not_found'
+RESULT_INVALID_TRANSITION = 'invalid_transition'
+
+
+def is_allowed_transition(current, target):
+    return target in ALLOWED_TRANSITIONS.get(current, set(VALID_STATUSES))
+
+
+# 批量更新审批状态
+# enforce_transitions=False 时不检查状态流转（与原表单批量审批行为一致）
+# 返回 [(申请编号, 结果, 原状态)]，顺序与输入一致（已去重）
+def bulk_update_status(conn, app_numbers, status, comment, updated_at, enforce_transitions=True):
+    app_numbers = list(dict.fromkeys(app_numbers))
+    c = conn.cursor()
+    if conn.in_transaction:
+        conn.commit()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute(BULK_TABLE)
+        c.execute('DELETE FROM bulk_app_numbers')
+        c.executemany('INSERT INTO bulk_app_numbers (app_number, position) VALUES (?, ?)',
+                      [(app_number, i) for i, app_number in enumerate(app_numbers)])
+        lock = db.for_update(conn)
+        if lock:
+            # 按 id 顺序加锁，与其他批量审批同时执行时不会互相死锁
+            c.execute('SELECT id FROM applications WHERE app_number IN (SELECT app_number FROM bulk_app_numbers) '
+                      'ORDER BY id' + lock)
+        c.execute(CURRENT_STATUS_QUERY)
+        results = []
+        allowed = []
+        for app_number, current in c.fetchall():
+            if current is None:
+                results.append((app_number, RESULT_NOT_FOUND, None))
+            elif enforce_transitions and not is_allowed_transition(current, status):
+                results.append((app_number, RESULT_INVALID_TRANSITION, current))
+            else:
+                results.append((app_number, RESULT_UPDATED, current))
+                allowed.append((app_number,))
+        if allowed:
+            c.executemany('UPDATE bulk_app_numbers SET allowed = 1 WHERE app_number = ?', allowed)
+            c.execute(UPDATE_STATUS_QUERY, (status, comment, updated_at))
+        c.execute('DELETE FROM bulk_app_numbers')
+        c.execute('COMMIT')
+    except Exception:
+        c.execute('ROLLBACK')
+        raise
+    return results
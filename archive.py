@@ -0,0 +1,249 @@
+# 已报销申请归档
+# 已报销超过一定天数的申请连同附件记录按批从 applications / attachments 移到同一数据库中的
+# applications_archive / attachments_archive（列与原表相同，另记录归档时间，id 保持不变），
+# 后台列表、计数、统计汇总、全文索引只覆盖仍在处理中的数据。
+# 管理后台、导出和 API 默认只查询 applications，筛选参数 archive=include（含归档）或 only（仅归档）时才读取归档表；
+# 申请详情、状态查询、附件下载找不到时再查归档表。发票号码唯一性同时覆盖两张表:
+# applications 上的触发器拒绝与归档申请重复的发票号码，发票号码检查同时查询两张表。
+# 归档数据只读，需要修改时用 restore 移回 applications
+import api
+import db
+
+ARCHIVE_STATUS = '已报销'
+
+ARCHIVE_TABLE = 'applications_archive'
+ATTACHMENT_ARCHIVE_TABLE = 'attachments_archive'
+
+# 按申请编号 / 发票号码查询申请、查询申请的附件、按存储文件名查询附件的语句，{table} 为原表或归档表
+FIND_APPLICATION_QUERY = 'SELECT {fields} FROM {table} WHERE {column} = ?'
+FIND_ATTACHMENTS_QUERY = 'SELECT {fields} FROM {table} WHERE app_number = ? ORDER BY id'
+FIND_DOWNLOAD_QUERY = 'SELECT file_path, original_filename, content_hash FROM {table} WHERE stored_filename = ?'
+# 下一批待归档的申请
+SETTLED_BATCH_QUERY = 'SELECT id FROM applications WHERE status = ? AND updated_at < ? ORDER BY updated_at LIMIT ?'
+
+# 保存发票号码 / 附件记录的表（唯一性检查、文件引用计数需覆盖全部）
+APPLICATION_TABLES = ('applications', ARCHIVE_TABLE)
+ATTACHMENT_TABLES = ('attachments', ATTACHMENT_ARCHIVE_TABLE)
+
+# 与 SELECT * FROM applications / attachments 相同的列顺序（归档表另有 archived_at，查询时不选）
+APPLICATION_COLUMNS = api.APPLICATION_FIELDS
+ATTACHMENT_COLUMNS = ('id', 'app_number', 'original_filename', 'stored_filename', 'file_path', 'content_hash')
+
+# 筛选参数 archive 的取值: ''（默认，不含归档）、include（含归档）、only（仅归档）
+SCOPE_INCLUDE = 'include'
+SCOPE_ONLY = 'only'
+
+# 每批移动的申请数上限（id 列表作为 IN 参数，低于 SQLite 默认的变量数上限）
+MAX_BATCH_SIZE = 900
+
+SCHEMA = (
+    f'''CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+        id INTEGER PRIMARY KEY,
+        app_number TEXT UNIQUE NOT NULL,
+        purchaser TEXT NOT NULL,
+        purchase_details TEXT,
+        item_name TEXT NOT NULL,
+        product_link TEXT,
+        usage_type TEXT NOT NULL,
+        item_type TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        purchase_time DATE NOT NULL,
+        invoice_number TEXT NOT NULL,
+        invoice_amount REAL NOT NULL,
+        invoice_date DATE NOT NULL,
+        status TEXT,
+        approval_comment TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        archived_at TIMESTAMP NOT NULL
+    )''',
+    f'''CREATE TABLE IF NOT EXISTS {ATTACHMENT_ARCHIVE_TABLE} (
+        id INTEGER PRIMARY KEY,
+        app_number TEXT NOT NULL,
+        original_filename TEXT NOT NULL,
+        stored_filename TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        content_hash TEXT
+    )''',
+)
+
+# 归档表只按发票号码、列表默认排序和日期筛选建索引（归档查询很少，不为每个排序字段建索引）；
+# applications (status, updated_at) 用于按批选出待归档的申请
+INDEXES = (
+    f'CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_invoice_number ON {ARCHIVE_TABLE} (invoice_number)',
+    f'CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_created_at ON {ARCHIVE_TABLE} (created_at)',
+    f'CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_invoice_date ON {ARCHIVE_TABLE} (invoice_date)',
+    f'CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_purchase_time ON {ARCHIVE_TABLE} (purchase_time)',
+    f'CREATE INDEX IF NOT EXISTS idx_{ATTACHMENT_ARCHIVE_TABLE}_app_number ON {ATTACHMENT_ARCHIVE_TABLE} (app_number)',
+    f'CREATE INDEX IF NOT EXISTS idx_{ATTACHMENT_ARCHIVE_TABLE}_stored_filename '
+    f'ON {ATTACHMENT_ARCHIVE_TABLE} (stored_filename)',
+    f'CREATE INDEX IF NOT EXISTS idx_{ATTACHMENT_ARCHIVE_TABLE}_file_path ON {ATTACHMENT_ARCHIVE_TABLE} (file_path)',
+    f'CREATE INDEX IF NOT EXISTS idx_{ATTACHMENT_ARCHIVE_TABLE}_content_hash '
+    f'ON {ATTACHMENT_ARCHIVE_TABLE} (content_hash)',
+    'CREATE INDEX IF NOT EXISTS idx_applications_status_updated_at ON applications (status, updated_at)',
+)
+
+# 新增申请或修改发票号码时，号码已存在于归档表则拒绝（与唯一索引冲突一样抛出 IntegrityError）
+TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS trg_invoice_not_archived_insert
+        BEFORE INSERT ON applications
+        WHEN EXISTS (SELECT 1 FROM {ARCHIVE_TABLE} WHERE invoice_number = NEW.invoice_number)
+        BEGIN
+            SELECT RAISE(ABORT, '发票号码已存在于归档申请中');
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_invoice_not_archived_update
+        BEFORE UPDATE OF invoice_number ON applications
+        WHEN NEW.invoice_number IS NOT OLD.invoice_number
+             AND EXISTS (SELECT 1 FROM {ARCHIVE_TABLE} WHERE invoice_number = NEW.invoice_number)
+        BEGIN
+            SELECT RAISE(ABORT, '发票号码已存在于归档申请中');
+        END''',
+)
+
+
+# 建立归档表、索引和触发器（SQLite 迁移调用，PostgreSQL 见 postgres.py）
+def create_schema(c):
+    for sql in SCHEMA + INDEXES + TRIGGERS:
+        c.execute(sql)
+
+
+# 按筛选范围返回查询的数据源（别名均为 applications，筛选和排序条件不需要改变）
+def source(scope):
+    if scope == SCOPE_ONLY:
+        return f'{ARCHIVE_TABLE} AS applications'
+    if scope == SCOPE_INCLUDE:
+        columns = ', '.join(APPLICATION_COLUMNS)
+        return (f'(SELECT {columns} FROM applications UNION ALL '
+                f'SELECT {columns} FROM {ARCHIVE_TABLE}) AS applications')
+    return 'applications'
+
+
+# 按筛选范围返回保存附件记录的表（含归档时两张表都要查，每条申请的附件只在其中一张表中）
+def attachment_tables(scope):
+    if scope == SCOPE_ONLY:
+        return (ATTACHMENT_ARCHIVE_TABLE,)
+    if scope == SCOPE_INCLUDE:
+        return ATTACHMENT_TABLES
+    return ('attachments',)
+
+
+def includes_archive(scope):
+    return scope in (SCOPE_INCLUDE, SCOPE_ONLY)
+
+
+# 查询一条申请: 先查 applications，找不到时查归档表。column 为 app_number 或 invoice_number。
+# 返回 (行, 是否已归档)，不存在时返回 (None, False)
+def find_application(c, column, value, fields=APPLICATION_COLUMNS):
+    if column not in ('app_number', 'invoice_number'):
+        raise ValueError(f'不支持按 {column} 查询')
+    for table in APPLICATION_TABLES:
+        c.execute(FIND_APPLICATION_QUERY.format(fields=', '.join(fields), table=table, column=column), (value,))
+        row = c.fetchone()
+        if row is not None:
+            return row, table == ARCHIVE_TABLE
+    return None, False
+
+
+# 申请的附件记录（列顺序与 SELECT * FROM attachments 相同）
+def find_attachments(c, app_number, archived=False, fields=ATTACHMENT_COLUMNS):
+    table = ATTACHMENT_ARCHIVE_TABLE if archived else 'attachments'
+    c.execute(FIND_ATTACHMENTS_QUERY.format(fields=', '.join(fields), table=table), (app_number,))
+    return c.fetchall()
+
+
+# 按存储文件名查询附件 (文件路径, 原始文件名, 内容哈希)，归档的附件同样可以下载
+def find_download(c, stored_filename):
+    for table in ATTACHMENT_TABLES:
+        c.execute(FIND_DOWNLOAD_QUERY.format(table=table), (stored_filename,))
+        row = c.fetchone()
+        if row is not None:
+            return row
+    return None
+
+
+# 待归档的申请数（updated_at 早于 cutoff 的已报销申请）
+def count_pending(c, cutoff):
+    c.execute('SELECT COUNT(*) FROM applications WHERE status = ? AND updated_at < ?', (ARCHIVE_STATUS, cutoff))
+    return c.fetchone()[0]
+
+
+def _move_batch(c, ids, archived_at):
+    placeholders = ', '.join('?' * len(ids))
+    columns = ', '.join(APPLICATION_COLUMNS)
+    attachment_columns = ', '.join(ATTACHMENT_COLUMNS)
+    c.execute(f'''INSERT INTO {ARCHIVE_TABLE} ({columns}, archived_at)
+                  SELECT {columns}, ? FROM applications WHERE id IN ({placeholders})''', [archived_at, *ids])
+    c.execute(f'''INSERT INTO {ATTACHMENT_ARCHIVE_TABLE} ({attachment_columns})
+                  SELECT {attachment_columns} FROM attachments
+                  WHERE app_number IN (SELECT app_number FROM applications WHERE id IN ({placeholders}))''', ids)
+    attachments = c.rowcount
+    c.execute(f'''DELETE FROM attachments
+                  WHERE app_number IN (SELECT app_number FROM applications WHERE id IN ({placeholders}))''', ids)
+    # 删除时由 applications 上的触发器更新统计汇总、全文索引和数据版本号
+    c.execute(f'DELETE FROM applications WHERE id IN ({placeholders})', ids)
+    return attachments
+
+
+# 把 updated_at 早于 cutoff（'YYYY-MM-DD HH:MM:SS'）的已报销申请连同附件记录按批移入归档表。
+# 每批一个写事务，批与批之间其他请求可以写入；中途中断时已提交的批次保持归档状态，可重复执行。
+# progress(累计申请数, 累计附件数) 在每批提交后调用。返回 {'applications': 申请数, 'attachments': 附件数}
+def archive_settled(conn, cutoff, archived_at, batch_size=500, progress=None):
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    totals = {'applications': 0, 'attachments': 0}
+    c = conn.cursor()
+    if conn.in_transaction:
+        conn.commit()
+    while True:
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            # PostgreSQL 上锁定本批申请，移动期间不会被修改或删除（修改会在移动之后丢失）
+            c.execute(SETTLED_BATCH_QUERY + db.for_update(conn), (ARCHIVE_STATUS, cutoff, batch_size))
+            ids = [row[0] for row in c.fetchall()]
+            if not ids:
+                c.execute('ROLLBACK')
+                break
+            attachments = _move_batch(c, ids, archived_at)
+            c.execute('COMMIT')
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+        totals['applications'] += len(ids)
+        totals['attachments'] += attachments
+        if progress is not None:
+            progress(totals['applications'], totals['attachments'])
+    return totals
+
+
+# 把归档的申请连同附件记录移回 applications / attachments（id 不变），返回移回的申请编号列表。
+# 先删除归档行再插入，插入时 applications 上的发票号码触发器不会与自身冲突
+def restore(conn, app_numbers):
+    app_numbers = list(dict.fromkeys(app_numbers))
+    if not app_numbers:
+        return []
+    placeholders = ', '.join('?' * len(app_numbers))
+    columns = ', '.join(APPLICATION_COLUMNS)
+    attachment_columns = ', '.join(ATTACHMENT_COLUMNS)
+    c = conn.cursor()
+    if conn.in_transaction:
+        conn.commit()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        # PostgreSQL 上锁定归档行，同时移回同一申请时后执行的一方等待，之后读不到已移回的行
+        c.execute(f'SELECT {columns} FROM {ARCHIVE_TABLE} WHERE app_number IN ({placeholders}){db.for_update(conn)}',
+                  app_numbers)
+        applications = c.fetchall()
+        c.execute(f'SELECT {attachment_columns} FROM {ATTACHMENT_ARCHIVE_TABLE} '
+                  f'WHERE app_number IN ({placeholders}) ORDER BY id', app_numbers)
+        attachments = c.fetchall()
+        c.execute(f'DELETE FROM {ATTACHMENT_ARCHIVE_TABLE} WHERE app_number IN ({placeholders})', app_numbers)
+        c.execute(f'DELETE FROM {ARCHIVE_TABLE} WHERE app_number IN ({placeholders})', app_numbers)
+        c.executemany(f"INSERT INTO applications ({columns}) VALUES ({', '.join('?' * len(APPLICATION_COLUMNS))})",
+                      applications)
+        c.executemany(f"INSERT INTO attachments ({attachment_columns}) "
+                      f"VALUES ({', '.join('?' * len(ATTACHMENT_COLUMNS))})", attachments)
+        c.execute('COMMIT')
+    except Exception:
+        c.execute('ROLLBACK')
+        raise
+    restored = {row[APPLICATION_COLUMNS.index('app_number')] for row in applications}
+    return [app_number for app_number in app_numbers if app_number in restored]
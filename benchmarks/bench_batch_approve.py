@@ -0,0 +1,83 @@
+# 批量审批性能基准：对比原逐条 SELECT COUNT(*) + UPDATE 循环与集合方式批量更新
+# 用法: python -m benchmarks.bench_batch_approve [--rows 50000] [--batch 100 1000 5000]
+# 每次测量前复制同一份数据库，两种实现处理相同的申请编号（含 5% 不存在的编号）
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone, timedelta
+
+import approvals
+import db
+from benchmarks.bench_export import create_database
+
+
+def _now():
+    return datetime.now(timezone(timedelta(hours=8))).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# 原实现：逐条检查存在后更新，每条重新取时间
+def run_legacy(conn, app_numbers, status, comment):
+    updated_count = 0
+    c = conn.cursor()
+    for app_number in app_numbers:
+        c.execute('SELECT COUNT(*) FROM applications WHERE app_number = ?', (app_number,))
+        if c.fetchone()[0] == 0:
+            continue
+        c.execute('''UPDATE applications
+                   SET status = ?, approval_comment = ?, updated_at = ?
+                   WHERE app_number = ?''',
+                  (status, comment, _now(), app_number))
+        updated_count += 1
+    conn.commit()
+    return updated_count
+
+
+def run_bulk(conn, app_numbers, status, comment):
+    results = approvals.bulk_update_status(conn, app_numbers, status, comment, _now(),
+                                           enforce_transitions=False)
+    return sum(1 for _, result, _ in results if result == approvals.RESULT_UPDATED)
+
+
+def measure(func, template, workdir, app_numbers):
+    path = os.path.join(workdir, f'{func.__name__}.db')
+    shutil.copyfile(template, path)
+    conn = db.connect(path)
+    try:
+        started = time.perf_counter()
+        updated = func(conn, app_numbers, '报销中', '批量审批基准')
+        return time.perf_counter() - started, updated
+    finally:
+        conn.close()
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量审批性能基准')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--batch', type=int, nargs='+', default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'template.db')
+        create_database(template, args.rows)
+        print(f'行数: {args.rows}')
+        print(f"{'批量':>8}{'逐条(s)':>12}{'集合(s)':>12}{'加速比':>10}{'更新数':>10}")
+        for batch in args.batch:
+            existing = rng.sample(range(args.rows), min(batch, args.rows))
+            app_numbers = [f'FB2025{i:010d}' for i in existing]
+            # 混入约 5% 不存在的编号
+            for i in range(0, len(app_numbers), 20):
+                app_numbers[i] = f'FB2099{i:010d}'
+            legacy_seconds, legacy_updated = measure(run_legacy, template, tmp, app_numbers)
+            bulk_seconds, bulk_updated = measure(run_bulk, template, tmp, app_numbers)
+            assert legacy_updated == bulk_updated
+            print(f'{batch:>8}{legacy_seconds:>12.3f}{bulk_seconds:>12.3f}'
+                  f'{legacy_seconds / bulk_seconds:>10.1f}{bulk_updated:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# 附件打包性能基准：不同附件数量下流式生成 ZIP 的耗时、首字节时间、吞吐和峰值内存
+# 用法: python -m benchmarks.bench_bundle [--rows 2000] [--files 200] [--steps 4]
+# 先用 seed 生成 --rows 条申请（每条 2 个附件，从 --files 个 20-200KB 的 PDF/PNG 中选取），
+# 再分别打包前 rows/steps、2*rows/steps ... 条申请的附件。每次在独立子进程中运行，
+# 峰值内存取子进程 ru_maxrss 及其相对开始打包前的增量，应不随附件数量增长
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import seed
+
+QUERY = ('SELECT a.*, t.id, t.original_filename, t.file_path FROM '
+         '(SELECT {fields} FROM applications ORDER BY app_number LIMIT ?) AS a '
+         'JOIN attachments AS t ON t.app_number = a.app_number ORDER BY app_number, id')
+
+
+def _rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_bundle(workdir, limit):
+    os.chdir(workdir)
+    sys.path.insert(0, seed.PROJECT_ROOT)
+    import bundles
+    import db
+    # 不启用 mmap：映射的数据库文件页会计入 RSS，干扰对堆内存的测量
+    pragmas = tuple((name, value) for name, value in db.SQLITE_PRAGMAS if name != 'mmap_size')
+    pool = db.ConnectionPool(os.path.join(workdir, 'reimbursement.db'), size=1, pragmas=pragmas)
+    query = QUERY.format(fields=', '.join(bundles.APPLICATION_FIELDS))
+    base_rss = _rss_mb()
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    for chunk in bundles.generate_bundle(pool, query, [limit]):
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    return {'seconds': time.perf_counter() - started, 'first_byte_seconds': first_byte, 'bytes': size,
+            'peak_rss_mb': _rss_mb(), 'peak_rss_delta_mb': _rss_mb() - base_rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='附件打包性能基准')
+    parser.add_argument('--rows', type=int, default=2000, help='申请数（每条 2 个附件）')
+    parser.add_argument('--files', type=int, default=200, help='附件文件池大小')
+    parser.add_argument('--steps', type=int, default=4, help='分几档打包的申请数')
+    parser.add_argument('--limit', type=int, help='仅在子进程内部使用')
+    parser.add_argument('--workdir', help='仅在子进程内部使用')
+    args = parser.parse_args()
+
+    if args.limit is not None:
+        print(json.dumps(run_bundle(args.workdir, args.limit)))
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bench-bundle-')
+    try:
+        # seed 会切换工作目录，子进程需要从项目根目录启动
+        cwd = os.getcwd()
+        seed.seed(workdir, args.rows, files=args.files, attachments=2)
+        os.chdir(cwd)
+        print(f"{'申请数':>8}{'附件数':>8}{'耗时(s)':>10}{'首字节(s)':>12}{'输出(MB)':>10}{'MB/s':>8}"
+              f"{'峰值内存(MB)':>14}{'增量(MB)':>10}")
+        for step in range(1, args.steps + 1):
+            limit = args.rows * step // args.steps
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_bundle', '--limit', str(limit), '--workdir', workdir],
+                check=True, capture_output=True, text=True, cwd=seed.PROJECT_ROOT).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            megabytes = result['bytes'] / 1024 / 1024
+            print(f"{limit:>8}{limit * 2:>8}{result['seconds']:>10.2f}{result['first_byte_seconds']:>12.3f}"
+                  f"{megabytes:>10.1f}{megabytes / result['seconds']:>8.0f}{result['peak_rss_mb']:>14.1f}"
+                  f"{result['peak_rss_delta_mb']:>10.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# 导出性能基准：对比原 pandas 一次性导出与流式导出（xlsx / csv）的耗时、首字节时间和峰值内存
+# 用法: python -m benchmarks.bench_export [--rows 50000]
+# 每种实现在独立子进程中运行，峰值内存取子进程 ru_maxrss 相对导入完成后的增量
+import argparse
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import seed
+
+VARIANTS = ('legacy', 'stream_xlsx', 'stream_csv')
+
+QUERY = 'SELECT * FROM applications WHERE 1=1 ORDER BY created_at DESC, id DESC'
+
+
+def _rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def create_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE applications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, app_number TEXT UNIQUE NOT NULL, purchaser TEXT NOT NULL,
+        purchase_details TEXT, item_name TEXT NOT NULL, product_link TEXT, usage_type TEXT NOT NULL,
+        item_type TEXT NOT NULL, quantity INTEGER NOT NULL, purchase_time DATE NOT NULL,
+        invoice_number TEXT NOT NULL, invoice_amount REAL NOT NULL, invoice_date DATE NOT NULL,
+        status TEXT DEFAULT '待审批', approval_comment TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.executemany(seed.INSERT_APPLICATION, seed.generate_applications(rows, random.Random(42)))
+    # 与迁移中的索引一致，导出按创建时间排序时不需要额外排序
+    conn.execute('CREATE INDEX idx_applications_created_at ON applications (created_at)')
+    conn.commit()
+    conn.close()
+
+
+# 原实现：pandas 读入 DataFrame 后写入内存中的 BytesIO
+def run_legacy(db_path):
+    from io import BytesIO
+    import pandas as pd
+    import exporter
+    base_rss = _rss_mb()
+    started = time.perf_counter()
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(QUERY, conn, params=[])
+    df.columns = exporter.EXPORT_HEADERS
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='报销申请', index=False)
+    size = len(output.getvalue())
+    elapsed = time.perf_counter() - started
+    # 原实现在全部生成后才开始发送
+    return {'seconds': elapsed, 'first_byte_seconds': elapsed, 'bytes': size,
+            'peak_rss_delta_mb': _rss_mb() - base_rss}
+
+
+def run_stream(db_path, fmt):
+    import db
+    import exporter
+    # 不启用 mmap：映射的数据库文件页会计入 RSS，干扰对堆内存的测量
+    pragmas = tuple((name, value) for name, value in db.SQLITE_PRAGMAS if name != 'mmap_size')
+    pool = db.ConnectionPool(db_path, size=1, pragmas=pragmas)
+    base_rss = _rss_mb()
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    for chunk in exporter.generate_export(pool, QUERY, [], fmt):
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    return {'seconds': time.perf_counter() - started, 'first_byte_seconds': first_byte, 'bytes': size,
+            'peak_rss_delta_mb': _rss_mb() - base_rss}
+
+
+def run_variant(variant, db_path):
+    if variant == 'legacy':
+        return run_legacy(db_path)
+    return run_stream(db_path, variant.split('_', 1)[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出性能基准')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--variant', choices=VARIANTS, help='仅在子进程内部使用')
+    parser.add_argument('--db')
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.db)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        create_database(db_path, args.rows)
+        print(f'行数: {args.rows}')
+        print(f"{'实现':<12}{'耗时(s)':>10}{'首字节(s)':>12}{'输出(MB)':>10}{'峰值内存增量(MB)':>18}")
+        for variant in VARIANTS:
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_export', '--variant', variant, '--db', db_path],
+                check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{variant:<12}{result['seconds']:>10.2f}{result['first_byte_seconds']:>12.2f}"
+                  f"{result['bytes'] / 1024 / 1024:>10.1f}{result['peak_rss_delta_mb']:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
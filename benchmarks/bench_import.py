@@ -0,0 +1,131 @@
+# 批量导入性能基准：对比逐条提交（每条先查重再插入并提交，与 submit_application 相同）与批量导入
+# 用法: python -m benchmarks.bench_import [--rows 100000] [--existing 10000] [--legacy-rows 2000] [--formats csv xlsx]
+# 先建立含 --existing 条申请的数据库（迁移、触发器、全文索引与线上一致），再生成与导出相同列布局的 CSV / Excel 文件，
+# 其中 1% 的行使用已存在的发票号码（应报告为出错的行）。逐条提交只测前 --legacy-rows 行，按速率折算全部行数的耗时
+import argparse
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks import seed
+
+DUPLICATE_RATIO = 0.01
+
+
+# 生成导入文件的数据行（导出列布局，ID 和申请编号留空由导入时生成）
+def import_rows(rows, existing, rng):
+    for i, row in enumerate(seed.generate_applications(rows, rng, start=existing)):
+        row = list(row)
+        row[0] = ''
+        if existing and rng.random() < DUPLICATE_RATIO:
+            row[9] = seed.invoice_number(rng.randrange(existing))
+        yield [''] + row
+
+
+def write_files(workdir, rows, existing):
+    import exporter
+    paths = {}
+    paths['csv'] = os.path.join(workdir, 'import.csv')
+    with open(paths['csv'], 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(exporter.EXPORT_HEADERS)
+        writer.writerows(import_rows(rows, existing, random.Random(7)))
+    paths['xlsx'] = os.path.join(workdir, 'import.xlsx')
+    exporter.write_xlsx(import_rows(rows, existing, random.Random(7)), paths['xlsx'])
+    return paths
+
+
+# 原方式：逐条检查发票号码、插入并提交
+def run_legacy(db_path, csv_path, limit, new_app_number, now):
+    import db
+    import importer
+    import invoices
+    conn = db.connect(db_path)
+    imported = 0
+    try:
+        with open(csv_path, 'rb') as f:
+            rows = importer.read_rows(f, 'csv')
+            next(rows)
+            started = time.perf_counter()
+            for count, (_, cells) in enumerate(rows):
+                if count >= limit:
+                    break
+                record = dict(zip(importer.HEADER_COLUMNS, (cell.strip() for cell in cells)))
+                params = importer.validate_row(record, new_app_number, now)
+                c = conn.cursor()
+                if invoices.query_existing(c, [params[importer.INSERT_COLUMNS.index('invoice_number')]]):
+                    continue
+                c.execute(importer.INSERT_APPLICATION, params)
+                conn.commit()
+                imported += 1
+            elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+    return elapsed, min(limit, count + 1), imported
+
+
+def run_bulk(db_path, path, fmt, new_app_number, now):
+    import db
+    import importer
+    conn = db.connect(db_path)
+    try:
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            result = importer.import_rows(conn, importer.read_rows(f, fmt), new_app_number, now)
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量导入性能基准')
+    parser.add_argument('--rows', type=int, default=100000, help='导入文件的数据行数')
+    parser.add_argument('--existing', type=int, default=10000, help='数据库中已有的申请数')
+    parser.add_argument('--legacy-rows', type=int, default=2000, help='逐条提交方式实际测量的行数')
+    parser.add_argument('--formats', nargs='+', default=['csv', 'xlsx'], choices=['csv', 'xlsx'])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-import-')
+    try:
+        seed.seed(os.path.join(workdir, 'template'), args.existing, files=0, attachments=0)
+        template = os.path.join(workdir, 'template', 'reimbursement.db')
+        from app import generate_app_number, get_beijing_time
+        now = get_beijing_time()
+
+        started = time.perf_counter()
+        paths = write_files(workdir, args.rows, args.existing)
+        print(f"生成导入文件用时 {time.perf_counter() - started:.1f}s: "
+              + '，'.join(f'{fmt} {os.path.getsize(path) / 1024 / 1024:.1f}MB' for fmt, path in paths.items()),
+              file=sys.stderr)
+
+        db_path = os.path.join(workdir, 'run.db')
+        shutil.copyfile(template, db_path)
+        legacy_seconds, legacy_rows, _ = run_legacy(db_path, paths['csv'], args.legacy_rows,
+                                                    generate_app_number, now)
+        os.remove(db_path)
+        results = []
+        for fmt in args.formats:
+            shutil.copyfile(template, db_path)
+            seconds, result = run_bulk(db_path, paths[fmt], fmt, generate_app_number, now)
+            os.remove(db_path)
+            results.append((fmt, seconds, result))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    legacy_rate = legacy_rows / legacy_seconds
+    print(f'导入 {args.rows} 行（已有申请 {args.existing} 条，约 {DUPLICATE_RATIO:.0%} 的行发票号码重复）')
+    print(f"{'方式':<16}{'耗时(s)':>10}{'行/秒':>12}{'导入':>10}{'出错':>8}")
+    print(f"{'逐条提交(折算)':<16}{args.rows / legacy_rate:>10.1f}{legacy_rate:>12.0f}{'':>10}{'':>8}"
+          f"  （实测 {legacy_rows} 行 {legacy_seconds:.2f}s）")
+    for fmt, seconds, result in results:
+        print(f"{'批量导入 ' + fmt:<16}{seconds:>10.2f}{result['total'] / seconds:>12.0f}"
+              f"{result['imported']:>10}{len(result['errors']):>8}")
+
+
+if __name__ == '__main__':
+    main()
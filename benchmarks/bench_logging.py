@@ -0,0 +1,67 @@
+# 操作日志开销基准：同一组请求在关闭日志、同步写日志、队列异步写日志三种配置下的吞吐量
+# 用法: python -m benchmarks.bench_logging [--requests 5000] [--threads 4]
+# 在临时目录中建库运行（日志写入临时目录的 logs/app.log），控制台日志输出被丢弃
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ('off', 'sync', 'queued')
+
+
+def run_requests(app, paths, total, threads):
+    per_thread = total // threads
+
+    def worker():
+        client = app.test_client()
+        for i in range(per_thread):
+            client.get(paths[i % len(paths)]).close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='操作日志开销基准')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    sys.path.insert(0, PROJECT_ROOT)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.environ['DATABASE_PATH'] = os.path.join(tmp, 'bench.db')
+        # 控制台日志写到空设备，只测量文件日志的开销
+        sys.stderr = open(os.devnull, 'w')
+        import oplog
+        from app import app, init_db
+        init_db()
+        app.config['LOG_SAMPLE_RATES'] = {}
+        paths = [f'/check_invoice/2500000000000{i:07d}' for i in range(100)]
+
+        results = {}
+        for mode in MODES:
+            oplog.setup(app.logger, os.path.join(tmp, 'logs', 'app.log'), queued=(mode == 'queued'))
+            app.logger.disabled = (mode == 'off')
+            run_requests(app, paths, 200, 1)
+            results[mode] = run_requests(app, paths, args.requests, args.threads)
+            oplog.shutdown(app.logger)
+        sys.stderr = sys.__stderr__
+
+        print(f'请求数: {args.requests}，线程数: {args.threads}，路由: /check_invoice/<发票号码>')
+        print(f"{'日志配置':<10}{'吞吐量(req/s)':>16}{'相对关闭日志':>14}")
+        for mode in MODES:
+            print(f"{mode:<10}{results[mode]:>16.0f}{results[mode] / results['off']:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
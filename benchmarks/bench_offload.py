@@ -0,0 +1,114 @@
+# 阻塞操作卸载基准：单个 gevent worker 在导出进行中时发票查重请求的延迟
+# 用法: python -m benchmarks.bench_offload [--rows 20000] [--clients 8] [--duration 10] [--exporters 1]
+# 分别以 IO_OFFLOAD=0 和 IO_OFFLOAD=1 启动 gunicorn（1 个 gevent worker），先测空闲时 /check_invoice 的延迟，
+# 再在若干客户端循环导出 Excel 的同时测一次；未卸载时导出期间整个 worker 停顿，查重延迟随导出时长上升
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+from benchmarks import seed
+from benchmarks.workload import (PROJECT_ROOT, HttpClient, percentile, prepare_data, prepare_workdir,
+                                 start_gunicorn)
+
+
+def logged_in_client(base_url):
+    client = HttpClient(base_url)
+    client.request('POST', '/admin/auth', data={'username': 'admin', 'password': 'admin123'})
+    return client
+
+
+def measure_checks(base_url, rows, clients, duration):
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(thread):
+        rng = random.Random(thread)
+        client = HttpClient(base_url)
+        local = []
+        while time.perf_counter() < deadline:
+            number = seed.invoice_number(rng.randrange(rows)) if rng.random() < 0.5 else f'8{rng.randrange(10 ** 19):019d}'
+            started = time.perf_counter()
+            client.request('GET', f'/check_invoice/{number}')
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return {'requests': len(latencies), 'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000, 'max_ms': latencies[-1] * 1000}
+
+
+def run_mode(data_dir, workdir, offload, args):
+    os.environ['IO_OFFLOAD'] = '1' if offload else '0'
+    prepare_workdir(data_dir, workdir)
+    process, base_url = start_gunicorn(workdir, 1, 'gevent')
+    try:
+        measure_checks(base_url, args.rows, 2, 1)
+        idle = measure_checks(base_url, args.rows, args.clients, args.duration)
+
+        stop = threading.Event()
+        export_times = []
+
+        def exporter():
+            client = logged_in_client(base_url)
+            while not stop.is_set():
+                started = time.perf_counter()
+                client.request('GET', '/admin/export?format=xlsx')
+                export_times.append(time.perf_counter() - started)
+
+        exporters = [threading.Thread(target=exporter) for _ in range(args.exporters)]
+        for t in exporters:
+            t.start()
+        # 等导出开始执行后再计时
+        time.sleep(0.5)
+        busy = measure_checks(base_url, args.rows, args.clients, args.duration)
+        stop.set()
+        for t in exporters:
+            t.join()
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    export_avg = sum(export_times) / len(export_times) if export_times else 0.0
+    return idle, busy, export_avg, len(export_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='阻塞操作卸载基准')
+    parser.add_argument('--rows', type=int, default=20000, help='合成申请数')
+    parser.add_argument('--files', type=int, default=200, help='附件文件池大小')
+    parser.add_argument('--clients', type=int, default=8, help='并发查重客户端数')
+    parser.add_argument('--duration', type=float, default=10, help='每轮测量秒数')
+    parser.add_argument('--exporters', type=int, default=1, help='循环导出的客户端数')
+    parser.add_argument('--data-dir', help='合成数据缓存目录（默认 .bench/seed-<rows>）')
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir or os.path.join(PROJECT_ROOT, '.bench', f'seed-{args.rows}'))
+    prepare_data(data_dir, args.rows, args.files)
+    workdir = os.path.join(os.path.dirname(data_dir), 'run-offload')
+
+    results = {}
+    for offload in (False, True):
+        results[offload] = run_mode(data_dir, workdir, offload, args)
+        print(f"IO_OFFLOAD={int(offload)} 完成", file=sys.stderr)
+
+    print(f'申请数: {args.rows}，查重客户端: {args.clients}，导出客户端: {args.exporters}，'
+          f'每轮 {args.duration:g} 秒，gunicorn 1 个 gevent worker')
+    print(f"{'IO_OFFLOAD':<12}{'阶段':<8}{'请求数':>8}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'导出平均(s)':>14}")
+    for offload, (idle, busy, export_avg, exports) in results.items():
+        for phase, r in (('空闲', idle), ('导出中', busy)):
+            export_col = f'{export_avg:.2f} ({exports}次)' if r is busy else ''
+            print(f"{int(offload):<12}{phase:<8}{r['requests']:>8}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+                  f"{r['max_ms']:>10.1f}{export_col:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+# 启动性能基准：导入 app 的耗时和内存、gunicorn 启动到第一个请求成功的时间、每个 worker 的内存
+# 用法:
+#   python -m benchmarks.bench_startup [--workers 4] [--repeat 5]
+#   python -m benchmarks.bench_startup --save-baseline startup      # 保存到 benchmarks/baselines/
+#   python -m benchmarks.bench_startup --compare startup --fail-on-regression
+# import: 在独立子进程中导入 app，取 --repeat 次的中位数；import_eager 先导入 openpyxl 等按需导入的模块，
+#   对应每个请求都用到它们（或改动前在导入时加载）的情况。
+# gunicorn_preload / gunicorn_no_preload: 用项目的 gunicorn.conf.py 启动 --workers 个 gevent worker，
+#   记录到 /admin/login 第一次返回 200 的时间；再发送一批请求（含 Excel 导出，使 worker 加载 openpyxl）后，
+#   读取各 worker 的 /proc/<pid>/smaps_rollup: RSS 包括与 master 共享的页，PSS 按共享进程数分摊，
+#   USS 为 worker 独占的内存。preload 时 worker 共享 master 已导入的模块，PSS / USS 明显低于不 preload
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+from benchmarks import seed
+from benchmarks.workload import (REGRESSION_THRESHOLD, _children, _free_port, baseline_path,
+                                 save_baseline)
+
+PROJECT_ROOT = seed.PROJECT_ROOT
+
+IMPORT_VARIANTS = ('import', 'import_eager')
+GUNICORN_VARIANTS = ('gunicorn_preload', 'gunicorn_no_preload')
+
+# 在子进程中执行，输出一行 JSON。
+# 峰值内存取 /proc/self/status 的 VmHWM: ru_maxrss 在 fork + exec 后保留父进程的峰值，
+# 由较大的进程（如 pytest）启动时读数偏高
+IMPORT_SCRIPT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+if {eager}:
+    import app
+    for name in app.PRELOAD_MODULES:
+        __import__(name)
+else:
+    import app
+seconds = time.perf_counter() - started
+try:
+    with open('/proc/self/status') as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'import_seconds': seconds,
+                  'rss_mb': rss_kb / 1024,
+                  'modules': len(sys.modules),
+                  'heavy_loaded': sorted(m for m in ('openpyxl', 'numpy', 'sqlalchemy', 'pandas') if m in sys.modules)}}))
+'''
+
+# 预热请求: 每个路径按 worker 数的倍数发送，尽量让每个 worker 都处理到
+WARMUP_PATHS = ('/admin/dashboard', '/admin/export', '/admin/export?format=csv', '/check_invoice/25000000000000000001')
+WARMUP_ROUNDS = 4
+
+# 各指标都是越小越好
+METRICS = ('import_seconds', 'rss_mb', 'first_request_seconds', 'worker_rss_mb', 'worker_pss_mb', 'worker_uss_mb')
+
+
+def measure_import(workdir, eager, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(eager=eager)], cwd=workdir,
+                             env=dict(os.environ, PYTHONPATH=PROJECT_ROOT,
+                                      DATABASE_PATH=os.path.join(workdir, 'reimbursement.db')),
+                             check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {
+        'import_seconds': round(statistics.median(r['import_seconds'] for r in runs), 4),
+        'rss_mb': round(statistics.median(r['rss_mb'] for r in runs), 1),
+        'modules': runs[-1]['modules'],
+        'heavy_loaded': runs[-1]['heavy_loaded'],
+    }
+
+
+# smaps_rollup 中的 Rss / Pss / Private_* （KB）
+def _smaps_kb(pid):
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    values[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        pass
+    return {'rss': values.get('Rss', 0), 'pss': values.get('Pss', 0),
+            'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)}
+
+
+def _get(opener, url):
+    with opener.open(url, timeout=60) as response:
+        response.read()
+        return response.status
+
+
+def measure_gunicorn(workdir, workers, preload):
+    port = _free_port()
+    env = dict(os.environ, DATABASE_PATH=os.path.join(workdir, 'reimbursement.db'),
+               GUNICORN_WORKERS=str(workers), GUNICORN_PRELOAD='1' if preload else '0',
+               GUNICORN_WORKER_CLASS='gevent')
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'ab')
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(PROJECT_ROOT, 'gunicorn.conf.py'),
+         '-b', f'127.0.0.1:{port}', '--chdir', workdir, '--pythonpath', PROJECT_ROOT],
+        env=env, stdout=log, stderr=log)
+    try:
+        first_request = None
+        deadline = time.time() + 60
+        while first_request is None:
+            if process.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"gunicorn 启动失败，见 {os.path.join(workdir, 'gunicorn.log')}")
+            try:
+                urllib.request.urlopen(base_url + '/admin/login', timeout=1).close()
+                first_request = time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        # 所有 worker 都启动后再预热
+        while len(_children(process.pid)) < workers and time.time() < deadline:
+            time.sleep(0.05)
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor())
+        opener.open(base_url + '/admin/auth',
+                    data=b'username=admin&password=admin123', timeout=10).close()
+        for _ in range(WARMUP_ROUNDS * workers):
+            for path in WARMUP_PATHS:
+                _get(opener, base_url + path)
+        samples = [_smaps_kb(pid) for pid in _children(process.pid)]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        log.close()
+    return {
+        'first_request_seconds': round(first_request, 3),
+        'workers': len(samples),
+        'worker_rss_mb': round(statistics.mean(s['rss'] for s in samples) / 1024, 1),
+        'worker_pss_mb': round(statistics.mean(s['pss'] for s in samples) / 1024, 1),
+        'worker_uss_mb': round(statistics.mean(s['uss'] for s in samples) / 1024, 1),
+    }
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        subprocess.run([sys.executable, '-c', 'from app import create_app, init_db; create_app(); init_db()'],
+                       cwd=workdir, env=dict(os.environ, PYTHONPATH=PROJECT_ROOT,
+                                             DATABASE_PATH=os.path.join(workdir, 'reimbursement.db')),
+                       check=True, capture_output=True)
+        results = {}
+        for variant in IMPORT_VARIANTS:
+            results[variant] = measure_import(workdir, variant == 'import_eager', args.repeat)
+            print(f'{variant:<22} 完成', file=sys.stderr)
+        for variant in GUNICORN_VARIANTS:
+            results[variant] = measure_gunicorn(workdir, args.workers, variant == 'gunicorn_preload')
+            print(f'{variant:<22} 完成', file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'meta': {'workers': args.workers, 'repeat': args.repeat, 'python': platform.python_version(),
+                 'platform': platform.platform(), 'date': datetime.now().isoformat(timespec='seconds')},
+        'scenarios': results,
+    }
+
+
+def print_results(report):
+    scenarios = report['scenarios']
+    print(f"{'导入':<16}{'耗时(s)':>10}{'内存(MB)':>10}{'模块数':>8}  按需模块")
+    for name in IMPORT_VARIANTS:
+        r = scenarios[name]
+        print(f"{name:<16}{r['import_seconds']:>10.3f}{r['rss_mb']:>10.1f}{r['modules']:>8}  "
+              f"{', '.join(r['heavy_loaded']) or '-'}")
+    print(f"\n{'gunicorn':<22}{'首个请求(s)':>12}{'worker':>8}{'RSS(MB)':>10}{'PSS(MB)':>10}{'USS(MB)':>10}")
+    for name in GUNICORN_VARIANTS:
+        r = scenarios[name]
+        print(f"{name:<22}{r['first_request_seconds']:>12.2f}{r['workers']:>8}{r['worker_rss_mb']:>10.1f}"
+              f"{r['worker_pss_mb']:>10.1f}{r['worker_uss_mb']:>10.1f}")
+
+
+# 与基线对比，返回退化项列表；各指标上升超过阈值视为退化
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    print(f"{'场景':<22}{'指标':<24}{'基线':>10}{'本次':>10}{'变化':>10}")
+    for name, current in report['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric in METRICS:
+            if metric not in current or metric not in previous:
+                continue
+            before, after = previous[metric], current[metric]
+            change = (after - before) / before if before else 0.0
+            flag = ' !' if change > threshold else ''
+            if flag:
+                regressions.append((name, metric, before, after))
+            print(f'{name:<22}{metric:<24}{before:>10.3f}{after:>10.3f}{change:>+9.0%}{flag}')
+        # 导入 app 时不应加载按需导入的模块
+        if name == 'import' and current['heavy_loaded'] and not previous['heavy_loaded']:
+            regressions.append((name, 'heavy_loaded', previous['heavy_loaded'], current['heavy_loaded']))
+            print(f"{name:<22}{'heavy_loaded':<24}{'-':>10}{','.join(current['heavy_loaded']):>10} !")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动性能基准')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5, help='导入测量的重复次数（取中位数）')
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    if args.compare and not os.path.exists(baseline_path(args.compare)):
+        parser.error(f'基线不存在: {baseline_path(args.compare)}')
+
+    report = run(args)
+    print_results(report)
+    if args.save_baseline:
+        save_baseline(report, args.save_baseline)
+        print(f'基线已保存: {baseline_path(args.save_baseline)}')
+    if args.compare:
+        with open(baseline_path(args.compare), encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} 项指标退化超过 {args.threshold:.0%}')
+            if args.fail_on_regression:
+                raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# 合成数据生成：在指定目录中建立与线上结构相同的数据库（含迁移、触发器、全文索引）并写入申请和附件
+# 用法: python -m benchmarks.seed --workdir /tmp/bench --rows 100000 [--files 500] [--attachments 2]
+# 生成结果: <workdir>/reimbursement.db 和 <workdir>/uploads/（按内容哈希分级存放）
+# 附件内容从 --files 个随机文件中选取（多条申请引用同一文件），避免生成上百万个文件
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PURCHASERS = ['张伟', '王芳', '李娜', '刘洋', '陈静', '杨帆', '赵磊', '黄敏', '周杰', '吴婷',
+              '徐强', '孙丽', '马超', '朱琳', '胡斌', '郭敏', '何涛', '高洁', '林峰', '罗佳']
+ITEMS = ['移液枪', '离心管', '培养皿', '手套', '试剂盒', '键盘鼠标', '移动硬盘', '显示器', 'USB3 扩展坞',
+         '打印纸', '硒鼓', '实验服', '护目镜', '温度计', '烧杯', '滤纸', '电池', '数据线', '软件授权', '测序服务']
+DETAILS = ['用于课题组日常实验', '替换损坏的设备', '项目采购，规格见链接', '会议材料打印', '实验耗材补充',
+           '数据备份使用', '新生入组配置', '样品测序，按样本计费']
+USAGE_TYPES = ['个人使用', '课题组公用']
+ITEM_TYPES = ['实物产品', '服务']
+STATUSES = [('已报销', 60), ('报销中', 15), ('待审批', 20), ('驳回', 5)]
+
+COLUMNS = ('app_number', 'purchaser', 'purchase_details', 'item_name', 'product_link', 'usage_type',
+           'item_type', 'quantity', 'purchase_time', 'invoice_number', 'invoice_amount', 'invoice_date',
+           'status', 'approval_comment', 'created_at', 'updated_at')
+
+INSERT_APPLICATION = (f"INSERT INTO applications ({', '.join(COLUMNS)}) "
+                      f"VALUES ({', '.join('?' * len(COLUMNS))})")
+
+
+def app_number(i):
+    return f'FB2025{i:010d}'
+
+
+def invoice_number(i):
+    return f'{25000000000000000000 + i}'
+
+
+# 生成申请记录（列顺序与 COLUMNS 一致），编号和发票号码由序号决定，便于工作负载直接构造
+def generate_applications(count, rng, start=0):
+    statuses = [status for status, weight in STATUSES for _ in range(weight)]
+    for i in range(start, start + count):
+        day = rng.randint(0, 729)
+        created = time.gmtime(1704067200 + day * 86400 + rng.randint(8, 20) * 3600)
+        purchase_date = time.strftime('%Y-%m-%d', time.gmtime(1704067200 + max(day - rng.randint(0, 14), 0) * 86400))
+        status = rng.choice(statuses)
+        item = rng.choice(ITEMS)
+        yield (app_number(i), rng.choice(PURCHASERS),
+               f"{rng.choice(DETAILS)}，{item}{rng.randint(1, 50)}个，" + '规格参数 ' * rng.randint(1, 20),
+               f'{item}{i % 97}', f'https://item.jd.com/{100000 + i}.html', rng.choice(USAGE_TYPES),
+               rng.choice(ITEM_TYPES), rng.randint(1, 5), purchase_date, invoice_number(i),
+               round(min(rng.lognormvariate(5, 1.2), 50000), 2), purchase_date, status,
+               '同意' if status in ('已报销', '报销中') else '',
+               time.strftime('%Y-%m-%d %H:%M:%S', created), time.strftime('%Y-%m-%d %H:%M:%S', created))
+
+
+# 生成附件文件池，返回 [(扩展名, 内容哈希, 文件路径)]
+def create_files(upload_folder, count, rng):
+    import storage
+    files = []
+    for n in range(count):
+        ext = '.pdf' if n % 2 == 0 else '.png'
+        content = rng.randbytes(rng.randint(20 * 1024, 200 * 1024))
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = storage.blob_path(upload_folder, content_hash, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        files.append((ext, content_hash, path))
+    return files
+
+
+def seed(workdir, rows, files=500, attachments=2, batch_size=10000, random_seed=42):
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'reimbursement.db')
+    sys.path.insert(0, PROJECT_ROOT)
+    import db
+    from app import app, init_db
+    init_db()
+
+    rng = random.Random(random_seed)
+    pool = create_files(app.config['UPLOAD_FOLDER'], files, rng) if attachments else []
+    conn = db.connect(os.environ['DATABASE_PATH'])
+    started = time.perf_counter()
+    try:
+        for start in range(0, rows, batch_size):
+            batch = list(generate_applications(min(batch_size, rows - start), rng, start))
+            attachment_rows = []
+            for row in batch:
+                for _ in range(attachments):
+                    ext, content_hash, path = rng.choice(pool)
+                    attachment_rows.append((row[0], f'发票{ext}', f'{row[9]}_{content_hash[:12]}{ext}', path,
+                                            content_hash))
+            with conn:
+                conn.executemany(INSERT_APPLICATION, batch)
+                conn.executemany('''INSERT INTO attachments
+                                    (app_number, original_filename, stored_filename, file_path, content_hash)
+                                    VALUES (?, ?, ?, ?, ?)''', attachment_rows)
+            print(f'已写入 {start + len(batch)}/{rows} 条申请', file=sys.stderr)
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成数据')
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--files', type=int, default=500, help='附件文件池大小')
+    parser.add_argument('--attachments', type=int, default=2, help='每条申请的附件数')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    workdir = os.path.abspath(args.workdir)
+    if os.path.exists(os.path.join(workdir, 'reimbursement.db')):
+        parser.error(f'{workdir} 中已有数据库')
+    seconds = seed(workdir, args.rows, args.files, args.attachments, random_seed=args.seed)
+    print(f'生成 {args.rows} 条申请用时 {seconds:.1f}s: {workdir}')
+
+
+if __name__ == '__main__':
+    main()
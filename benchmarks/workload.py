@@ -0,0 +1,473 @@
+# 工作负载基准：在合成数据上按场景发送请求，统计吞吐量、p50/p99 延迟和峰值内存
+# 用法:
+#   python -m benchmarks.workload --rows 100000 --target inprocess --concurrency 4
+#   python -m benchmarks.workload --rows 100000 --target gunicorn --workers 2 --worker-class gevent
+#   python -m benchmarks.workload ... --save-baseline gunicorn-100k     # 保存到 benchmarks/baselines/
+#   python -m benchmarks.workload ... --compare gunicorn-100k           # 与已保存的基线对比
+# 合成数据生成一次后缓存在 --data-dir 中，每次运行复制一份再施加负载（提交、审批会修改数据）。
+# 峰值内存在 Linux 下读取 /proc/<pid>/status 的 VmRSS：inprocess 为当前进程，gunicorn 为主进程和所有 worker 之和
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+from benchmarks import seed
+
+PROJECT_ROOT = seed.PROJECT_ROOT
+BASELINE_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'baselines')
+
+SCENARIOS = ('submit', 'check_invoice', 'dashboard', 'export', 'batch_approve', 'download')
+DEFAULT_ITERATIONS = {'submit': 200, 'check_invoice': 2000, 'dashboard': 300, 'export': 4,
+                      'batch_approve': 20, 'download': 500}
+
+# 与基线对比时视为退化的变化比例
+REGRESSION_THRESHOLD = 0.2
+
+SORT_FIELDS = ['created_at', 'purchaser', 'item_name', 'invoice_amount', 'invoice_date', 'status']
+
+
+# ---------- 客户端 ----------
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, json_body=None, files=None):
+        if files:
+            data = dict(data or {})
+            for name, items in files.items():
+                data[name] = [(io.BytesIO(content), filename) for filename, content in items]
+            response = self.client.open(path, method=method, data=data, content_type='multipart/form-data')
+        else:
+            response = self.client.open(path, method=method, data=data, json=json_body)
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, size
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, items in files.items():
+        for filename, content in items:
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                         f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+            parts.append(content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+
+    def request(self, method, path, data=None, json_body=None, files=None):
+        headers = {}
+        body = None
+        if files:
+            body, headers['Content-Type'] = _encode_multipart(data or {}, files)
+        elif json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=300) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            size = len(e.read())
+            e.close()
+            return e.code, size
+
+
+# ---------- 场景 ----------
+
+def _submit(client, rng, ctx, i):
+    item = rng.choice(seed.ITEMS)
+    fields = {
+        'purchaser': rng.choice(seed.PURCHASERS), 'purchase_details': f'基准测试 {item}',
+        'item_name': item, 'product_link': 'https://item.jd.com/1.html',
+        'usage_type': rng.choice(seed.USAGE_TYPES), 'item_type': rng.choice(seed.ITEM_TYPES),
+        'quantity': '1', 'purchase_time': '2025-07-01', 'invoice_number': f"9{ctx['nonce']}{ctx['thread']:02d}{i:07d}",
+        'invoice_amount': f'{rng.uniform(10, 3000):.2f}', 'invoice_date': '2025-07-01',
+    }
+    files = {'attachments': [('发票.pdf', rng.randbytes(50 * 1024)), ('截图.png', rng.randbytes(30 * 1024))]}
+    return client.request('POST', '/submit', data=fields, files=files), 302
+
+
+def _check_invoice(client, rng, ctx, i):
+    if rng.random() < 0.5:
+        number = seed.invoice_number(rng.randrange(ctx['rows']))
+    else:
+        number = f'8{rng.randrange(10 ** 19):019d}'
+    return client.request('GET', f'/check_invoice/{number}'), 200
+
+
+def _dashboard(client, rng, ctx, i):
+    args = {'sort': rng.choice(SORT_FIELDS), 'order': rng.choice(['asc', 'desc']),
+            'per_page': rng.choice([20, 50])}
+    if rng.random() < 0.4:
+        args['status'] = rng.choice([status for status, _ in seed.STATUSES])
+    if rng.random() < 0.2:
+        args['search'] = rng.choice(seed.ITEMS)
+    if rng.random() < 0.3:
+        args['paging'] = 'cursor'
+    else:
+        args['page'] = rng.randint(1, 20)
+    return client.request('GET', '/admin/dashboard?' + urllib.parse.urlencode(args)), 200
+
+
+def _export(client, rng, ctx, i):
+    status = rng.choice(['待审批', '报销中'])
+    return client.request('GET', '/admin/export?' + urllib.parse.urlencode({'format': 'csv', 'status': status})), 200
+
+
+def _batch_approve(client, rng, ctx, i):
+    app_numbers = [seed.app_number(rng.randrange(ctx['rows'])) for _ in range(100)]
+    body = {'status': rng.choice(['报销中', '已报销']), 'comment': '基准测试', 'app_numbers': app_numbers}
+    return client.request('POST', '/admin/batch_approve', json_body=body), 200
+
+
+def _download(client, rng, ctx, i):
+    return client.request('GET', f"/download/{rng.choice(ctx['stored_filenames'])}"), 200
+
+
+SCENARIO_FUNCTIONS = {
+    'submit': _submit, 'check_invoice': _check_invoice, 'dashboard': _dashboard, 'export': _export,
+    'batch_approve': _batch_approve, 'download': _download,
+}
+
+
+# ---------- 内存采样 ----------
+
+def _rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, root_pid, include_children, interval=0.05):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.include_children = include_children
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            pids = [self.root_pid] + (_children(self.root_pid) if self.include_children else [])
+            self.peak_kb = max(self.peak_kb, sum(_rss_kb(pid) for pid in pids))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+# ---------- 执行 ----------
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(name, make_client, iterations, concurrency, ctx, sampler_args):
+    function = SCENARIO_FUNCTIONS[name]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = [iterations // concurrency + (1 if t < iterations % concurrency else 0) for t in range(concurrency)]
+    clients = [make_client() for _ in range(concurrency)]
+
+    def worker(thread, count):
+        rng = random.Random(f"{name}-{thread}-{ctx['seed']}")
+        thread_ctx = dict(ctx, thread=thread)
+        local = []
+        failed = 0
+        for i in range(count):
+            started = time.perf_counter()
+            try:
+                (status, _), expected = function(clients[thread], rng, thread_ctx, i)
+                failed += status != expected
+            except Exception:
+                failed += 1
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    sampler = RssSampler(*sampler_args)
+    sampler.start()
+    threads = [threading.Thread(target=worker, args=(t, count)) for t, count in enumerate(per_thread) if count]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'peak_rss_mb': round(sampler.peak_kb / 1024, 1),
+    }
+
+
+def prepare_data(data_dir, rows, files):
+    marker = os.path.join(data_dir, 'seed.json')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == {'rows': rows, 'files': files}:
+                return
+        shutil.rmtree(data_dir)
+    subprocess.run([sys.executable, '-m', 'benchmarks.seed', '--workdir', data_dir, '--rows', str(rows),
+                    '--files', str(files)], check=True, cwd=PROJECT_ROOT)
+    with open(marker, 'w') as f:
+        json.dump({'rows': rows, 'files': files}, f)
+
+
+def prepare_workdir(data_dir, workdir):
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    os.makedirs(workdir)
+    shutil.copyfile(os.path.join(data_dir, 'reimbursement.db'), os.path.join(workdir, 'reimbursement.db'))
+    shutil.copytree(os.path.join(data_dir, 'uploads'), os.path.join(workdir, 'uploads'))
+
+
+def sample_stored_filenames(db_path, limit=1000):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute(
+            'SELECT stored_filename FROM attachments ORDER BY id LIMIT ?', (limit,))]
+    finally:
+        conn.close()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workdir, workers, worker_class):
+    port = _free_port()
+    # 使用项目的 gunicorn.conf.py（preload、gevent 补丁与线上一致），worker 数和类型经环境变量传入
+    env = dict(os.environ, DATABASE_PATH=os.path.join(workdir, 'reimbursement.db'),
+               GUNICORN_WORKERS=str(workers), GUNICORN_WORKER_CLASS=worker_class)
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'wb')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(PROJECT_ROOT, 'gunicorn.conf.py'),
+         '-b', f'127.0.0.1:{port}', '--timeout', '300',
+         '--chdir', workdir, '--pythonpath', PROJECT_ROOT],
+        env=env, stdout=log, stderr=log)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn 启动失败，见 {os.path.join(workdir, 'gunicorn.log')}")
+        try:
+            urllib.request.urlopen(base_url + '/admin/login', timeout=1).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('等待 gunicorn 启动超时')
+
+
+def run(args):
+    data_dir = os.path.abspath(args.data_dir or os.path.join(PROJECT_ROOT, '.bench', f'seed-{args.rows}'))
+    prepare_data(data_dir, args.rows, args.files)
+    workdir = os.path.join(os.path.dirname(data_dir), f'run-{args.target}')
+    prepare_workdir(data_dir, workdir)
+
+    ctx = {'rows': args.rows, 'seed': args.seed, 'nonce': f'{int(time.time()) % 100000:05d}',
+           'stored_filenames': sample_stored_filenames(os.path.join(workdir, 'reimbursement.db'))}
+    process = None
+    if args.target == 'inprocess':
+        os.chdir(workdir)
+        os.environ['DATABASE_PATH'] = os.path.join(workdir, 'reimbursement.db')
+        sys.path.insert(0, PROJECT_ROOT)
+        # 控制台日志写到空设备（文件日志照常写入工作目录）
+        stderr, sys.stderr = sys.stderr, open(os.devnull, 'w')
+        try:
+            from app import create_app, init_db
+            app = create_app()
+            init_db()
+        finally:
+            sys.stderr = stderr
+
+        def make_client():
+            return InProcessClient(app)
+        sampler_args = (os.getpid(), False)
+    else:
+        process, base_url = start_gunicorn(workdir, args.workers, args.worker_class)
+
+        def make_client():
+            return HttpClient(base_url)
+        sampler_args = (process.pid, True)
+
+    def logged_in_client():
+        client = make_client()
+        client.request('POST', '/admin/auth', data={'username': 'admin', 'password': 'admin123'})
+        return client
+
+    results = {}
+    try:
+        for name in args.scenarios:
+            iterations = max(1, int(DEFAULT_ITERATIONS[name] * args.scale))
+            results[name] = run_scenario(name, logged_in_client, iterations, args.concurrency, ctx, sampler_args)
+            print(f"{name:<15} 完成 {results[name]['requests']} 次请求", file=sys.stderr)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+    return {
+        'meta': {'target': args.target, 'rows': args.rows, 'concurrency': args.concurrency,
+                 'workers': args.workers if args.target == 'gunicorn' else None,
+                 'worker_class': args.worker_class if args.target == 'gunicorn' else None,
+                 'scale': args.scale, 'python': platform.python_version(), 'platform': platform.platform(),
+                 'date': datetime.now().isoformat(timespec='seconds')},
+        'scenarios': results,
+    }
+
+
+# ---------- 输出与基线 ----------
+
+def print_results(report):
+    meta = report['meta']
+    print(f"目标: {meta['target']}  数据量: {meta['rows']}  并发: {meta['concurrency']}"
+          + (f"  workers: {meta['workers']} ({meta['worker_class']})" if meta['workers'] else ''))
+    print(f"{'场景':<15}{'请求数':>8}{'错误':>6}{'吞吐量(req/s)':>15}{'p50(ms)':>10}{'p99(ms)':>10}{'峰值内存(MB)':>14}")
+    for name, r in report['scenarios'].items():
+        print(f"{name:<15}{r['requests']:>8}{r['errors']:>6}{r['throughput']:>15.1f}{r['p50_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['peak_rss_mb']:>14.1f}")
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def save_baseline(report, name):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+# 与基线对比，返回退化项列表；吞吐量下降或延迟、内存上升超过阈值视为退化
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    print(f"{'场景':<15}{'指标':<14}{'基线':>12}{'本次':>12}{'变化':>10}")
+    for name, current in report['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        if current['errors'] > previous['errors']:
+            regressions.append((name, 'errors', previous['errors'], current['errors']))
+            print(f"{name:<15}{'errors':<14}{previous['errors']:>12}{current['errors']:>12}{'':>10} !")
+        for metric, higher_is_better in (('throughput', True), ('p50_ms', False), ('p99_ms', False),
+                                         ('peak_rss_mb', False)):
+            before, after = previous[metric], current[metric]
+            change = (after - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = ' !' if worse > threshold else ''
+            if flag:
+                regressions.append((name, metric, before, after))
+            print(f'{name:<15}{metric:<14}{before:>12.1f}{after:>12.1f}{change:>+9.0%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='工作负载基准')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--files', type=int, default=500, help='附件文件池大小')
+    parser.add_argument('--target', choices=('inprocess', 'gunicorn'), default='inprocess')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-class', default='gevent')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--scale', type=float, default=1.0, help='各场景请求数的倍数')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', help='合成数据缓存目录（默认 .bench/seed-<rows>）')
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    if args.compare and not os.path.exists(baseline_path(args.compare)):
+        parser.error(f'基线不存在: {baseline_path(args.compare)}')
+
+    report = run(args)
+    print_results(report)
+    if args.save_baseline:
+        save_baseline(report, args.save_baseline)
+        print(f'基线已保存: {baseline_path(args.save_baseline)}')
+    if args.compare:
+        with open(baseline_path(args.compare), encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} 项指标退化超过 {args.threshold:.0%}')
+            if args.fail_on_regression:
+                raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# 附件打包下载
+# 按申请编号分目录把附件写入 ZIP（<申请编号>/<原始文件名>），最后附加附件清单 附件清单.xlsx。
+# ZIP 由生成器逐块产生，内存占用与附件数量和大小无关:
+# - zipfile 写入不可 seek 的缓冲区，每个条目用数据描述符记录大小和 CRC，不需要回写文件头
+# - 附件按 CHUNK_SIZE 分块读取、写入，每积累约 CHUNK_SIZE 字节输出一次
+# - PDF / 图片等本身已压缩的文件直接存储（ZIP_STORED），其他文件用 deflate 压缩
+# - 清单以 openpyxl write-only 模式逐行写入临时文件，附件写完后再分块加入 ZIP 并删除临时文件
+import io
+import os
+import tempfile
+import time
+import zipfile
+
+import exporter
+
+# 附件查询的列顺序（申请信息 + 附件记录），清单中的申请信息列与之对应
+APPLICATION_FIELDS = ('app_number', 'purchaser', 'item_name', 'invoice_number', 'invoice_amount',
+                      'invoice_date', 'status')
+ATTACHMENT_FIELDS = ('id', 'original_filename', 'file_path')
+
+INDEX_NAME = '附件清单.xlsx'
+INDEX_HEADERS = ['申请编号', '购买人', '物品名称', '发票号码', '发票金额', '开票日期', '状态',
+                 '附件原始文件名', '压缩包内路径', '文件大小(字节)', '备注']
+
+# 不再压缩的扩展名（压缩率极低，只会浪费 CPU）
+STORED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.zip', '.rar', '.7z'}
+
+_INVALID_NAME_CHARS = str.maketrans({ch: '_' for ch in '/\\:*?"<>|\0'})
+
+
+# zipfile 的输出目标: 只追加、不可 seek（zipfile 因此使用数据描述符），已写入的字节由 take() 取走
+class _StreamBuffer(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._size += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    @property
+    def pending(self):
+        return self._size
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        return data
+
+
+# 附件在压缩包中的文件名: 去掉路径分隔符等字符，同一申请内重名时加序号
+def _entry_name(filename, used):
+    name = (filename or '').translate(_INVALID_NAME_CHARS).strip(' .') or '附件'
+    stem, ext = os.path.splitext(name)
+    candidate = name
+    index = 1
+    while candidate.lower() in used:
+        index += 1
+        candidate = f'{stem}({index}){ext}'
+    used.add(candidate.lower())
+    return candidate
+
+
+def _compress_type(filename):
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _zip_info(name, mtime, compress_type):
+    # ZIP 格式的时间不能早于 1980 年
+    date_time = time.localtime(max(mtime, 315532800))[:6]
+    info = zipfile.ZipInfo(name, date_time=date_time)
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+    return info
+
+
+# 把一个文件分块写入压缩包，每积累约 chunk_size 字节输出一次
+def _write_file(zf, output, info, path, size, chunk_size):
+    with open(path, 'rb') as src, zf.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as dest:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            dest.write(chunk)
+            if output.pending >= chunk_size:
+                yield output.take()
+    if output.pending >= chunk_size:
+        yield output.take()
+
+
+# 逐块生成 ZIP；rows 为按申请编号排序的 (APPLICATION_FIELDS..., ATTACHMENT_FIELDS...)。
+# 文件不存在或无法读取的附件不打包，在清单的备注列说明
+def generate_zip(rows, chunk_size=exporter.CHUNK_SIZE, tmp_dir=None):
+    output = _StreamBuffer()
+    zf = zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED)
+    fd, index_path = tempfile.mkstemp(suffix='.xlsx', dir=tmp_dir)
+    os.close(fd)
+    try:
+        wb, append = exporter.open_sheet(INDEX_HEADERS, '附件清单')
+        current_app = None
+        used = set()
+        app_count = len(APPLICATION_FIELDS)
+        for row in rows:
+            application = row[:app_count]
+            _, original_filename, file_path = row[app_count:]
+            app_number = application[0]
+            if app_number != current_app:
+                current_app = app_number
+                used = {INDEX_NAME.lower()}
+            entry = f'{_entry_name(app_number, set())}/{_entry_name(original_filename, used)}'
+            size = None
+            note = ''
+            try:
+                stat = os.stat(file_path)
+                size = stat.st_size
+                info = _zip_info(entry, stat.st_mtime, _compress_type(entry))
+                yield from _write_file(zf, output, info, file_path, size, chunk_size)
+            except FileNotFoundError:
+                note = '文件不存在，未打包'
+            except OSError as e:
+                note = f'读取失败，未打包: {e.strerror or e}'
+            if note:
+                entry = ''
+                size = None
+            append((*application, original_filename, entry, size, note))
+        wb.save(index_path)
+        info = _zip_info(INDEX_NAME, time.time(), zipfile.ZIP_DEFLATED)
+        yield from _write_file(zf, output, info, index_path, os.path.getsize(index_path), chunk_size)
+        zf.close()
+        if output.pending:
+            yield output.take()
+    finally:
+        try:
+            os.remove(index_path)
+        except OSError:
+            pass
+
+
+# 流式打包：从连接池取一个独立连接（不依赖请求上下文），打包完成或客户端断开后归还
+def generate_bundle(pool, query, params, chunk_size=exporter.CHUNK_SIZE, tmp_dir=None):
+    conn = pool.acquire()
+    try:
+        yield from generate_zip(exporter.iter_rows(conn, query, params), chunk_size, tmp_dir)
+    finally:
+        pool.release(conn)
@@ -0,0 +1,185 @@
+# 缓存与会话存储后端
+# CACHE_BACKEND=memory（默认）: 进程内存储，每个 worker 独立，失效通知只在本进程内分发；
+# CACHE_BACKEND=redis://...: 所有 worker / 节点共用 Redis（或兼容 Redis 协议的服务）中的数据，
+#   失效通知经 Redis pub/sub 广播，每个 worker 由一个后台线程接收。
+# 两种后端接口相同: get / set / delete 读写 bytes 值，publish / subscribe 收发失效通知。
+# Redis 不可用时缓存读写按未命中处理（记录错误数），不影响请求
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    # 数据只在本进程内可见
+    shared = False
+
+    def __init__(self, max_entries=10000, prefix=''):
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._handlers = {}
+
+    def get(self, key):
+        key = self.prefix + key
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[self.prefix + key] = (value, expires_at)
+            self._entries.move_to_end(self.prefix + key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(self.prefix + key, None)
+
+    # 同步调用本进程内的订阅者
+    def publish(self, channel, message):
+        for handler in self._handlers.get(channel, ()):
+            handler(message)
+
+    def subscribe(self, channel, handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def ensure_listening(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries), 'max_entries': self.max_entries}
+
+    def close(self):
+        pass
+
+
+class RedisBackend:
+    shared = True
+
+    def __init__(self, url, prefix='invoice:', socket_timeout=1.0):
+        import redis
+        self._errors_type = redis.RedisError
+        self.prefix = prefix
+        # 缓存读写设置较短的超时，Redis 故障时请求不会长时间阻塞
+        self.client = redis.Redis.from_url(url, socket_timeout=socket_timeout,
+                                           socket_connect_timeout=socket_timeout, health_check_interval=30)
+        # 订阅连接单独建立，不设读超时（没有通知时一直阻塞等待）
+        self._pubsub_client = redis.Redis.from_url(url, socket_connect_timeout=socket_timeout,
+                                                   socket_keepalive=True)
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self.errors = 0
+        self.messages = 0
+
+    def _error(self, operation, exc):
+        self.errors += 1
+        logger.warning(f"Redis {operation} 失败: {exc}")
+
+    def get(self, key):
+        try:
+            return self.client.get(self.prefix + key)
+        except self._errors_type as e:
+            self._error('get', e)
+            return None
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.client.set(self.prefix + key, value, ex=max(1, int(ttl)) if ttl else None)
+        except self._errors_type as e:
+            self._error('set', e)
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except self._errors_type as e:
+            self._error('delete', e)
+
+    def publish(self, channel, message):
+        try:
+            self.client.publish(self.prefix + channel, message)
+        except self._errors_type as e:
+            self._error('publish', e)
+
+    def subscribe(self, channel, handler):
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(handler)
+
+    # 在当前进程中启动订阅线程（fork 之后的 worker 需重新启动，由 before_request 调用）
+    def ensure_listening(self):
+        if self._listener_pid == os.getpid() or not self._handlers:
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def _dispatch(self, channel, message):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(message)
+            except Exception:
+                logger.exception(f"处理缓存失效通知失败: {channel} {message}")
+
+    def _listen(self):
+        channels = {self.prefix + channel: channel for channel in self._handlers}
+        while True:
+            pubsub = self._pubsub_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(*channels)
+                # (重新)订阅之前的通知可能已丢失，以 None 通知订阅者清空全部本地缓存
+                for channel in channels.values():
+                    self._dispatch(channel, None)
+                for item in pubsub.listen():
+                    if item['type'] != 'message':
+                        continue
+                    self.messages += 1
+                    channel = channels.get(item['channel'].decode())
+                    if channel is not None:
+                        self._dispatch(channel, item['data'].decode())
+            except self._errors_type as e:
+                self._error('subscribe', e)
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+    def stats(self):
+        kwargs = self.client.connection_pool.connection_kwargs
+        return {
+            'backend': 'redis',
+            'host': kwargs.get('host') or kwargs.get('path'),
+            'port': kwargs.get('port'),
+            'db': kwargs.get('db', 0),
+            'listening': self._listener_pid == os.getpid(),
+            'messages_received': self.messages,
+            'errors': self.errors,
+        }
+
+    def close(self):
+        self.client.close()
+        self._pubsub_client.close()
+
+
+# 按配置创建后端: 'memory' 或 redis:// / rediss:// / unix:// 连接 URL
+def create_backend(url, prefix='invoice:'):
+    if not url or url == 'memory':
+        return MemoryBackend(prefix=prefix)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url, prefix=prefix)
+    raise ValueError(f"未知的缓存后端: {url}")
@@ -0,0 +1,69 @@
+# 响应压缩
+# 文本类响应（HTML、JSON、CSV 等）按 Accept-Encoding 使用 brotli（安装了 brotli 包时）或 gzip 压缩。
+# 流式响应（导出）和 send_file 的文件响应不压缩；压缩后强 ETag 改为弱 ETag，
+# 条件请求按弱比较判断，浏览器带回的 ETag 仍能命中 304。
+# 已带 Content-Encoding 的响应（如页面缓存中预先压缩好的页面）不再处理
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/plain', 'text/csv', 'text/css',
+                          'application/json', 'application/javascript'}
+
+
+# 选择编码: 优先 brotli，其次 gzip，客户端都不接受时返回 None
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, level=6):
+    if encoding == 'br':
+        # brotli 质量 0-11，与 gzip 级别大致对应
+        return brotli.compress(data, quality=min(level + 1, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+# 当前请求中 size 字节的内容应使用的编码；未启用压缩、内容过短或客户端不接受压缩时返回 None
+def response_encoding(size):
+    config = current_app.config
+    if not config['COMPRESS_RESPONSES'] or size < config['COMPRESS_MIN_SIZE']:
+        return None
+    return choose_encoding(request.accept_encodings)
+
+
+# 把已按 encoding 压缩的内容设置为响应体
+def set_encoded_data(response, data, encoding):
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def init_app(app):
+    level = app.config['COMPRESS_LEVEL']
+
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code != 200 or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        encoding = response_encoding(len(data))
+        if encoding is None:
+            return response
+        set_encoded_data(response, compress(data, encoding, level), encoding)
+        return response
+
+    app.after_request(compress_response)
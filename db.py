@@ -0,0 +1,321 @@
+# 数据库连接层
+# 每个 worker 进程维护一个 SQLite 连接池，请求内通过 Flask g 复用同一个连接，
+# 请求结束时在 teardown 中归还，避免每个路由重复建立连接和执行 PRAGMA。
+# DATABASE 为 postgresql://... 时改用 PostgreSQL（见 postgres.py），接口相同
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, current_app
+
+import offload
+
+# 每个新连接都会执行的 PRAGMA
+# journal_mode=WAL 持久化在数据库文件中，其余为连接级设置
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -16000),        # 约 16MB 页缓存
+    ('mmap_size', 128 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+)
+
+
+# 卸载到线程池时逐行迭代每批读取的行数
+OFFLOAD_ITER_BATCH = 256
+
+
+# SQL 执行观察函数 observer(sql, seconds)，由 set_statement_observer 设置（用于统计每条语句的次数和耗时）。
+# 未设置时使用原生连接和游标，没有额外开销
+_statement_observer = None
+
+
+def set_statement_observer(observer):
+    global _statement_observer
+    _statement_observer = observer
+
+
+def _observe(sql, started):
+    observer = _statement_observer
+    if observer is not None:
+        observer(sql, time.perf_counter() - started)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _observe(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _observe(sql, started)
+
+
+# Connection.execute 不经过 cursor()，需要单独包装
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def is_postgres(database):
+    return str(database).startswith(('postgresql://', 'postgresql+', 'postgres://'))
+
+
+# 连接对应的数据库类型: 'sqlite' 或 'postgresql'
+def dialect(conn):
+    return getattr(conn, 'dialect', 'sqlite')
+
+
+# 逐批读取大量结果用的游标（PostgreSQL 使用服务器端游标，SQLite 的普通游标本身就是逐行读取）
+def streaming_cursor(conn):
+    if dialect(conn) == 'postgresql':
+        return conn.streaming_cursor()
+    return conn.cursor()
+
+
+# 是否为违反唯一约束等完整性错误（sqlite3 与 psycopg / psycopg2 的异常类都名为 IntegrityError，但没有共同基类）
+def is_integrity_error(exc):
+    return any(cls.__name__ == 'IntegrityError' for cls in type(exc).__mro__)
+
+
+# 读取后在同一事务中写入时锁定读到的行。SQLite 的 BEGIN IMMEDIATE 已持有整个数据库的写锁，不需要；
+# PostgreSQL 的 BEGIN 不执行（见 postgres.py），读已提交隔离下读到的行在写入前可能被其他事务修改，
+# 需要在查询末尾加 FOR UPDATE
+def for_update(conn):
+    return ' FOR UPDATE' if dialect(conn) == 'postgresql' else ''
+
+
+# gevent 下 sqlite3 的每次调用（执行、取结果、提交）交给线程池执行（见 offload.py），
+# 等待期间同一 worker 的其他请求可以继续运行
+class OffloadedCursor(InstrumentedCursor):
+    def execute(self, sql, parameters=()):
+        return offload.run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return offload.run(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return offload.run(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return offload.run(super().fetchmany)
+        return offload.run(super().fetchmany, size)
+
+    def fetchall(self):
+        return offload.run(super().fetchall)
+
+    # 逐行迭代时按批读取，避免每一行都切换一次线程
+    def __iter__(self):
+        fetchmany = super().fetchmany
+        while True:
+            rows = offload.run(fetchmany, OFFLOAD_ITER_BATCH)
+            if not rows:
+                return
+            yield from rows
+
+
+class OffloadedConnection(InstrumentedConnection):
+    def cursor(self, factory=OffloadedCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        offload.run(super().commit)
+
+    def rollback(self):
+        offload.run(super().rollback)
+
+    # sqlite3.Connection 的 with 语句直接调用 C 实现的提交/回滚，需要改为调用上面的方法
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+# 建立一个已应用 PRAGMA 的连接
+def connect(database, pragmas=SQLITE_PRAGMAS):
+    if is_postgres(database):
+        import postgres
+        return postgres.connect(database)
+    if offload.enabled():
+        factory = OffloadedConnection
+    elif _statement_observer is not None:
+        factory = InstrumentedConnection
+    else:
+        factory = sqlite3.Connection
+    # check_same_thread=False: gevent/线程 worker 中连接可能由不同线程归还
+    conn = sqlite3.connect(database, timeout=30, check_same_thread=False, factory=factory)
+    for name, value in pragmas:
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+# 每个 worker 进程一个的 SQLite 连接池
+# 空闲连接按后进先出复用；没有空闲连接时直接新建（SQLite 不需要限制并发连接数），
+# 归还时超过 size 的连接会被关闭。fork 之后（例如 gunicorn --preload）
+# 子进程会丢弃从父进程继承的连接
+class ConnectionPool:
+    def __init__(self, database, size=5, pragmas=SQLITE_PRAGMAS):
+        self.database = database
+        self.size = size
+        self.pragmas = pragmas
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._in_use = 0
+        self._stats = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'reused': 0,
+            'peak_in_use': 0,
+            'wait_time_total': 0.0,
+        }
+
+    def _check_fork(self):
+        # 进程 fork 后继承的连接不能跨进程使用，直接丢弃
+        if self._pid != os.getpid():
+            self._idle = []
+            self._in_use = 0
+            self._pid = os.getpid()
+
+    def acquire(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._check_fork()
+            conn = self._idle.pop() if self._idle else None
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if conn is not None:
+                self._stats['reused'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+        created = False
+        if conn is None:
+            try:
+                conn = connect(self.database, self.pragmas)
+                created = True
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                raise
+        with self._lock:
+            if created:
+                self._stats['connections_created'] += 1
+            self._stats['wait_time_total'] += time.perf_counter() - started
+        return conn
+
+    def release(self, conn):
+        # 归还前回滚未提交的事务，保证下一个请求拿到干净的连接
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._close(conn)
+            with self._lock:
+                self._in_use = max(self._in_use - 1, 0)
+            return
+
+        with self._lock:
+            self._check_fork()
+            self._in_use = max(self._in_use - 1, 0)
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._stats['connections_closed'] += 1
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'database': self.database,
+                'pid': self._pid,
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+            })
+        checkouts = stats['checkouts']
+        stats['reuse_ratio'] = round(stats['reused'] / checkouts, 4) if checkouts else 0.0
+        stats['avg_checkout_ms'] = round(stats['wait_time_total'] / checkouts * 1000, 4) if checkouts else 0.0
+        del stats['wait_time_total']
+        return stats
+
+
+# 由触发器维护的版本号（data_version / invoice_version）。SQLite 保存在 meta 中；
+# PostgreSQL 按连接分片计数（见 postgres.py 的 version_counters），取各分片之和
+def get_version(c, key):
+    if dialect(c.connection) == 'postgresql':
+        c.execute('SELECT CAST(COALESCE(SUM(value), 0) AS BIGINT) FROM version_counters WHERE name = ?', (key,))
+    else:
+        c.execute('SELECT value FROM meta WHERE key = ?', (key,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+# 当前数据版本号（applications / attachments 的任何变更都会使其加一，见迁移 5）
+def get_data_version(c):
+    return get_version(c, 'data_version')
+
+
+# 在应用上注册连接池和请求结束时的归还钩子
+def init_app(app):
+    if is_postgres(app.config['DATABASE']):
+        import postgres
+        app.extensions['db_pool'] = postgres.PostgresPool(
+            app.config['DATABASE'],
+            size=app.config.get('DB_POOL_SIZE', 5),
+            max_overflow=app.config.get('DB_MAX_OVERFLOW', 10),
+            timeout=app.config.get('DB_POOL_TIMEOUT', 30),
+        )
+    else:
+        app.extensions['db_pool'] = ConnectionPool(
+            app.config['DATABASE'],
+            size=app.config.get('DB_POOL_SIZE', 5),
+        )
+    app.teardown_appcontext(close_db)
+
+
+def get_pool():
+    return current_app.extensions['db_pool']
+
+
+# 获取当前请求的数据库连接（同一请求内多次调用返回同一个连接）
+def get_db():
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
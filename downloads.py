@@ -0,0 +1,92 @@
+# 附件下载
+# - 强 ETag（内容哈希，旧附件用文件修改时间+大小）和 Last-Modified，条件请求返回 304
+# - 支持 Range 请求（大 PDF 分段加载）
+# - 存储文件内容不可变，响应带长期私有缓存头
+# - 可选交给前端代理发送文件（nginx X-Accel-Redirect 或 Apache/lighttpd X-Sendfile），释放 worker
+# - 存储文件名 -> (文件路径, 原始文件名, 内容哈希) 的进程内缓存，命中时下载不查数据库
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, request, send_file
+
+import exporter
+
+OFFLOAD_MODES = ('', 'x-accel', 'x-sendfile')
+
+
+# 带过期时间的 LRU 缓存；附件被删除时由删除路径调用 clear()，其他 worker 中的缓存项最多保留 ttl 秒
+class LookupCache:
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _cache_forever(response, max_age):
+    # 附件涉及个人票据，只允许浏览器缓存，不允许共享缓存
+    response.cache_control.public = False
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    response.expires = None
+    return response
+
+
+# 由前端代理发送文件：Python 只返回响应头，304 仍在这里判断，Range 由代理处理
+def _offloaded_response(file_path, download_name, etag, mode, accel_prefix, upload_folder):
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response = Response(mimetype=mimetype)
+    if mode == 'x-accel':
+        relative = os.path.relpath(file_path, upload_folder).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + relative
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(file_path)
+    response.headers.set('Content-Disposition', 'attachment', **exporter.content_disposition(download_name))
+    stat = os.stat(file_path)
+    response.set_etag(etag or f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    response.last_modified = stat.st_mtime
+    return response.make_conditional(request)
+
+
+# 发送附件；content_hash 为空（内容寻址存储之前的附件）时由文件元数据生成 ETag
+def send_attachment(file_path, download_name, content_hash=None, mode='', accel_prefix='/protected-uploads/',
+                    upload_folder='uploads', max_age=365 * 24 * 3600):
+    if mode and mode in OFFLOAD_MODES:
+        response = _offloaded_response(file_path, download_name, content_hash, mode, accel_prefix, upload_folder)
+    else:
+        # send_file 把相对路径解析到应用目录，这里按当前工作目录解析（与上传时的路径一致）
+        response = send_file(os.path.abspath(file_path), as_attachment=True, download_name=download_name,
+                             conditional=True, etag=content_hash or True)
+        response.accept_ranges = 'bytes'
+    return _cache_forever(response, max_age)
@@ -2,7 +2,9 @@
 set -e
 
 # 确保目录存在并有正确权限
-mkdir -p /app/uploads /app/logs
+mkdir -p /app/uploads /app/logs /app/exports /app/metrics
+# 清除上次运行遗留的各 worker 指标快照（计数从本次启动重新开始）
+rm -f /app/metrics/*.json /app/metrics/*.tmp
 # 只有在目录权限可以修改时才尝试修改
 if [ -w /app/uploads ]; then
     chmod 755 /app/uploads
@@ -12,9 +14,8 @@ if [ -w /app/logs ]; then
 fi
 
 # 初始化数据库
-python -c "from app import init_db; init_db()"
+python -c "from app import create_app, init_db; create_app(); init_db()"
 
-# 启动应用，使用单个 gevent worker，并增加 worker-connections 数量
-# -k gevent: 指定使用 gevent 异步 worker
-# --worker-connections: 指定每个 worker 能处理的最大并发连接数
-exec gunicorn -w 1 -k gevent --worker-connections 1000 -b 0.0.0.0:5000 --timeout 120 --keep-alive 5 app:app
\ No newline at end of file
+# 启动应用，参数见 gunicorn.conf.py: 默认单个 gevent worker（GUNICORN_WORKERS 调整），
+# 以 preload 方式加载应用（app:create_app(preload=True)），每个 worker 最多 1000 个并发连接
+exec gunicorn
\ No newline at end of file
@@ -0,0 +1,245 @@
+# 后台导出任务
+# 大批量导出在本进程的线程池中执行，请求立即返回任务编号，前端轮询进度后下载结果文件。
+# 任务状态、进度和结果文件路径保存在 export_jobs 表中，任意 worker 都能查询；
+# 相同筛选条件且数据版本未变时直接复用已完成（或正在执行）的任务，结果文件超过 ttl 后清理。
+# 排队和执行中的任务由每个进程的心跳线程定时刷新 heartbeat_at（统计行数、保存 Excel 等长时间步骤中也不中断），
+# 心跳停止超过 stale_after 说明所在进程已退出，查询时标记为失败
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import exporter
+import metrics
+import offload
+
+JOB_COLUMNS = ['id', 'cache_key', 'format', 'filename', 'status', 'progress_rows', 'total_rows',
+               'file_path', 'error', 'data_version', 'created_by', 'created_at', 'heartbeat_at',
+               'finished_at']
+
+# 每导出多少行更新一次进度
+PROGRESS_EVERY = 1000
+
+logger = logging.getLogger(__name__)
+
+
+# 由筛选参数和导出格式计算缓存键
+def make_cache_key(args, fmt):
+    normalized = json.dumps({'args': sorted(args.items()), 'format': fmt}, ensure_ascii=False)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class ExportJobManager:
+    def __init__(self, pool, folder, max_workers=1, ttl=3600, stale_after=300):
+        self.pool = pool
+        self.folder = folder
+        self.max_workers = max_workers
+        self.ttl = ttl
+        # 执行中的任务超过该时间没有心跳视为所在 worker 已退出
+        self.stale_after = stale_after
+        self.heartbeat_interval = stale_after / 3
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        # 本进程中排队或执行中的任务，由心跳线程定时刷新
+        self._active = set()
+        self._heartbeat_pid = None
+
+    # 线程池在首次使用时按进程创建（gunicorn fork 之后每个 worker 各自一个）
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='export-job')
+                self._pid = os.getpid()
+            return self._executor
+
+    # 开始为任务发送心跳；心跳线程按进程启动，没有活动任务时退出
+    def _track(self, job_id):
+        with self._lock:
+            if self._heartbeat_pid != os.getpid():
+                self._active.clear()
+                self._heartbeat_pid = os.getpid()
+                threading.Thread(target=self._heartbeat, name='export-heartbeat', daemon=True).start()
+            self._active.add(job_id)
+
+    def _untrack(self, job_id):
+        with self._lock:
+            self._active.discard(job_id)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                if not self._active:
+                    self._heartbeat_pid = None
+                    return
+                job_ids = list(self._active)
+            try:
+                conn = self.pool.acquire()
+                try:
+                    with conn:
+                        conn.execute(f'''UPDATE export_jobs SET heartbeat_at = ?
+                                         WHERE id IN ({', '.join('?' * len(job_ids))})
+                                         AND status IN ('queued', 'running')''', [time.time()] + job_ids)
+                finally:
+                    self.pool.release(conn)
+            except Exception:
+                logger.exception('更新导出任务心跳失败')
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        total = job['total_rows']
+        if job['status'] == 'done':
+            job['percent'] = 100
+        elif total:
+            job['percent'] = min(int(job['progress_rows'] * 100 / total), 99)
+        else:
+            job['percent'] = 0
+        return job
+
+    def _fetch(self, c, job_id):
+        c.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM export_jobs WHERE id = ?", (job_id,))
+        return self._row_to_job(c.fetchone())
+
+    # 提交导出任务，返回任务信息（可能是复用的已有任务）
+    def submit(self, args, query, params, fmt, filename, user=None):
+        os.makedirs(self.folder, exist_ok=True)
+        self.cleanup(force=False)
+        cache_key = make_cache_key(args, fmt)
+        conn = self.pool.acquire()
+        try:
+            c = conn.cursor()
+            version = db.get_data_version(c)
+            c.execute(f'''SELECT {', '.join(JOB_COLUMNS)} FROM export_jobs
+                          WHERE cache_key = ? AND data_version = ? AND status IN ('queued', 'running', 'done')
+                          ORDER BY created_at DESC LIMIT 1''', (cache_key, version))
+            existing = self._row_to_job(c.fetchone())
+            if existing is not None:
+                now = time.time()
+                if existing['status'] == 'done' and existing['file_path'] and os.path.exists(existing['file_path']):
+                    existing['cached'] = True
+                    return existing
+                if existing['status'] != 'done' and now - existing['heartbeat_at'] < self.stale_after:
+                    existing['cached'] = True
+                    return existing
+
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            with conn:
+                c.execute('''INSERT INTO export_jobs
+                             (id, cache_key, format, filename, status, data_version, created_by,
+                              created_at, heartbeat_at)
+                             VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)''',
+                          (job_id, cache_key, fmt, filename, version, user, now, now))
+            job = self._fetch(c, job_id)
+        finally:
+            self.pool.release(conn)
+
+        # gevent 下执行器的线程是协程，整个任务交给原生线程池执行，生成 Excel 时不阻塞其他请求
+        self._track(job_id)
+        self._get_executor().submit(offload.run, self._run, job_id, query, params, fmt)
+        job['cached'] = False
+        return job
+
+    # 查询任务状态，心跳超时的执行中任务标记为失败
+    def get(self, job_id):
+        conn = self.pool.acquire()
+        try:
+            c = conn.cursor()
+            job = self._fetch(c, job_id)
+            if (job is not None and job['status'] in ('queued', 'running')
+                    and time.time() - job['heartbeat_at'] > self.stale_after):
+                with conn:
+                    c.execute('''UPDATE export_jobs SET status = 'failed', error = ?, finished_at = ?
+                                 WHERE id = ? AND status IN ('queued', 'running')''',
+                              ('导出任务中断（执行进程已退出）', time.time(), job_id))
+                job = self._fetch(c, job_id)
+            return job
+        finally:
+            self.pool.release(conn)
+
+    def _update(self, conn, job_id, **fields):
+        fields['heartbeat_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with conn:
+            conn.execute(f'UPDATE export_jobs SET {assignments} WHERE id = ?', list(fields.values()) + [job_id])
+
+    def _run(self, job_id, query, params, fmt):
+        # 读数据和写进度使用不同连接，进度更新可以在读游标未结束时提交
+        conn = self.pool.acquire()
+        progress_conn = self.pool.acquire()
+        final_path = os.path.join(self.folder, f'{job_id}.{fmt}')
+        tmp_path = final_path + '.tmp'
+        try:
+            c = conn.cursor()
+            c.execute(f'SELECT COUNT(*) FROM ({query}) AS export_rows', params)
+            total = c.fetchone()[0]
+            self._update(progress_conn, job_id, status='running', total_rows=total)
+
+            def counted(rows):
+                for done, row in enumerate(rows, 1):
+                    if done % PROGRESS_EVERY == 0:
+                        self._update(progress_conn, job_id, progress_rows=done)
+                    yield row
+
+            rows = counted(exporter.iter_rows(conn, query, params))
+            if fmt == 'csv':
+                with open(tmp_path, 'wb') as f:
+                    for chunk in exporter.generate_csv(rows):
+                        f.write(chunk)
+            else:
+                exporter.write_xlsx(rows, tmp_path)
+            os.replace(tmp_path, final_path)
+            metrics.inc('app_export_bytes_total', os.path.getsize(final_path), (('format', fmt), ('mode', 'job')))
+            self._update(progress_conn, job_id, status='done', progress_rows=total,
+                         file_path=final_path, finished_at=time.time())
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._update(progress_conn, job_id, status='failed', error=str(e), finished_at=time.time())
+        finally:
+            self._untrack(job_id)
+            self.pool.release(conn)
+            self.pool.release(progress_conn)
+
+    # 删除超过 ttl 的任务记录和结果文件；force=False 时每分钟最多执行一次
+    def cleanup(self, force=True):
+        now = time.time()
+        if not force and now - self._last_cleanup < 60:
+            return 0
+        self._last_cleanup = now
+        conn = self.pool.acquire()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT id, file_path FROM export_jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+                      (now - self.ttl,))
+            expired = c.fetchall()
+            for job_id, file_path in expired:
+                if file_path and os.path.exists(file_path):
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        continue
+                with conn:
+                    c.execute('DELETE FROM export_jobs WHERE id = ?', (job_id,))
+            return len(expired)
+        finally:
+            self.pool.release(conn)
+
+
+def init_app(app):
+    app.extensions['export_jobs'] = ExportJobManager(
+        app.extensions['db_pool'],
+        app.config['EXPORT_FOLDER'],
+        max_workers=app.config['EXPORT_WORKERS'],
+        ttl=app.config['EXPORT_RESULT_TTL'],
+    )
@@ -0,0 +1,125 @@
+# 数据导出
+# 按批次从游标读取数据并逐行写出，内存占用与导出行数无关：
+# - CSV：边查询边生成，直接以生成器流式返回
+# - Excel：openpyxl write-only 模式逐行写入临时文件，完成后分块流式返回并删除临时文件
+# openpyxl（连同 numpy 等依赖）导入慢、占内存，第一次写 Excel 时才导入，只导出 CSV 的 worker 不会加载
+import csv
+import io
+import os
+import tempfile
+import unicodedata
+from urllib.parse import quote
+
+import db
+
+# 导出表头，与 applications 表列顺序一致
+EXPORT_HEADERS = ['ID', '申请编号', '购买人', '商品参数及用途说明', '物品名称', '商品链接', '使用途径',
+                  '物品类型', '数量', '购买时间', '发票号码', '发票金额', '开票日期',
+                  '状态', '审批意见', '创建时间', '更新时间']
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+FETCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+# 按批次读取查询结果
+def iter_rows(conn, query, params, fetch_size=FETCH_SIZE):
+    c = db.streaming_cursor(conn)
+    c.execute(query, params)
+    try:
+        while True:
+            rows = c.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        c.close()
+
+
+# 逐行生成 CSV（带 BOM，Excel 打开中文不乱码），每积累约 CHUNK_SIZE 字节输出一次
+def generate_csv(rows, headers=EXPORT_HEADERS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# 以 write-only 模式新建工作簿并写入表头，返回 (工作簿, 追加一行的函数)；
+# 追加时去掉字符串中 openpyxl 不接受的控制字符
+def open_sheet(headers, sheet_name):
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    ws.append(headers)
+
+    def append(row):
+        ws.append([ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value for value in row])
+    return wb, append
+
+
+# 以 write-only 模式写出 Excel 文件
+def write_xlsx(rows, path, headers=EXPORT_HEADERS, sheet_name='报销申请'):
+    wb, append = open_sheet(headers, sheet_name)
+    for row in rows:
+        append(row)
+    wb.save(path)
+
+
+# 分块读取文件，读完后删除（用于临时文件）
+def iter_file(path, chunk_size=CHUNK_SIZE, remove=False):
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# 流式导出：从连接池取一个独立连接（不依赖请求上下文），导出完成或客户端断开后归还
+def generate_export(pool, query, params, fmt='xlsx', tmp_dir=None):
+    conn = pool.acquire()
+    try:
+        rows = iter_rows(conn, query, params)
+        if fmt == 'csv':
+            yield from generate_csv(rows)
+            return
+        fd, path = tempfile.mkstemp(suffix='.xlsx', dir=tmp_dir)
+        os.close(fd)
+        try:
+            write_xlsx(rows, path)
+        except Exception:
+            os.remove(path)
+            raise
+    finally:
+        pool.release(conn)
+    yield from iter_file(path, remove=True)
+
+
+# Content-Disposition 参数，非 ASCII 文件名按 RFC 5987 编码
+def content_disposition(filename):
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+^`|~')}"}
+    return {'filename': filename}
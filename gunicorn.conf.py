@@ -0,0 +1,22 @@
+# gunicorn 配置（在项目目录下运行 gunicorn 时自动读取）
+# 默认以 preload 方式加载应用: master 导入应用并预先导入重量级模块（见 app.create_app）后再 fork，
+# 各 worker 以写时复制共享这部分内存，新 worker 也不必重新导入。GUNICORN_PRELOAD=0 时每个 worker 各自导入应用。
+# worker 类型请用 GUNICORN_WORKER_CLASS 设置而不是 -k，下面要据此决定是否在 master 中提前打 gevent 补丁；
+# worker 数请用 GUNICORN_WORKERS 设置而不是 -w，create_app 据此检查会话存储配置
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+# 每个 gevent worker 能处理的最大并发连接数
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = 120
+keepalive = 5
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+wsgi_app = f'app:create_app(preload={preload_app}, workers={workers})'
+
+# gevent worker 在 fork 之后才打补丁；preload 时应用在 master 中导入，必须在此之前打补丁，
+# 否则导入时创建的锁（例如发票号码过滤器加载时持有的锁）是原生锁，协程在持有时切换会卡住整个 worker
+if preload_app and worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
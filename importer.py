@@ -0,0 +1,271 @@
+# 批量导入申请
+# 读取与导出相同列布局的 Excel / CSV 文件（按表头名称对应列，列顺序不限，ID 列忽略），逐行校验后:
+# - 文件内的发票号码和申请编号先去重，再写入临时表，用一条查询与 applications 和归档表连接，找出已存在的号码
+# - 通过检查的行按 chunk_size 分块，每块一个写事务用 executemany 插入（触发器照常维护汇总表和全文索引）
+# - 有错误的行不导入，其余行照常导入；返回逐行错误（行号为表格中的行号，表头为第 1 行）
+# 检查之后、插入之前其他请求提交了相同的号码时，插入该块违反唯一约束，回滚后在写事务中重新检查这一块再插入
+import csv
+import io
+import math
+import os
+import zipfile
+from datetime import date, datetime
+
+import approvals
+import archive
+import db
+import exporter
+
+IMPORT_FORMATS = ('xlsx', 'csv')
+
+# 表头 -> 列名（与导出相同，ID 列不导入）
+HEADER_COLUMNS = dict(zip(exporter.EXPORT_HEADERS, archive.APPLICATION_COLUMNS))
+INSERT_COLUMNS = archive.APPLICATION_COLUMNS[1:]
+REQUIRED_HEADERS = ('购买人', '物品名称', '使用途径', '物品类型', '数量', '购买时间', '发票号码', '发票金额', '开票日期')
+
+INSERT_APPLICATION = (f"INSERT INTO applications ({', '.join(INSERT_COLUMNS)}) "
+                      f"VALUES ({', '.join('?' * len(INSERT_COLUMNS))})")
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# 需要检查唯一性的列（applications 和归档表上都有索引）
+_UNIQUE_COLUMNS = ('invoice_number', 'app_number')
+_INVOICE = INSERT_COLUMNS.index('invoice_number')
+_APP_NUMBER = INSERT_COLUMNS.index('app_number')
+_UNIQUE_POSITIONS = (('invoice_number', _INVOICE), ('app_number', _APP_NUMBER))
+
+_UNIQUE_LABELS = {'invoice_number': '发票号码', 'app_number': '申请编号'}
+
+
+# 根据文件名判断格式，不支持时返回 None
+def detect_format(filename):
+    ext = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return ext if ext in IMPORT_FORMATS else None
+
+
+# 逐行读取表格，生成 (行号, [单元格值, ...])，第一个为表头行；stream 为二进制文件对象。
+# Excel 文件只读取第一个工作表（read_only 模式逐行解析，不把整个文件载入内存）
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        try:
+            yield from enumerate(csv.reader(text), start=1)
+        finally:
+            # 不随包装对象一起关闭调用方的文件（调用方提前关闭文件时无需处理）
+            if not stream.closed:
+                text.detach()
+        return
+    from openpyxl import load_workbook
+    try:
+        wb = load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f'无法读取 Excel 文件: {e}')
+    try:
+        for line_number, row in enumerate(wb.worksheets[0].iter_rows(values_only=True), start=1):
+            yield line_number, list(row)
+    finally:
+        wb.close()
+
+
+# 单元格值转为文本: Excel 中的日期时间和整数按导出时的文本格式还原
+def _text(value):
+    if type(value) is str:
+        return value.strip()
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+# 日期只取前 10 个字符（Excel 日期单元格还原为日期时间文本），允许 / 分隔
+def _parse_date(text, label):
+    try:
+        return date.fromisoformat(text[:10].replace('/', '-')).isoformat()
+    except ValueError:
+        raise ValueError(f'{label}格式应为 YYYY-MM-DD: {text}')
+
+
+# 校验一行并转换为插入的参数（列顺序与 INSERT_COLUMNS 一致）；record 为 {表头: 单元格文本}，
+# 申请编号为空时调用 new_app_number 生成。不符合要求时抛出 ValueError（提示信息）
+def validate_row(record, new_app_number, now):
+    missing = [header for header in REQUIRED_HEADERS if not record.get(header)]
+    if missing:
+        raise ValueError(f"缺少{'、'.join(missing)}")
+    try:
+        quantity = float(record['数量'])
+    except ValueError:
+        raise ValueError(f"数量不是数字: {record['数量']}")
+    if not quantity.is_integer() or quantity < 1:
+        raise ValueError(f"数量应为正整数: {record['数量']}")
+    try:
+        amount = float(record['发票金额'])
+    except ValueError:
+        raise ValueError(f"发票金额不是数字: {record['发票金额']}")
+    if not math.isfinite(amount) or amount < 0:
+        raise ValueError(f"发票金额无效: {record['发票金额']}")
+    status = record.get('状态') or approvals.VALID_STATUSES[0]
+    if status not in approvals.VALID_STATUSES:
+        raise ValueError(f"状态应为 {'/'.join(approvals.VALID_STATUSES)} 之一: {status}")
+    return (
+        record.get('申请编号') or new_app_number(),
+        record['购买人'],
+        record.get('商品参数及用途说明', ''),
+        record['物品名称'],
+        record.get('商品链接', ''),
+        record['使用途径'],
+        record['物品类型'],
+        int(quantity),
+        _parse_date(record['购买时间'], '购买时间'),
+        record['发票号码'],
+        round(amount, 2),
+        _parse_date(record['开票日期'], '开票日期'),
+        status,
+        record.get('审批意见') or None,
+        record.get('创建时间') or now,
+        record.get('更新时间') or now,
+    )
+
+
+# 解析并校验全部行，返回 (通过校验的行 [(行号, 参数)], 错误 [(行号, 提示)], 数据行数, 申请编号为生成的行号集合,
+# 生成申请编号的函数)。生成的编号与文件中的编号及之前生成的编号都不重复（生成的编号已存在于数据库中、需要重新生成时
+# 同样使用这个函数）。缺少必需的列时抛出 ValueError
+def parse(rows, new_app_number, now):
+    rows = iter(rows)
+    header_row = next(rows, None)
+    if header_row is None:
+        raise ValueError('文件为空')
+    headers = [_text(value) for value in header_row[1]]
+    missing = [header for header in REQUIRED_HEADERS if header not in headers]
+    if missing:
+        raise ValueError(f"缺少必需的列: {'、'.join(missing)}")
+    positions = [(index, header) for index, header in enumerate(headers) if header in HEADER_COLUMNS]
+    valid = []
+    errors = []
+    total = 0
+    seen = {column: {} for column in _UNIQUE_COLUMNS}
+    generated = set()
+    issued = set()
+
+    # 生成的申请编号与文件中已有的编号或之前生成的编号重复时重新生成
+    def unique_app_number():
+        while True:
+            number = new_app_number()
+            if number not in seen['app_number'] and number not in issued:
+                issued.add(number)
+                return number
+
+    for line_number, cells in rows:
+        record = {header: _text(cells[index]) for index, header in positions if index < len(cells)}
+        # 空行（或只有无关列有内容的行）跳过
+        if not any(record.values()):
+            continue
+        total += 1
+        try:
+            params = validate_row(record, unique_app_number, now)
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+            continue
+        duplicate = None
+        for column, position in _UNIQUE_POSITIONS:
+            first = seen[column].setdefault(params[position], line_number)
+            if first != line_number:
+                duplicate = f'{_UNIQUE_LABELS[column]}与第 {first} 行重复: {params[position]}'
+                break
+        if duplicate:
+            errors.append((line_number, duplicate))
+            continue
+        if not record.get('申请编号'):
+            generated.add(line_number)
+        valid.append((line_number, params))
+    return valid, errors, total, generated, unique_app_number
+
+
+# 集合方式查询已存在的号码: 待检查的号码写入临时表，一条查询与 applications 和归档表连接。
+# keys 为 [(列名, 值)]，返回已存在的 {(列名, 值)}
+def find_existing(c, keys):
+    c.execute('''CREATE TEMP TABLE IF NOT EXISTS import_keys (
+                     kind TEXT NOT NULL,
+                     value TEXT NOT NULL,
+                     PRIMARY KEY (kind, value)
+                 )''')
+    c.execute('DELETE FROM import_keys')
+    c.executemany('INSERT INTO import_keys (kind, value) VALUES (?, ?)', keys)
+    c.execute(' UNION ALL '.join(
+        f"SELECT k.kind, k.value FROM import_keys k JOIN {table} t ON t.{column} = k.value WHERE k.kind = '{column}'"
+        for table in archive.APPLICATION_TABLES for column in _UNIQUE_COLUMNS))
+    existing = set(c.fetchall())
+    c.execute('DELETE FROM import_keys')
+    return existing
+
+
+# 去掉号码已存在的行（记入错误），返回剩余的行；生成的申请编号（generated 中的行）已存在时
+# 用 new_app_number（parse 返回的生成函数，保证与文件中的编号不重复）重新生成后再检查
+def _drop_existing(c, valid, errors, generated, new_app_number):
+    remaining = []
+    pending = valid
+    while pending:
+        existing = find_existing(c, [(column, params[position]) for _, params in pending
+                                     for column, position in _UNIQUE_POSITIONS])
+        retry = []
+        for line_number, params in pending:
+            if ('invoice_number', params[_INVOICE]) in existing:
+                errors.append((line_number, f'发票号码已存在: {params[_INVOICE]}'))
+            elif ('app_number', params[_APP_NUMBER]) not in existing:
+                remaining.append((line_number, params))
+            elif line_number in generated:
+                retry.append((line_number, params[:_APP_NUMBER] + (new_app_number(),) + params[_APP_NUMBER + 1:]))
+            else:
+                errors.append((line_number, f'申请编号已存在: {params[_APP_NUMBER]}'))
+        pending = retry
+    remaining.sort(key=lambda item: item[0])
+    return remaining
+
+
+# 在一个写事务中插入一块；recheck 为 (generated, new_app_number) 时先在事务中重新检查号码
+def _insert_chunk(c, chunk, errors, recheck=None):
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        if recheck is not None:
+            chunk = _drop_existing(c, chunk, errors, *recheck)
+        c.executemany(INSERT_APPLICATION, [params for _, params in chunk])
+        c.execute('COMMIT')
+    except Exception:
+        c.execute('ROLLBACK')
+        raise
+    return len(chunk)
+
+
+# 导入 parse 通过校验的行，返回 {'total': 数据行数, 'imported': 导入行数, 'errors': [(行号, 提示)]}。
+# dry_run=True 时只检查，不写入；progress(已导入行数) 在每块提交后调用
+def import_rows(conn, rows, new_app_number, now, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, progress=None):
+    valid, errors, total, generated, new_app_number = parse(rows, new_app_number, now)
+    c = conn.cursor()
+    if conn.in_transaction:
+        conn.commit()
+    c.execute('BEGIN')
+    try:
+        valid = _drop_existing(c, valid, errors, generated, new_app_number)
+        c.execute('COMMIT')
+    except Exception:
+        c.execute('ROLLBACK')
+        raise
+    imported = len(valid) if dry_run else 0
+    if not dry_run:
+        chunk_size = max(1, chunk_size)
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                imported += _insert_chunk(c, chunk, errors)
+            except Exception as e:
+                if not db.is_integrity_error(e):
+                    raise
+                imported += _insert_chunk(c, chunk, errors, recheck=(generated, new_app_number))
+            if progress is not None:
+                progress(imported)
+    errors.sort()
+    return {'total': total, 'imported': imported, 'errors': errors, 'dry_run': dry_run}
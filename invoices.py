@@ -0,0 +1,195 @@
+# 发票号码存在性检查
+# 每个 worker 进程在内存中维护一个布隆过滤器：过滤器判断"不存在"的号码直接返回，不访问数据库；
+# 判断"可能存在"的号码再查询数据库确认，因此"已存在"的结果总是准确的。
+# 过滤器的"不存在"只用于提示（检查接口），提交和修改申请时以数据库的唯一约束为准。
+# 与其他 worker 的写入保持一致（以触发器维护的版本号判断是否有新的提交，见 db.get_version）:
+#   - data_version 未变化: 没有新的提交，直接用内存中的过滤器回答
+#   - 新增申请: 加载已加载最大 id 之后的号码；并发事务可能不按 id 顺序提交，缺失的 id 留待之后重新查询
+#   - 修改发票号码: 触发器把 invoice_version 加一（迁移 8），版本变化时重建过滤器
+#   - 删除申请: 不影响正确性（被删除的号码只会多一次数据库确认），不重建
+#   - 归档申请（见 archive.py）: 号码仍然存在，过滤器和确认查询同时覆盖 applications 与归档表；
+#     归档的行保留原 id，尚未加载就被归档的号码同样按 id 从归档表加载
+# max_age > 0 时两次检查版本号之间至少间隔 max_age 秒（期间其他 worker 新提交的号码可能被判为不存在）
+import hashlib
+import math
+import threading
+import time
+
+import archive
+import db
+import metrics
+
+# 单条 IN 查询最多包含的号码数（低于 SQLite 默认的变量数上限）
+QUERY_CHUNK_SIZE = 500
+
+# 过滤器容量至少为已有号码数的两倍，增量加载超出容量后按新的数量重建
+MIN_CAPACITY = 10000
+
+# 自增 id 在插入时分配、提交时才可见，并发事务可能晚于更大的 id 提交。最近分配的 id 中缺失的
+# （建立过滤器时最大 id 之前 PENDING_WINDOW 个以内、以及增量加载时跳过的）记为可能尚未提交，
+# 之后每次加载时重新查询，PENDING_TTL 秒后仍未出现则视为已回滚或已删除
+PENDING_WINDOW = 10000
+PENDING_TTL = 120
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    # 双重哈希: 由一次 blake2b 摘要得到 k 个位置
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        bits = self.bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+# 按号码查询（{placeholders} 为号码个数的占位符）和按 id 增量加载号码的语句，{table} 为申请表或归档表
+EXISTING_QUERY = 'SELECT invoice_number FROM {table} WHERE invoice_number IN ({placeholders})'
+LOAD_QUERY = 'SELECT id, invoice_number FROM {table} WHERE id > ?'
+
+
+# 查询数据库中已存在的发票号码（包括已归档的申请）
+def query_existing(c, numbers):
+    numbers = list(numbers)
+    existing = set()
+    for start in range(0, len(numbers), QUERY_CHUNK_SIZE):
+        chunk = numbers[start:start + QUERY_CHUNK_SIZE]
+        for table in archive.APPLICATION_TABLES:
+            pending = [number for number in chunk if number not in existing]
+            if not pending:
+                break
+            c.execute(EXISTING_QUERY.format(table=table, placeholders=', '.join('?' * len(pending))), pending)
+            existing.update(row[0] for row in c.fetchall())
+    return existing
+
+
+class InvoiceIndex:
+    def __init__(self, error_rate=0.01, max_age=0.0):
+        self.error_rate = error_rate
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._filter = None
+        self._data_version = None
+        self._invoice_version = None
+        self._max_id = 0
+        # 可能尚未提交的 id -> 发现缺失的时间
+        self._pending = {}
+        self._checked_at = 0.0
+
+    def _is_fresh(self):
+        return self._filter is not None and time.monotonic() - self._checked_at < self.max_age
+
+    # 记录 (start, end] 中没有读到的 id（最多 PENDING_WINDOW 个），并丢弃超过 PENDING_TTL 的记录
+    def _track_pending(self, start, end, seen):
+        now = time.monotonic()
+        for row_id in range(max(start, end - PENDING_WINDOW) + 1, end + 1):
+            if row_id not in seen:
+                self._pending.setdefault(row_id, now)
+        for row_id, since in list(self._pending.items()):
+            if now - since > PENDING_TTL:
+                del self._pending[row_id]
+
+    def _rebuild(self, c):
+        count = 0
+        for table in archive.APPLICATION_TABLES:
+            c.execute(f'SELECT COUNT(*) FROM {table}')
+            count += c.fetchone()[0]
+        bloom = BloomFilter(max(MIN_CAPACITY, count * 2), self.error_rate)
+        rows = []
+        for table in archive.APPLICATION_TABLES:
+            c.execute(f'SELECT id, invoice_number FROM {table}')
+            for row_id, number in c:
+                bloom.add(number)
+                rows.append(row_id)
+        max_id = max(rows, default=0)
+        recent = {row_id for row_id in rows if row_id > max_id - PENDING_WINDOW}
+        self._filter, self._max_id, self._pending = bloom, max_id, {}
+        self._track_pending(0, max_id, recent)
+        metrics.inc('app_invoice_index_rebuilds_total')
+
+    # 增量加载已加载最大 id 之后的号码，以及之前缺失的 id 中已经提交的号码
+    def _load_new(self, c):
+        low = min(self._pending, default=self._max_id + 1) - 1
+        rows = []
+        for table in archive.APPLICATION_TABLES:
+            c.execute(LOAD_QUERY.format(table=table), (low,))
+            rows += [row for row in c.fetchall() if row[0] > self._max_id or row[0] in self._pending]
+        if self._filter.count + len(rows) > self._filter.capacity:
+            self._rebuild(c)
+            return
+        seen = set()
+        for row_id, number in rows:
+            self._filter.add(number)
+            self._pending.pop(row_id, None)
+            seen.add(row_id)
+        max_id = max(seen, default=self._max_id)
+        self._track_pending(self._max_id, max_id, seen)
+        self._max_id = max(self._max_id, max_id)
+
+    # 读取其他 worker 的写入（首次调用时建立过滤器）；get_conn 只在需要访问数据库时调用
+    def refresh(self, get_conn):
+        if self._is_fresh():
+            return
+        with self._lock:
+            if self._is_fresh():
+                return
+            conn = get_conn()
+            c = conn.cursor()
+            # 在同一个读事务中读取版本号和号码（PostgreSQL 读已提交隔离级别下号码只会比版本号新，下次检查时再加载一次）
+            own_transaction = not conn.in_transaction
+            if own_transaction:
+                c.execute('BEGIN')
+            try:
+                data_version = db.get_data_version(c)
+                if self._filter is None or data_version != self._data_version:
+                    invoice_version = db.get_version(c, 'invoice_version')
+                    if self._filter is None or invoice_version != self._invoice_version:
+                        self._rebuild(c)
+                    else:
+                        self._load_new(c)
+                    self._data_version, self._invoice_version = data_version, invoice_version
+            finally:
+                if own_transaction:
+                    conn.commit()
+            self._checked_at = time.monotonic()
+
+    # 返回 numbers 中已存在的发票号码
+    def existing(self, get_conn, numbers):
+        self.refresh(get_conn)
+        bloom = self._filter
+        candidates = [number for number in numbers if number in bloom]
+        negatives = len(numbers) - len(candidates)
+        if negatives:
+            metrics.inc('app_invoice_index_lookups_total', negatives, (('answer', 'memory'),))
+        if not candidates:
+            return set()
+        found = query_existing(get_conn().cursor(), candidates)
+        metrics.inc('app_invoice_index_lookups_total', len(found), (('answer', 'database'),))
+        if len(candidates) > len(found):
+            metrics.inc('app_invoice_index_lookups_total', len(candidates) - len(found),
+                        (('answer', 'false_positive'),))
+        return found
+
+    def exists(self, get_conn, number):
+        return number in self.existing(get_conn, [number])
+
+    # 本进程提交新号码后立即加入过滤器（其他 worker 通过 refresh 增量加载）
+    def add(self, number):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(number)
@@ -0,0 +1,295 @@
+# 运行指标
+# 每个 worker 进程在内存中累计指标（加锁的字典，每次记录只有几微秒开销），
+# 并在请求结束时每隔 flush_interval 秒把快照写入 METRICS_DIR/<pid>.json（先写临时文件再 os.replace）。
+# /metrics 由任意一个 worker 处理：合并目录中所有 worker 的快照后输出 Prometheus 文本格式。
+# 已退出 worker 的计数器和直方图继续参与合并（保证计数单调），其 gauge 不再计入
+import bisect
+import json
+import os
+import re
+import threading
+import time
+
+from flask import g, request
+
+import db
+
+# 请求耗时直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 最多单独统计的 SQL 语句数，超出后归入 "other"
+MAX_STATEMENTS = 500
+STATEMENT_LENGTH = 200
+
+# 指标类型和说明
+METRICS = {
+    'app_http_requests_total': ('counter', '按路由、方法、状态码统计的请求数'),
+    'app_http_request_duration_seconds': ('histogram', '按路由统计的请求耗时（秒）'),
+    'app_http_requests_in_flight': ('gauge', '正在处理的请求数（所有存活 worker 之和）'),
+    'app_http_requests_in_flight_max': ('gauge', '单个 worker 内观察到的最大并发请求数'),
+    'app_sql_statements_total': ('counter', '按语句统计的 SQL 执行次数'),
+    'app_sql_statement_duration_seconds_total': ('counter', '按语句统计的 SQL 执行耗时（秒，不含取结果）'),
+    'app_export_bytes_total': ('counter', '导出输出的字节数'),
+    'app_upload_bytes_total': ('counter', '上传附件的字节数'),
+    'app_upload_files_total': ('counter', '上传附件的文件数'),
+    'app_import_rows_total': ('counter', '批量导入按结果统计的行数（导入/出错）'),
+    'app_page_cache_requests_total': ('counter', '后台页面缓存按路由统计的命中（本 worker / 共享缓存）/未命中次数'),
+    'app_invoice_index_lookups_total': ('counter', '发票号码检查按回答来源统计的号码数（内存/数据库/过滤器误判）'),
+    'app_invoice_index_rebuilds_total': ('counter', '发票号码过滤器的重建次数'),
+    'app_workers': ('gauge', '存活的 worker 进程数'),
+}
+
+# 多个 worker 的 gauge 合并方式
+GAUGE_MERGE = {
+    'app_http_requests_in_flight': sum,
+    'app_http_requests_in_flight_max': max,
+}
+
+_PLACEHOLDER_LIST_RE = re.compile(r'\?(\s*,\s*\?)+')
+
+
+# 把 SQL 归一化为统计用的语句标签：合并空白、折叠占位符列表、截断长度
+def normalize_statement(sql):
+    statement = _PLACEHOLDER_LIST_RE.sub('?, ...', ' '.join(sql.split()))
+    if len(statement) > STATEMENT_LENGTH:
+        statement = statement[:STATEMENT_LENGTH] + '...'
+    return statement
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.statements = {}
+        self._normalized = {}
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=()):
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        key = (name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    # 调整 gauge，返回调整后的值
+    def add_gauge(self, name, delta):
+        key = (name, ())
+        with self._lock:
+            value = self.gauges[key] = self.gauges.get(key, 0) + delta
+            return value
+
+    def max_gauge(self, name, value):
+        key = (name, ())
+        with self._lock:
+            if value > self.gauges.get(key, 0):
+                self.gauges[key] = value
+
+    # 作为 db.set_statement_observer 的观察函数
+    def observe_statement(self, sql, seconds):
+        statement = self._normalized.get(sql)
+        if statement is None:
+            statement = normalize_statement(sql)
+            if len(self._normalized) < MAX_STATEMENTS * 4:
+                self._normalized[sql] = statement
+        with self._lock:
+            entry = self.statements.get(statement)
+            if entry is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    statement = 'other'
+                entry = self.statements.setdefault(statement, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(counts), total]
+                               for (name, labels), (counts, total) in self.histograms.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self.gauges.items()],
+                'statements': [[statement, count, seconds]
+                               for statement, (count, seconds) in self.statements.items()],
+            }
+
+
+# 进程内唯一的指标注册表（导出线程等没有请求上下文的代码也直接使用）
+registry = Registry()
+
+
+def inc(name, value=1, labels=()):
+    registry.inc(name, value, labels)
+
+
+# 包装字节流生成器，统计输出的字节数
+def count_bytes(chunks, name, labels=()):
+    for chunk in chunks:
+        registry.inc(name, len(chunk), labels)
+        yield chunk
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsStore:
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(registry.snapshot(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    # 读取所有 worker 的快照（本进程使用内存中的最新数据）
+    def collect(self):
+        snapshots = [registry.snapshot()]
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.json') or entry.name == f'{os.getpid()}.json':
+                    continue
+                try:
+                    with open(entry.path, encoding='utf-8') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+
+def _labels_key(labels):
+    return tuple(tuple(pair) for pair in labels)
+
+
+# 合并多个 worker 的快照
+def merge(snapshots):
+    counters, histograms, gauges, statements = {}, {}, {}, {}
+    live = 0
+    for snapshot in snapshots:
+        alive = snapshot['pid'] == os.getpid() or _pid_alive(snapshot['pid'])
+        live += alive
+        for name, labels, value in snapshot['counters']:
+            key = (name, _labels_key(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total in snapshot['histograms']:
+            key = (name, _labels_key(labels))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+        if alive:
+            for name, labels, value in snapshot['gauges']:
+                gauges.setdefault((name, _labels_key(labels)), []).append(value)
+        for statement, count, seconds in snapshot['statements']:
+            entry = statements.setdefault(statement, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+    for (name, labels), values in gauges.items():
+        gauges[(name, labels)] = GAUGE_MERGE.get(name, sum)(values)
+    gauges[('app_workers', ())] = live
+    for statement, (count, seconds) in statements.items():
+        counters[('app_sql_statements_total', (('statement', statement),))] = count
+        counters[('app_sql_statement_duration_seconds_total', (('statement', statement),))] = seconds
+    return counters, histograms, gauges
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+# 输出 Prometheus 文本格式
+def render(snapshots):
+    counters, histograms, gauges = merge(snapshots)
+    series = {}
+    for (name, labels), value in counters.items():
+        series.setdefault(name, []).append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), value in gauges.items():
+        series.setdefault(name, []).append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), (counts, total) in histograms.items():
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    output = []
+    for name in sorted(series):
+        metric_type, description = METRICS.get(name, ('untyped', ''))
+        output.append(f'# HELP {name} {description}')
+        output.append(f'# TYPE {name} {metric_type}')
+        output.extend(sorted(series[name]))
+    return '\n'.join(output) + '\n'
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    in_flight = registry.add_gauge('app_http_requests_in_flight', 1)
+    registry.max_gauge('app_http_requests_in_flight_max', in_flight)
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc=None):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    registry.add_gauge('app_http_requests_in_flight', -1)
+    endpoint = request.endpoint or 'unmatched'
+    status = g.pop('metrics_status', 500 if exc is not None else 200)
+    registry.observe('app_http_request_duration_seconds', seconds, (('endpoint', endpoint),))
+    registry.inc('app_http_requests_total', 1,
+                 (('endpoint', endpoint), ('method', request.method), ('status', str(status))))
+    store = _store
+    if store is not None:
+        try:
+            store.maybe_flush()
+        except OSError:
+            pass
+
+
+_store = None
+
+
+def init_app(app):
+    global _store
+    _store = MetricsStore(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+    app.extensions['metrics'] = _store
+    db.set_statement_observer(registry.observe_statement)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
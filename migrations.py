@@ -0,0 +1,220 @@
+# 数据库结构迁移
+# 使用 PRAGMA user_version 记录当前结构版本，启动时（init_db）按顺序执行尚未执行的迁移。
+# 每个迁移在 BEGIN IMMEDIATE 事务中执行，多个 worker 同时启动时只有一个会真正执行，
+# 其余进程拿到写锁后重新读取版本号并跳过已完成的迁移。
+# PostgreSQL 的表结构由 postgres.run_migrations 维护，版本号与此处的迁移版本号对应
+import logging
+
+import analytics
+import archive
+import db
+import postgres
+import search
+import summary
+
+logger = logging.getLogger(__name__)
+
+
+# 仅当已有数据中没有重复发票号码时才建立唯一索引，否则退化为普通索引并记录警告，
+# 避免在生产库上因历史重复数据导致迁移失败
+def _index_invoice_number(c):
+    c.execute('''SELECT invoice_number FROM applications
+                 GROUP BY invoice_number HAVING COUNT(*) > 1 LIMIT 5''')
+    duplicates = [row[0] for row in c.fetchall()]
+    if duplicates:
+        logger.warning(f"发票号码存在重复记录，改为建立普通索引: {duplicates}")
+        c.execute('CREATE INDEX IF NOT EXISTS idx_applications_invoice_number '
+                  'ON applications (invoice_number)')
+    else:
+        c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_applications_invoice_number '
+                  'ON applications (invoice_number)')
+
+
+def _add_lookup_indexes(c):
+    _index_invoice_number(c)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_attachments_app_number ON attachments (app_number)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_attachments_stored_filename ON attachments (stored_filename)')
+    # 后台筛选 + 默认按创建时间排序
+    c.execute('CREATE INDEX IF NOT EXISTS idx_applications_created_at ON applications (created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_applications_status_created_at '
+              'ON applications (status, created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_applications_usage_type_created_at '
+              'ON applications (usage_type, created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_applications_invoice_date ON applications (invoice_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_applications_purchase_time ON applications (purchase_time)')
+
+
+# 后台游标分页按 (排序字段, id) 定位，SQLite 普通索引的条目本身按 (字段, rowid) 有序，
+# 因此为每个可排序字段建立单列索引即可支持 ORDER BY col, id 与 (col, id) < (?, ?)
+def _add_sort_indexes(c):
+    for column in ('purchaser', 'item_name', 'invoice_amount', 'item_type', 'status'):
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_applications_{column} ON applications ({column})')
+
+
+# 建立统计汇总表和维护触发器，并按现有数据回填
+def _add_summary_table(c):
+    summary.create_schema(c)
+    summary.rebuild(c)
+
+
+# 建立购买人/物品名称/商品参数及用途说明的 FTS5 全文索引及同步触发器
+def _add_fulltext_index(c):
+    search.create_schema(c)
+
+
+# 数据版本号: applications / attachments 每次变更时由触发器加一，
+# 用于判断导出结果等缓存是否仍然有效（跨 worker 进程共享）
+def _add_data_version(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+    for table in ('applications', 'attachments'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{event.lower()}
+                          AFTER {event} ON {table}
+                          BEGIN
+                              UPDATE meta SET value = value + 1 WHERE key = 'data_version';
+                          END''')
+
+
+# 后台导出任务，任务状态保存在数据库中，任意 worker 都可以查询进度
+def _add_export_jobs(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS export_jobs (
+        id TEXT PRIMARY KEY,
+        cache_key TEXT NOT NULL,
+        format TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        progress_rows INTEGER NOT NULL DEFAULT 0,
+        total_rows INTEGER,
+        file_path TEXT,
+        error TEXT,
+        data_version INTEGER NOT NULL,
+        created_by TEXT,
+        created_at REAL NOT NULL,
+        heartbeat_at REAL NOT NULL,
+        finished_at REAL
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_cache_key ON export_jobs (cache_key, data_version)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_finished_at ON export_jobs (finished_at)')
+
+
+def _add_attachment_hashes(c):
+    c.execute('ALTER TABLE attachments ADD COLUMN content_hash TEXT')
+    # 按内容查找重复附件、按文件路径统计引用数
+    c.execute('CREATE INDEX IF NOT EXISTS idx_attachments_content_hash ON attachments (content_hash)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_attachments_file_path ON attachments (file_path)')
+
+
+# 发票号码版本号: 修改发票号码时由触发器加一，各 worker 的发票号码过滤器据此重建（见 invoices.py）。
+# 新增申请按自增 id 增量加载，删除申请不影响过滤器的正确性，两者都不需要改变版本号
+def _add_invoice_version(c):
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('invoice_version', 0)")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_invoice_version_update
+                 AFTER UPDATE OF invoice_number ON applications
+                 WHEN OLD.invoice_number IS NOT NEW.invoice_number
+                 BEGIN
+                     UPDATE meta SET value = value + 1 WHERE key = 'invoice_version';
+                 END''')
+
+
+# 已报销申请归档表（列与 applications / attachments 相同）、待归档申请的索引，
+# 以及拒绝与归档申请重复的发票号码的触发器
+def _add_archive_tables(c):
+    archive.create_schema(c)
+
+
+# 建立按 (开票月份, 使用途径, 物品类型, 购买人, 状态) 的支出分析汇总表及维护触发器，并按现有数据回填
+def _add_spending_rollup(c):
+    analytics.create_schema(c)
+    analytics.rebuild(c)
+
+
+# 迁移列表: (版本号, 说明, 执行函数)，版本号必须连续递增
+MIGRATIONS = [
+    (1, '为发票号码、附件和后台筛选字段建立索引', _add_lookup_indexes),
+    (2, '为后台列表所有可排序字段建立索引（游标分页）', _add_sort_indexes),
+    (3, '建立按状态/使用途径统计的汇总表及触发器', _add_summary_table),
+    (4, '建立 FTS5 全文索引（trigram 分词）及同步触发器', _add_fulltext_index),
+    (5, '建立数据版本号及维护触发器', _add_data_version),
+    (6, '建立后台导出任务表', _add_export_jobs),
+    (7, '附件增加内容哈希列（内容寻址存储与重复检测）', _add_attachment_hashes),
+    (8, '建立发票号码版本号及维护触发器', _add_invoice_version),
+    (9, '建立已报销申请归档表及发票号码跨表唯一触发器', _add_archive_tables),
+    (10, '建立支出分析汇总表及触发器', _add_spending_rollup),
+]
+
+
+def get_version(conn):
+    if db.dialect(conn) == 'postgresql':
+        return postgres.get_schema_version(conn)
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+# 执行所有未执行的迁移，返回执行后的版本号
+def run_migrations(conn, migrations=MIGRATIONS):
+    if db.dialect(conn) == 'postgresql':
+        return postgres.run_migrations(conn)
+    applied = []
+    for version, description, migrate in migrations:
+        if get_version(conn) >= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 拿到写锁后再次确认，可能已被其他进程执行
+            if get_version(conn) >= version:
+                conn.execute('ROLLBACK')
+                continue
+            c = conn.cursor()
+            migrate(c)
+            c.execute(f'PRAGMA user_version = {int(version)}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            logger.exception(f"数据库迁移失败: 版本 {version} - {description}")
+            raise
+        applied.append(version)
+        logger.info(f"数据库迁移完成: 版本 {version} - {description}")
+    if applied:
+        # 更新统计信息，让查询规划器使用新索引
+        conn.execute('PRAGMA optimize')
+    return get_version(conn)
+
+
+# 查询计划是否走索引：数据表没有全表扫描，ORDER BY / GROUP BY 不需要临时排序（有索引时可以边读边返回）。
+# 以下扫描不计入: 子查询结果（CO-ROUTINE / MATERIALIZE，行数已由子查询限定）、临时表（保存本次请求的输入）；
+# 全文检索按相关度排序时只对匹配结果排序，允许临时排序；DISTINCT 的临时表只保存索引查到的行
+def plan_uses_index(plan, temp_tables=(), fts=False):
+    derived = set(temp_tables)
+    for detail in plan:
+        for prefix in ('CO-ROUTINE ', 'MATERIALIZE '):
+            if detail.startswith(prefix):
+                derived.add(detail[len(prefix):].split()[0])
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'INDEX' not in detail:
+            name = detail.split()[1]
+            if name not in derived and name != 'SUBQUERY':
+                return False
+        if 'TEMP B-TREE' in detail and 'DISTINCT' not in detail and not fts:
+            return False
+    return True
+
+
+# 对 {名称: (SQL, 参数)} 逐条执行 EXPLAIN QUERY PLAN（各路由的查询见 app.route_queries），
+# setup 为先执行的语句（例如查询用到的临时表）。
+# 返回 {名称: (是否走索引, 查询计划)}
+def explain_route_queries(conn, queries, setup=()):
+    results = {}
+    fts_available = search.is_available(conn.cursor())
+    for sql in setup:
+        conn.execute(sql)
+    temp_tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_temp_master WHERE type = 'table'")]
+    for name, (sql, params) in queries.items():
+        fts = search.FTS_TABLE in sql
+        if fts and not fts_available:
+            continue
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        results[name] = (plan_uses_index(plan, temp_tables, fts), plan)
+    return results
@@ -0,0 +1,89 @@
+# 阻塞操作卸载
+# gevent worker 中所有请求共用一个操作系统线程，sqlite3 查询和提交、上传文件的哈希计算和写入、
+# Excel 生成等调用执行期间不会让出控制权，同一 worker 的其他请求全部停顿。
+# 启用后这些调用交给有上限的原生线程池（gevent.threadpool）执行，当前协程等待结果时 gevent 继续调度其他请求。
+# 不在 gevent 下运行（sync / gthread worker、命令行）或已经在线程池中时直接调用，没有额外开销。
+# PostgreSQL 驱动（psycopg 3）在 gevent 下本身会让出控制权，不需要卸载
+import os
+import sys
+
+_enabled = True
+_max_workers = 8
+_pool = None
+_pool_pid = None
+# 线程池中线程的原生线程号（在这些线程中再次调用 run 时直接执行）
+_pool_threads = set()
+_get_ident = None
+
+
+def configure(enabled=True, max_workers=8):
+    global _enabled, _max_workers, _pool_pid
+    _enabled = enabled
+    _max_workers = max_workers
+    _pool_pid = None
+
+
+def _gevent_patched():
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('socket')
+
+
+# 线程池在首次使用时按进程创建；gunicorn 在 worker 中打补丁，--preload 时主进程导入应用时尚未打补丁
+def _get_pool():
+    global _pool, _pool_pid, _get_ident
+    if _pool_pid == os.getpid():
+        return _pool
+    _pool = None
+    if _enabled and _gevent_patched():
+        from gevent import monkey
+        from gevent.threadpool import ThreadPool
+        _get_ident = monkey.get_original('_thread', 'get_ident')
+        _pool = ThreadPool(_max_workers)
+        _pool_threads.clear()
+    _pool_pid = os.getpid()
+    return _pool
+
+
+def enabled():
+    return _get_pool() is not None
+
+
+def _call_in_pool(fn, args, kwargs):
+    _pool_threads.add(_get_ident())
+    return fn(*args, **kwargs)
+
+
+# 在线程池中执行 fn 并等待结果（异常原样抛出）
+def run(fn, *args, **kwargs):
+    pool = _get_pool()
+    if pool is None or _get_ident() in _pool_threads:
+        return fn(*args, **kwargs)
+    return pool.apply(_call_in_pool, (fn, args, kwargs))
+
+
+# 逐项在线程池中推进迭代器（用于流式响应: 生成每一块数据的工作都在线程池中完成）
+def iterate(iterable):
+    if _get_pool() is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while True:
+            item = run(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            run(close)
+
+
+def stats():
+    pool = _get_pool()
+    if pool is None:
+        return {'enabled': False}
+    return {'enabled': True, 'max_workers': _max_workers, 'threads': pool.size, 'pending': pool.task_queue.qsize()}
@@ -0,0 +1,131 @@
+# 操作日志
+# 请求线程只把日志记录放入队列（QueueHandler），由后台线程（QueueListener）格式化为 JSON 并写入文件和控制台，
+# 请求不再等待文件写入和日志轮转加锁。
+# 每条操作日志是一行 JSON，结构化字段（route、user、app_number、duration_ms、outcome 等）放在顶层
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone, timedelta
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, BEIJING_TZ).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event:
+            entry.update(event)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# 队列处理器：后台线程在首次写日志时按进程启动（gunicorn --preload 时 fork 前启动的线程不会带到 worker 中）
+class ProcessQueueHandler(QueueHandler):
+    def __init__(self, handlers):
+        super().__init__(queue.SimpleQueue())
+        self.targets = handlers
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # fork 后继承的队列和监听线程不可用，重新创建
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # 异常堆栈在请求线程中格式化（只在出错时发生），其余格式化工作交给后台线程
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+
+# 为 logger 配置 JSON 文件日志和控制台日志；queued=False 时在请求线程中同步写入
+def setup(logger, path, max_bytes=10 * 1024 * 1024, backup_count=5, queued=True, level=logging.INFO):
+    formatter = JsonFormatter()
+    file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    console_handler = logging.StreamHandler(sys.stderr)
+    handlers = [file_handler, console_handler]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.setLevel(level)
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        if isinstance(handler, ProcessQueueHandler):
+            handler.stop()
+    if queued:
+        logger.addHandler(ProcessQueueHandler(handlers))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+    logger.setLevel(level)
+    return logger
+
+
+# 停止后台写日志线程并写完队列中的剩余记录（进程退出时调用）
+def shutdown(logger):
+    for handler in logger.handlers:
+        if isinstance(handler, ProcessQueueHandler):
+            handler.stop()
+
+
+# 日志中表单字段值的最大长度（字符），超出部分截断并注明原长度；密码等字段不记录值
+FORM_VALUE_MAX_LENGTH = 64
+SECRET_FIELDS = frozenset({'password'})
+
+
+# 日志中记录的表单摘要: 字段名全部保留，值截断到 max_length
+def form_summary(form, max_length=FORM_VALUE_MAX_LENGTH):
+    summary = {}
+    for key, value in form.items():
+        if key in SECRET_FIELDS:
+            value = '***'
+        elif len(value) > max_length:
+            value = f'{value[:max_length]}…({len(value)} 字符)'
+        summary[key] = value
+    return summary
+
+
+# 解析采样率配置，例如 "check_invoice_number=0.1,query_status=0.5"
+def parse_sample_rates(value):
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        endpoint, rate = item.split('=', 1)
+        rates[endpoint.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
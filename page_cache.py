@@ -0,0 +1,142 @@
+# 后台页面响应缓存
+# 以 (路由, 路由参数, 规范化的查询参数) 为键缓存渲染好的页面，每项记录渲染时的数据版本号
+# （meta.data_version，applications / attachments 的任何写入都由触发器加一，见迁移 5），版本号变化即失效。
+# 每次请求读取一次版本号（主键查询），因此其他 worker 的写入无需额外通知。
+# 响应带内容哈希 ETag，浏览器重新验证时页面未变化返回 304。
+# 每项同时保存按编码（br / gzip）压缩好的页面，命中时直接返回，不再重复压缩。
+# 缓存后端为 Redis 时另有一层共享缓存: 本 worker 未命中时读取其他 worker 渲染好的页面
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# 规范化查询参数: 忽略空值和参数顺序
+def cache_key(endpoint, view_args, args):
+    return (endpoint,
+            tuple(sorted((view_args or {}).items())),
+            tuple(sorted((key, value) for key, value in args.items(multi=True) if value)))
+
+
+def content_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def shared_key(key):
+    return 'page:' + hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+
+
+# 共享缓存中的值: b'<数据版本号> <ETag> ' + 页面内容
+def _pack(version, etag, body):
+    return f'{version} {etag} '.encode() + body
+
+
+def _unpack(data):
+    version, etag, body = data.split(b' ', 2)
+    return int(version), etag.decode(), body
+
+
+# 按条数和总字节数限制的 LRU 缓存；值为 (数据版本号, ETag, 页面内容, {编码: 压缩后的内容})，
+# 总字节数包括压缩后的内容
+# shared 为共享缓存后端（见 cache_backend.py），其中的项 shared_ttl 秒后过期
+class ResponseCache:
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, shared=None, shared_ttl=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.shared_hits = 0
+
+    # 返回 (ETag, 页面内容, 来源 'hit' / 'shared_hit')；不存在或版本号已变化时返回 None
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2], 'hit'
+            if entry is not None:
+                self._remove(key)
+                self.stale += 1
+        if self.shared is not None:
+            data = self.shared.get(shared_key(key))
+            if data is not None:
+                shared_version, etag, body = _unpack(data)
+                if shared_version == version:
+                    self._store(key, version, etag, body)
+                    with self._lock:
+                        self.shared_hits += 1
+                    return etag, body, 'shared_hit'
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, version, body):
+        etag = content_etag(body)
+        # 超过总容量八分之一的页面不缓存，避免一项挤掉其他所有页面
+        if len(body) > self.max_bytes // 8:
+            return etag
+        self._store(key, version, etag, body)
+        if self.shared is not None:
+            self.shared.set(shared_key(key), _pack(version, etag, body), ttl=self.shared_ttl)
+        return etag
+
+    # 缓存项 ETag 为 etag 时按 encoding 压缩好的页面，没有时返回 None
+    def get_variant(self, key, etag, encoding):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == etag:
+                return entry[3].get(encoding)
+            return None
+
+    # 为 ETag 为 etag 的缓存项保存压缩好的页面；缓存项已被替换或移除时不保存
+    def set_variant(self, key, etag, encoding, data):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != etag or encoding in entry[3]:
+                return
+            entry[3][encoding] = data
+            self._bytes += len(data)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _store(self, key, version, etag, body):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, etag, body, {})
+            self._bytes += len(body)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, _, body, variants = self._entries.pop(key)
+        self._bytes -= len(body) + sum(len(data) for data in variants.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'shared_hits': self.shared_hits,
+                'hit_rate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            }
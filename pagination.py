@@ -0,0 +1,129 @@
+# 后台列表分页
+# 游标（keyset）分页：按 (排序字段, id) 定位上一页最后一行，用 WHERE (col, id) < (?, ?)
+# 代替 OFFSET，翻到第几页代价都相同；以及总数的精确缓存 / 近似计数
+import base64
+import json
+import threading
+import time
+
+
+# 游标编码为不透明的 URL 安全字符串，包含排序字段、方向、定位行和翻页方向
+def encode_cursor(sort_field, sort_order, value, row_id, direction):
+    payload = json.dumps([sort_field, sort_order, value, row_id, direction],
+                         ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+# 解析游标，格式不正确时返回 None（按第一页处理）
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_field, sort_order, value, row_id, direction = json.loads(
+            base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    if direction not in ('next', 'prev') or not isinstance(row_id, int):
+        return None
+    return {'sort': sort_field, 'order': sort_order, 'value': value,
+            'id': row_id, 'direction': direction}
+
+
+# 游标分页一页的查询语句和参数（多取一行用于判断是否还有下一页），cursor 须与当前排序一致
+def keyset_query(query, params, sort_field, sort_order, per_page, cursor=None):
+    backward = cursor is not None and cursor['direction'] == 'prev'
+    # 向前翻页时反向扫描，取到结果后再倒序
+    scan_desc = (sort_order == 'desc') != backward
+    order_sql = 'DESC' if scan_desc else 'ASC'
+    sql = query
+    args = list(params)
+    if cursor is not None:
+        sql += f" AND ({sort_field}, id) {'<' if scan_desc else '>'} (?, ?)"
+        args += [cursor['value'], cursor['id']]
+    sql += f' ORDER BY {sort_field} {order_sql}, id {order_sql} LIMIT ?'
+    args.append(per_page + 1)
+    return sql, args
+
+
+# 执行一页游标查询
+# query/params 为不含 ORDER BY 的 SELECT 语句（需包含 WHERE 子句），column_index 为排序字段在结果行中的位置
+# 返回 (rows, next_cursor, prev_cursor)
+def keyset_page(c, query, params, sort_field, sort_order, column_index, per_page, cursor=None, id_index=0):
+    # 游标与当前排序不一致时（例如切换了排序）从第一页开始
+    if cursor and (cursor['sort'] != sort_field or cursor['order'] != sort_order):
+        cursor = None
+
+    backward = cursor is not None and cursor['direction'] == 'prev'
+    c.execute(*keyset_query(query, params, sort_field, sort_order, per_page, cursor))
+    rows = c.fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+
+    if cursor is None:
+        has_prev, has_next = False, has_more
+    elif backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = True, has_more
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_field, sort_order, last[column_index], last[id_index], 'next')
+    if rows and has_prev:
+        first = rows[0]
+        prev_cursor = encode_cursor(sort_field, sort_order, first[column_index], first[id_index], 'prev')
+    return rows, next_cursor, prev_cursor
+
+
+# 精确计数和近似计数的语句，{from_where} 为筛选条件的 FROM / WHERE 子句
+COUNT_QUERY = 'SELECT COUNT(*) {from_where}'
+CAPPED_COUNT_QUERY = 'SELECT COUNT(*) FROM (SELECT 1 {from_where} LIMIT ?) AS capped'
+
+
+# 近似计数：最多数到 cap 条，超过时返回 (cap, True)，代价与表大小无关
+def capped_count(c, from_where_sql, params, cap):
+    c.execute(CAPPED_COUNT_QUERY.format(from_where=from_where_sql), list(params) + [cap + 1])
+    count = c.fetchone()[0]
+    if count > cap:
+        return cap, True
+    return count, False
+
+
+# 按筛选条件缓存精确总数，过期时间 ttl 秒，最多保留 max_entries 条；
+# 传入数据版本号 version 时版本号也是键的一部分，数据变化后不再返回旧的总数
+class CountCache:
+    def __init__(self, ttl=30, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_count(self, c, from_where_sql, params, version=None):
+        key = (from_where_sql, tuple(params), version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        c.execute(COUNT_QUERY.format(from_where=from_where_sql), params)
+        count = c.fetchone()[0]
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # 先清理过期项，仍然超出时丢弃最早写入的一项
+                self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (count, now + self.ttl)
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,659 @@
+# PostgreSQL 数据库后端
+# DATABASE 配置为 postgresql://... 时使用，连接由 SQLAlchemy 引擎的连接池管理（每个 worker 进程一个引擎）。
+# 路由中的 SQL 按 SQLite 语法编写，PgConnection / PgCursor 提供与 sqlite3 相同的接口，执行前转换方言:
+#   - 占位符 ? 改为 %s（字面量中的 % 转义为 %%）
+#   - INSERT OR IGNORE 改为 INSERT ... ON CONFLICT DO NOTHING
+#   - LIKE 改为 ILIKE（与 SQLite 的 LIKE 一样不区分大小写）
+#   - BEGIN / BEGIN IMMEDIATE 不执行（驱动在第一条语句前自动开启事务），COMMIT / ROLLBACK 调用连接的方法，
+#     PRAGMA 不执行。BEGIN IMMEDIATE 在 SQLite 上持有的写锁没有对应物，读取后写入的事务用 db.for_update 锁定读到的行
+# 表结构、索引和触发器由 create_schema 一次建立（与 SQLite 迁移到最新版本后的结构一致），
+# 全文检索没有对应的实现，搜索使用 ILIKE。
+# 数据版本号和发票号码版本号不放在 meta 的单行中（每个写事务都要更新同一行，行锁使所有写事务串行），
+# 而是保存在 version_counters 中按连接分片计数，版本号为各分片之和（见 db.get_version）
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import analytics
+import archive
+import db
+import summary
+
+# 与 SQLite 迁移版本号对应的结构版本，记录在 meta.schema_version 中
+# （11: 版本号改为 version_counters 分片计数，SQLite 没有对应的迁移）
+SCHEMA_VERSION = 11
+
+# 结构变更期间持有的事务级咨询锁（多个 worker / 节点同时启动时只有一个执行）
+SCHEMA_LOCK_ID = 7261001
+
+# 日期沿用 SQLite 中 'YYYY-MM-DD' 形式的文本，比较和排序结果与 SQLite 一致；
+# created_at / updated_at 默认值与 SQLite 的 CURRENT_TIMESTAMP 一样为 UTC 时间文本
+_NOW_TEXT = "to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')"
+
+# 由触发器维护的版本号及每个版本号的分片数。触发器只加一本连接（pg_backend_pid()）对应的分片，
+# 不同连接上的写事务一般更新不同的行，同一事务内始终是同一行（不会相互死锁）；计数随事务提交或回滚，
+# 读取到的版本号与同一快照中的数据一致（nextval 不随事务回滚，读取时可能包含尚未提交的写入）
+VERSION_KEYS = ('data_version', 'invoice_version')
+VERSION_SHARDS = 64
+
+TABLES = {
+    'applications': f'''CREATE TABLE IF NOT EXISTS applications (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        app_number TEXT UNIQUE NOT NULL,
+        purchaser TEXT NOT NULL,
+        purchase_details TEXT,
+        item_name TEXT NOT NULL,
+        product_link TEXT,
+        usage_type TEXT NOT NULL,
+        item_type TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        purchase_time TEXT NOT NULL,
+        invoice_number TEXT NOT NULL,
+        invoice_amount DOUBLE PRECISION NOT NULL,
+        invoice_date TEXT NOT NULL,
+        status TEXT DEFAULT '待审批',
+        approval_comment TEXT,
+        created_at TEXT DEFAULT {_NOW_TEXT},
+        updated_at TEXT DEFAULT {_NOW_TEXT}
+    )''',
+    # 与 SQLite 一致不声明外键（SQLite 未开启 foreign_keys，外键约束从未生效）
+    'attachments': '''CREATE TABLE IF NOT EXISTS attachments (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        app_number TEXT NOT NULL,
+        original_filename TEXT NOT NULL,
+        stored_filename TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        content_hash TEXT
+    )''',
+    'admins': '''CREATE TABLE IF NOT EXISTS admins (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    )''',
+    'meta': '''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value BIGINT NOT NULL
+    )''',
+    'version_counters': '''CREATE TABLE IF NOT EXISTS version_counters (
+        name TEXT NOT NULL,
+        shard INTEGER NOT NULL,
+        value BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (name, shard)
+    )''',
+    'export_jobs': '''CREATE TABLE IF NOT EXISTS export_jobs (
+        id TEXT PRIMARY KEY,
+        cache_key TEXT NOT NULL,
+        format TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        progress_rows BIGINT NOT NULL DEFAULT 0,
+        total_rows BIGINT,
+        file_path TEXT,
+        error TEXT,
+        data_version BIGINT NOT NULL,
+        created_by TEXT,
+        created_at DOUBLE PRECISION NOT NULL,
+        heartbeat_at DOUBLE PRECISION NOT NULL,
+        finished_at DOUBLE PRECISION
+    )''',
+    # 已报销申请归档表（与 SQLite 迁移 9 相同，id 沿用原表的值，不自动生成）
+    archive.ARCHIVE_TABLE: f'''CREATE TABLE IF NOT EXISTS {archive.ARCHIVE_TABLE} (
+        id BIGINT PRIMARY KEY,
+        app_number TEXT UNIQUE NOT NULL,
+        purchaser TEXT NOT NULL,
+        purchase_details TEXT,
+        item_name TEXT NOT NULL,
+        product_link TEXT,
+        usage_type TEXT NOT NULL,
+        item_type TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        purchase_time TEXT NOT NULL,
+        invoice_number TEXT NOT NULL,
+        invoice_amount DOUBLE PRECISION NOT NULL,
+        invoice_date TEXT NOT NULL,
+        status TEXT,
+        approval_comment TEXT,
+        created_at TEXT,
+        updated_at TEXT,
+        archived_at TEXT NOT NULL
+    )''',
+    archive.ATTACHMENT_ARCHIVE_TABLE: f'''CREATE TABLE IF NOT EXISTS {archive.ATTACHMENT_ARCHIVE_TABLE} (
+        id BIGINT PRIMARY KEY,
+        app_number TEXT NOT NULL,
+        original_filename TEXT NOT NULL,
+        stored_filename TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        content_hash TEXT
+    )''',
+    'application_summary': '''CREATE TABLE IF NOT EXISTS application_summary (
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        app_count BIGINT NOT NULL DEFAULT 0,
+        amount_cents BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, value)
+    )''',
+    analytics.ROLLUP_TABLE: f'''CREATE TABLE IF NOT EXISTS {analytics.ROLLUP_TABLE} (
+        month TEXT NOT NULL,
+        usage_type TEXT NOT NULL,
+        item_type TEXT NOT NULL,
+        purchaser TEXT NOT NULL,
+        status TEXT NOT NULL,
+        app_count BIGINT NOT NULL DEFAULT 0,
+        amount_cents BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, usage_type, item_type, purchaser, status)
+    )''',
+}
+
+# 与 SQLite 迁移 1、2、6、7、9 建立的索引相同（发票号码唯一索引见 _index_invoice_number）
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_attachments_app_number ON attachments (app_number)',
+    'CREATE INDEX IF NOT EXISTS idx_attachments_stored_filename ON attachments (stored_filename)',
+    'CREATE INDEX IF NOT EXISTS idx_attachments_content_hash ON attachments (content_hash)',
+    'CREATE INDEX IF NOT EXISTS idx_attachments_file_path ON attachments (file_path)',
+    'CREATE INDEX IF NOT EXISTS idx_applications_created_at ON applications (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_applications_status_created_at ON applications (status, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_applications_usage_type_created_at ON applications (usage_type, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_applications_invoice_date ON applications (invoice_date, id)',
+    'CREATE INDEX IF NOT EXISTS idx_applications_purchase_time ON applications (purchase_time, id)',
+    # PostgreSQL 索引条目不含隐式的 id，游标分页的 (字段, id) 需要显式建立组合索引
+    *(f'CREATE INDEX IF NOT EXISTS idx_applications_{column} ON applications ({column}, id)'
+      for column in ('purchaser', 'item_name', 'invoice_amount', 'item_type', 'status')),
+    'CREATE INDEX IF NOT EXISTS idx_export_jobs_cache_key ON export_jobs (cache_key, data_version)',
+    'CREATE INDEX IF NOT EXISTS idx_export_jobs_finished_at ON export_jobs (finished_at)',
+    *archive.INDEXES,
+)
+
+
+def _summary_apply_sql(row, sign):
+    statements = []
+    for dimension in summary.SUMMARY_DIMENSIONS:
+        statements.append(
+            f"INSERT INTO application_summary (dimension, value, app_count, amount_cents) "
+            f"VALUES ('{dimension}', COALESCE({row}.{dimension}, ''), {sign}1, "
+            f"{sign}CAST(ROUND({row}.invoice_amount * 100) AS BIGINT)) "
+            f"ON CONFLICT (dimension, value) DO UPDATE SET "
+            f"app_count = application_summary.app_count + EXCLUDED.app_count, "
+            f"amount_cents = application_summary.amount_cents + EXCLUDED.amount_cents;")
+    return '\n        '.join(statements)
+
+
+def _rollup_apply_sql(row, sign):
+    dimensions = ', '.join(analytics.ROLLUP_DIMENSIONS)
+    values = ', '.join(analytics.dimension_expression(dimension, row) for dimension in analytics.ROLLUP_DIMENSIONS)
+    return (f"INSERT INTO {analytics.ROLLUP_TABLE} ({dimensions}, app_count, amount_cents) "
+            f"VALUES ({values}, {sign}1, {sign}CAST(ROUND({row}.invoice_amount * 100) AS BIGINT)) "
+            f"ON CONFLICT ({dimensions}) DO UPDATE SET "
+            f"app_count = {analytics.ROLLUP_TABLE}.app_count + EXCLUDED.app_count, "
+            f"amount_cents = {analytics.ROLLUP_TABLE}.amount_cents + EXCLUDED.amount_cents;")
+
+
+# 触发器函数，与 SQLite 的触发器（迁移 3、5、8、9、10）维护相同的数据
+FUNCTIONS = (
+    *(f'''CREATE OR REPLACE FUNCTION bump_{key}() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO version_counters (name, shard, value) VALUES ('{key}', pg_backend_pid() % {VERSION_SHARDS}, 1)
+        ON CONFLICT (name, shard) DO UPDATE SET value = version_counters.value + 1;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql''' for key in VERSION_KEYS),
+    f'''CREATE OR REPLACE FUNCTION check_invoice_not_archived() RETURNS trigger AS $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM {archive.ARCHIVE_TABLE} WHERE invoice_number = NEW.invoice_number) THEN
+            RAISE EXCEPTION '发票号码已存在于归档申请中: %', NEW.invoice_number USING ERRCODE = 'unique_violation';
+        END IF;
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql''',
+    f'''CREATE OR REPLACE FUNCTION apply_application_summary() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {_summary_apply_sql('OLD', '-')}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {_summary_apply_sql('NEW', '')}
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql''',
+    f'''CREATE OR REPLACE FUNCTION apply_spending_rollup() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {_rollup_apply_sql('OLD', '-')}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {_rollup_apply_sql('NEW', '')}
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql''',
+)
+
+# (触发器名, 表名, 定义)；数据版本号按语句加一（版本号只需在数据变化时改变，不必按行计数）
+TRIGGERS = (
+    ('trg_version_applications', 'applications',
+     'AFTER INSERT OR UPDATE OR DELETE ON applications FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()'),
+    ('trg_version_attachments', 'attachments',
+     'AFTER INSERT OR UPDATE OR DELETE ON attachments FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()'),
+    ('trg_invoice_version_update', 'applications',
+     'AFTER UPDATE OF invoice_number ON applications FOR EACH ROW '
+     'WHEN (OLD.invoice_number IS DISTINCT FROM NEW.invoice_number) EXECUTE FUNCTION bump_invoice_version()'),
+    ('trg_invoice_not_archived', 'applications',
+     'BEFORE INSERT OR UPDATE OF invoice_number ON applications FOR EACH ROW '
+     'EXECUTE FUNCTION check_invoice_not_archived()'),
+    ('trg_summary', 'applications',
+     'AFTER INSERT OR DELETE OR UPDATE OF status, usage_type, invoice_amount ON applications '
+     'FOR EACH ROW EXECUTE FUNCTION apply_application_summary()'),
+    ('trg_rollup', 'applications',
+     'AFTER INSERT OR DELETE OR UPDATE OF invoice_date, usage_type, item_type, purchaser, status, invoice_amount '
+     'ON applications FOR EACH ROW EXECUTE FUNCTION apply_spending_rollup()'),
+    ('trg_rollup_archive', archive.ARCHIVE_TABLE,
+     f'AFTER INSERT OR DELETE ON {archive.ARCHIVE_TABLE} FOR EACH ROW EXECUTE FUNCTION apply_spending_rollup()'),
+)
+
+
+_LIKE_RE = re.compile(r'\bLIKE\b', re.IGNORECASE)
+_INSERT_OR_IGNORE_RE = re.compile(r'\bINSERT\s+OR\s+IGNORE\s+INTO\b', re.IGNORECASE)
+
+
+# 把按 SQLite 语法编写的语句转换为 PostgreSQL 语句（只处理单引号字面量以外的部分）
+@functools.lru_cache(maxsize=1024)
+def translate(sql, has_params=True):
+    parts = sql.split("'")
+    ignore = False
+    for i in range(0, len(parts), 2):
+        part = parts[i]
+        if has_params:
+            part = part.replace('%', '%%').replace('?', '%s')
+        part = _LIKE_RE.sub('ILIKE', part)
+        part, count = _INSERT_OR_IGNORE_RE.subn('INSERT INTO', part)
+        ignore = ignore or bool(count)
+        parts[i] = part
+    sql = "'".join(parts)
+    if ignore:
+        sql = sql.rstrip().rstrip(';') + ' ON CONFLICT DO NOTHING'
+    return sql
+
+
+# 由连接自身处理、不发送到服务器的语句
+def _session_statement(sql):
+    words = sql.lstrip()[:24].upper().replace(';', ' ').split()
+    if not words:
+        return None
+    if words[0] in ('PRAGMA', 'BEGIN'):
+        return 'noop'
+    if words == ['COMMIT'] or words == ['END']:
+        return 'commit'
+    if words == ['ROLLBACK']:
+        return 'rollback'
+    return None
+
+
+class PgCursor:
+    def __init__(self, connection, cursor):
+        self.connection = connection
+        self._cursor = cursor
+        # 上一条语句没有发送到服务器（PRAGMA、BEGIN 等），读取结果时返回空
+        self._idle = False
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            action = _session_statement(sql)
+            if action is not None:
+                self._idle = True
+                if action == 'commit':
+                    self.connection.commit()
+                elif action == 'rollback':
+                    self.connection.rollback()
+                return self
+            self._idle = False
+            self._cursor.execute(translate(sql, bool(parameters)), tuple(parameters) if parameters else None)
+            return self
+        finally:
+            db._observe(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            self._idle = False
+            statement = translate(sql, True)
+            if self.connection.is_psycopg2:
+                # psycopg2 的 executemany 逐条往返，execute_batch 每批合并发送
+                from psycopg2.extras import execute_batch
+                execute_batch(self._cursor, statement, [tuple(p) for p in seq_of_parameters], page_size=500)
+            else:
+                self._cursor.executemany(statement, [tuple(p) for p in seq_of_parameters])
+            return self
+        finally:
+            db._observe(sql, started)
+
+    def fetchone(self):
+        return None if self._idle else self._cursor.fetchone()
+
+    def fetchall(self):
+        return [] if self._idle else self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        if self._idle:
+            return []
+        return self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+
+    def __iter__(self):
+        return iter(()) if self._idle else iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return -1 if self._idle else self._cursor.rowcount
+
+    @property
+    def description(self):
+        return None if self._idle else self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class PgConnection:
+    dialect = 'postgresql'
+
+    # raw 为 SQLAlchemy 连接池中的 DBAPI 连接代理，close() 时归还连接池
+    def __init__(self, raw):
+        self._raw = raw
+        driver = getattr(raw, 'driver_connection', raw)
+        self._driver = driver
+        self.is_psycopg2 = type(driver).__module__.startswith('psycopg2')
+
+    def cursor(self):
+        return PgCursor(self, self._raw.cursor())
+
+    # 服务器端游标，结果按批从服务器读取（导出大量数据时不在客户端缓存全部结果）
+    def streaming_cursor(self, fetch_size=1000):
+        cursor = self._raw.cursor(name=f'stream_{id(self):x}_{time.monotonic_ns():x}')
+        cursor.itersize = fetch_size
+        return PgCursor(self, cursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    @property
+    def in_transaction(self):
+        # psycopg2 / psycopg 的 transaction_status 均以 0 表示空闲（不在事务中）
+        return self._driver.info.transaction_status != 0
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        self._raw.close()
+
+    # 与 sqlite3.Connection 一致: 正常退出时提交，出现异常时回滚，不关闭连接
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+_engines_pid = os.getpid()
+
+
+# 每个进程每个 URL 一个引擎；fork 之后（例如 gunicorn --preload）丢弃从父进程继承的连接
+def get_engine(url, pool_size=5, max_overflow=10, pool_timeout=30):
+    global _engines_pid
+    with _engines_lock:
+        if _engines_pid != os.getpid():
+            for engine in _engines.values():
+                engine.dispose(close=False)
+            _engines_pid = os.getpid()
+        engine = _engines.get(url)
+        if engine is None:
+            from sqlalchemy import create_engine
+            # postgresql:// 使用 SQLAlchemy 的默认驱动 psycopg（3.x）；SQLAlchemy 不识别 postgres://
+            engine = create_engine(url.replace('postgres://', 'postgresql://', 1), pool_size=pool_size, max_overflow=max_overflow,
+                                   pool_timeout=pool_timeout, pool_pre_ping=True, pool_recycle=1800)
+            _engines[url] = engine
+        return engine
+
+
+# 建立一个独立连接（命令行、后台导出线程等请求之外的场景）
+def connect(url):
+    return PgConnection(get_engine(url).raw_connection())
+
+
+# 与 db.ConnectionPool 接口相同；连接数上限为 size + max_overflow，超出时等待 timeout 秒
+class PostgresPool:
+    def __init__(self, url, size=5, max_overflow=10, timeout=30):
+        self.database = url
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'peak_in_use': 0,
+            'wait_time_total': 0.0,
+        }
+
+    def _engine(self):
+        return get_engine(self.database, self.size, self.max_overflow, self.timeout)
+
+    def acquire(self):
+        started = time.perf_counter()
+        conn = PgConnection(self._engine().raw_connection())
+        with self._lock:
+            if self._pid != os.getpid():
+                self._in_use = 0
+                self._pid = os.getpid()
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+            self._stats['wait_time_total'] += time.perf_counter() - started
+        return conn
+
+    # 归还时连接池会回滚未提交的事务
+    def release(self, conn):
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._in_use = max(self._in_use - 1, 0)
+
+    def close_all(self):
+        self._engine().dispose()
+
+    def stats(self):
+        engine = self._engine()
+        pool = engine.pool
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'database': engine.url.render_as_string(hide_password=True),
+                'pid': self._pid,
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'idle': pool.checkedin(),
+                'in_use': self._in_use,
+                'overflow': max(pool.overflow(), 0),
+            })
+        checkouts = stats['checkouts']
+        stats['avg_checkout_ms'] = round(stats['wait_time_total'] / checkouts * 1000, 4) if checkouts else 0.0
+        del stats['wait_time_total']
+        return stats
+
+
+# 版本号从 meta 移到 version_counters（结构版本 11 之前保存在 meta 中，延续原值，不让版本号变小）
+def create_tables(c):
+    for sql in TABLES.values():
+        c.execute(sql)
+    for key in VERSION_KEYS:
+        c.execute('''INSERT OR IGNORE INTO version_counters (name, shard, value)
+                     SELECT ?, 0, COALESCE((SELECT value FROM meta WHERE key = ?), 0)''', (key, key))
+        c.execute('DELETE FROM meta WHERE key = ?', (key,))
+
+
+# 已有数据中存在重复发票号码时退化为普通索引（与 SQLite 迁移 1 相同）
+def _index_invoice_number(c):
+    c.execute('''SELECT invoice_number FROM applications
+                 GROUP BY invoice_number HAVING COUNT(*) > 1 LIMIT 5''')
+    unique = '' if c.fetchall() else 'UNIQUE '
+    c.execute(f'CREATE {unique}INDEX IF NOT EXISTS idx_applications_invoice_number '
+              'ON applications (invoice_number)')
+
+
+def create_indexes(c):
+    _index_invoice_number(c)
+    for sql in INDEXES:
+        c.execute(sql)
+
+
+def drop_triggers(c):
+    for name, table, _ in TRIGGERS:
+        c.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+
+
+def create_triggers(c):
+    for sql in FUNCTIONS:
+        c.execute(sql)
+    drop_triggers(c)
+    for name, _, definition in TRIGGERS:
+        c.execute(f'CREATE TRIGGER {name} {definition}')
+
+
+def create_schema(c):
+    create_tables(c)
+    create_indexes(c)
+    create_triggers(c)
+
+
+def get_schema_version(conn):
+    c = conn.cursor()
+    c.execute("SELECT to_regclass('meta') IS NOT NULL")
+    if not c.fetchone()[0]:
+        return 0
+    c.execute("SELECT value FROM meta WHERE key = 'schema_version'")
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+def _set_schema_version(c, version):
+    c.execute('''INSERT INTO meta (key, value) VALUES ('schema_version', ?)
+                 ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value''', (version,))
+
+
+# 结构落后于 SCHEMA_VERSION 时重新执行 create_schema（各语句均可重复执行），返回执行后的版本号
+def run_migrations(conn):
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        conn.rollback()
+        return SCHEMA_VERSION
+    c = conn.cursor()
+    try:
+        c.execute('SELECT pg_advisory_xact_lock(?)', (SCHEMA_LOCK_ID,))
+        if get_schema_version(conn) < SCHEMA_VERSION:
+            create_schema(c)
+            summary.rebuild(c)
+            analytics.rebuild(c)
+            _set_schema_version(c, SCHEMA_VERSION)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return SCHEMA_VERSION
+
+
+# 需要复制的表（导出任务只是缓存，不复制；汇总表和支出分析汇总表在复制后重建）
+COPY_TABLES = ('applications', 'attachments', 'admins', archive.ARCHIVE_TABLE, archive.ATTACHMENT_ARCHIVE_TABLE)
+
+
+def _sqlite_columns(src, table):
+    return [row[1] for row in src.execute(f'PRAGMA table_info({table})')]
+
+
+def _pg_columns(c, table):
+    c.execute('SELECT column_name FROM information_schema.columns '
+              'WHERE table_schema = current_schema() AND table_name = ?', (table,))
+    return {row[0] for row in c.fetchall()}
+
+
+def _copy_table(src, c, table, batch_size, progress):
+    target_columns = _pg_columns(c, table)
+    columns = [column for column in _sqlite_columns(src, table) if column in target_columns]
+    column_list = ', '.join(columns)
+    # 多行 VALUES 一次插入，单条语句的参数个数保持在 PostgreSQL 协议上限（65535）以内
+    rows_per_statement = max(1, min(batch_size, 60000 // len(columns)))
+    row_placeholder = f"({', '.join('?' * len(columns))})"
+    copied = 0
+    last_id = 0
+    while True:
+        rows = src.execute(f'SELECT {column_list} FROM {table} WHERE id > ? ORDER BY id LIMIT ?',
+                           (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        for start in range(0, len(rows), rows_per_statement):
+            chunk = rows[start:start + rows_per_statement]
+            c.execute(f"INSERT INTO {table} ({column_list}) VALUES {', '.join([row_placeholder] * len(chunk))}",
+                      [value for row in chunk for value in row])
+        last_id = rows[-1][columns.index('id')]
+        copied += len(rows)
+        if progress is not None:
+            progress(table, copied)
+    # 显式写入 id 后，把自增序列调到最大 id 之后
+    c.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+              f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)")
+    return copied
+
+
+# 把 SQLite 数据库按批复制到 PostgreSQL（目标库中不能已有申请数据），整个复制在一个事务中完成，
+# 失败时目标库保持原样。复制期间不启用触发器，完成后重建汇总表和支出分析汇总表、写入版本号并核对行数。
+# 返回 {表名: 行数}
+def copy_from_sqlite(sqlite_path, url, batch_size=5000, progress=None):
+    src = sqlite3.connect(f'file:{sqlite_path}?mode=ro', uri=True)
+    conn = connect(url)
+    try:
+        c = conn.cursor()
+        c.execute('SELECT pg_advisory_xact_lock(?)', (SCHEMA_LOCK_ID,))
+        create_tables(c)
+        c.execute('SELECT COUNT(*) FROM applications')
+        if c.fetchone()[0]:
+            raise ValueError('目标数据库中已有申请数据，请使用空数据库')
+        drop_triggers(c)
+        # 初始化时创建的默认管理员以源数据库为准
+        c.execute('DELETE FROM admins')
+        c.execute('DELETE FROM attachments')
+        counts = {table: _copy_table(src, c, table, batch_size, progress) for table in COPY_TABLES}
+
+        c.execute('DELETE FROM version_counters')
+        for key in VERSION_KEYS:
+            row = src.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            c.execute('INSERT INTO version_counters (name, shard, value) VALUES (?, 0, ?)',
+                      (key, row[0] if row else 0))
+        create_indexes(c)
+        create_triggers(c)
+        summary.rebuild(c)
+        analytics.rebuild(c)
+        _set_schema_version(c, SCHEMA_VERSION)
+
+        for table, copied in counts.items():
+            c.execute(f'SELECT COUNT(*) FROM {table}')
+            if c.fetchone()[0] != copied:
+                raise RuntimeError(f'{table} 行数不一致，已回滚')
+        conn.commit()
+        return counts
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        src.close()
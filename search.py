@@ -0,0 +1,83 @@
+# 全文检索
+# applications_fts 是 applications 的外部内容 FTS5 表（trigram 分词，适合中文子串搜索），
+# 覆盖购买人、物品名称、商品参数及用途说明三列，由触发器与 applications 保持同步。
+# trigram 只能匹配至少 3 个字符的检索词，更短的检索词以及不支持 FTS5 的 SQLite 退回 LIKE 查询
+import logging
+import sqlite3
+
+import db
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'applications_fts'
+FTS_COLUMNS = ('purchaser', 'item_name', 'purchase_details')
+MIN_TRIGRAM_LENGTH = 3
+
+TRIGGERS = {
+    'trg_fts_insert': f'''
+CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON applications
+BEGIN
+    INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)})
+    VALUES (NEW.id, {', '.join('NEW.' + col for col in FTS_COLUMNS)});
+END''',
+    'trg_fts_delete': f'''
+CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON applications
+BEGIN
+    INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+    VALUES ('delete', OLD.id, {', '.join('OLD.' + col for col in FTS_COLUMNS)});
+END''',
+    'trg_fts_update': f'''
+CREATE TRIGGER IF NOT EXISTS trg_fts_update
+AFTER UPDATE OF {', '.join(FTS_COLUMNS)} ON applications
+BEGIN
+    INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+    VALUES ('delete', OLD.id, {', '.join('OLD.' + col for col in FTS_COLUMNS)});
+    INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)})
+    VALUES (NEW.id, {', '.join('NEW.' + col for col in FTS_COLUMNS)});
+END''',
+}
+
+# 每个进程缓存一次检测结果
+_available = None
+
+
+# 创建 FTS 表和同步触发器并从现有数据建立索引（由迁移调用）
+# 当前 SQLite 不支持 FTS5 或 trigram 分词时跳过，搜索自动退回 LIKE
+def create_schema(c):
+    try:
+        c.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+                      USING fts5({', '.join(FTS_COLUMNS)}, content='applications', content_rowid='id',
+                                 tokenize='trigram')''')
+    except sqlite3.OperationalError as e:
+        logger.warning(f"SQLite 不支持 FTS5 trigram 分词，全文检索将使用 LIKE: {e}")
+        return
+    for sql in TRIGGERS.values():
+        c.execute(sql)
+    rebuild(c)
+
+
+# 从 applications 全量重建全文索引
+def rebuild(c):
+    c.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+
+
+# PostgreSQL 没有 FTS5，总是使用 LIKE（转换为 ILIKE）
+def is_available(c):
+    global _available
+    if db.dialect(c.connection) != 'sqlite':
+        return False
+    if _available is None:
+        c.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,))
+        _available = c.fetchone()[0] > 0
+    return _available
+
+
+# 检索词（按空白拆分后的每一项）能否全部使用 trigram 索引
+def can_use_index(terms):
+    return bool(terms) and all(len(term) >= MIN_TRIGRAM_LENGTH for term in terms)
+
+
+# 构造 FTS5 MATCH 表达式：每个检索词作为一个短语（子串匹配），多个检索词同时满足，可限定列
+def match_expression(terms, column=None):
+    phrases = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+    return f'{column} : ({phrases})' if column else phrases
@@ -0,0 +1,85 @@
+# 服务器端会话（SESSION_STORE=server）
+# cookie 中只保存签名的随机会话编号，会话数据保存在缓存后端中（Redis 时所有 worker / 节点共享）。
+# 退出登录时删除服务器上的会话数据，旧 cookie 即使被复制也不能继续使用；登录成功后更换会话编号，防止会话固定
+import secrets
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # 更换会话编号后需要删除的旧编号
+        self.previous_sid = None
+
+
+class BackendSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend, key_prefix='session:'):
+        self.backend = backend
+        self.key_prefix = key_prefix
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session')
+
+    def _new_session(self):
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self._new_session()
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return self._new_session()
+        data = self.backend.get(self.key_prefix + sid)
+        if data is None:
+            return self._new_session()
+        return ServerSession(self.serializer.loads(data.decode('utf-8')), sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.previous_sid:
+            self.backend.delete(self.key_prefix + session.previous_sid)
+        if not session:
+            # 会话被清空（如退出登录）: 删除服务器上的数据和 cookie
+            if session.modified:
+                self.backend.delete(self.key_prefix + session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+        response.vary.add('Cookie')
+        if not self.should_set_cookie(app, session):
+            return
+        self.backend.set(self.key_prefix + session.sid,
+                         self.serializer.dumps(dict(session)).encode('utf-8'),
+                         ttl=app.permanent_session_lifetime.total_seconds())
+        response.set_cookie(name, self._signer(app).sign(session.sid).decode(),
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                            partitioned=self.get_cookie_partitioned(app))
+
+
+# 更换当前会话的编号（登录成功后调用），签名 cookie 会话无需处理
+def regenerate(session):
+    if isinstance(session, ServerSession):
+        if not session.new:
+            session.previous_sid = session.sid
+        session.sid = secrets.token_urlsafe(32)
+        session.modified = True
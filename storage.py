@@ -0,0 +1,269 @@
+# 附件内容寻址存储
+# 上传文件边写入临时文件边计算 SHA-256，按内容哈希保存（相同内容只保存一份）。
+# 文件按哈希前缀分散到两级子目录（uploads/ab/cd/<哈希>.<扩展名>），单个目录内文件数保持在较小规模；
+# 文件名由内容决定，用硬链接原子创建（目标已存在时失败而不是覆盖），不需要逐个探测可用文件名。
+# attachments.file_path 指向实际文件，多条附件记录可以引用同一个文件；
+# 引用计数即引用该文件的附件记录数（file_path 有索引，已归档的附件记录同样计入），最后一条引用删除时才删除文件。
+# 文件系统不随数据库事务回滚，写事务中的放置和释放由 FileChanges 记录，事务结束后再处理:
+#   - 事务提交: 删除本事务释放、且确实不再被引用的文件
+#   - 事务未提交: 删除本事务新建、且没有被其他附件引用的文件
+# 删除前在一个新的写事务中重新确认引用；放置文件与确认引用后删除文件互斥（SQLite 写事务本身互斥，
+# PostgreSQL 按文件路径取事务级咨询锁，持有到事务结束），不会删除其他事务刚刚引用、尚未提交的文件
+import hashlib
+import logging
+import os
+import tempfile
+
+import archive
+import db
+import offload
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 文件路径咨询锁的命名空间（pg_advisory_xact_lock 的第一个参数）
+FILE_LOCK_NAMESPACE = 7261002
+
+# 子目录层数和每层使用的哈希字符数（每层 256 个目录）
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+class StagedFile:
+    def __init__(self, tmp_path, content_hash, size, original_filename, ext):
+        self.tmp_path = tmp_path
+        self.content_hash = content_hash
+        self.size = size
+        self.original_filename = original_filename
+        self.ext = ext
+
+
+# 计算已有文件的 SHA-256
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _consume_chunk(sha256, f, chunk):
+    sha256.update(chunk)
+    f.write(chunk)
+
+
+# 把上传文件写入上传目录下的临时文件，同时计算哈希（只读一遍数据）
+def stage_upload(file, folder):
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', suffix='.tmp', dir=folder)
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = file.stream.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                # 读请求体在当前协程中进行，哈希计算和写文件在 gevent 下交给线程池
+                offload.run(_consume_chunk, sha256, f, chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    ext = os.path.splitext(file.filename)[1]
+    return StagedFile(tmp_path, sha256.hexdigest(), size, file.filename, ext)
+
+
+# 批量暂存请求中的上传文件（跳过空文件框）
+def stage_uploads(files, folder):
+    staged = []
+    try:
+        for file in files:
+            if file and file.filename:
+                staged.append(stage_upload(file, folder))
+    except Exception:
+        discard(staged)
+        raise
+    return staged
+
+
+# 删除未使用的临时文件（已放置的文件不受影响）
+def discard(staged_files):
+    for staged in staged_files:
+        if os.path.exists(staged.tmp_path):
+            os.remove(staged.tmp_path)
+
+
+def blob_path(folder, content_hash, ext):
+    shards = [content_hash[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+    return os.path.join(folder, *shards, f'{content_hash}{ext.lower()}')
+
+
+# 原子地在 path 创建 source 的副本（硬链接），path 已存在时返回 False 且不覆盖
+def _link(source, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.link(source, path)
+    except FileExistsError:
+        return False
+    except OSError:
+        # 文件系统不支持硬链接时退回到重命名（目标内容由哈希决定，覆盖同名文件不会改变内容）
+        if os.path.exists(path):
+            return False
+        os.replace(source, path)
+    return True
+
+
+# 附件的存储文件名（下载链接和页面显示使用），由发票号码和内容哈希前缀组成，无需探测文件是否存在
+def stored_filename(invoice_number, staged):
+    return f'{invoice_number}_{staged.content_hash[:12]}{staged.ext}'
+
+
+# 在当前写事务中锁定文件路径（SQLite 持有写锁即可，调用前事务中必须已执行过写语句）
+def _lock_paths(c, paths):
+    if db.dialect(c.connection) == 'postgresql':
+        for path in sorted(set(paths)):
+            key = int.from_bytes(hashlib.blake2b(path.encode(), digest_size=4).digest(), 'big', signed=True)
+            c.execute('SELECT pg_advisory_xact_lock(?, ?)', (FILE_LOCK_NAMESPACE, key))
+
+
+# 文件是否仍被附件引用、与指定申请附件内容相同的其他申请的查询语句（{table} / {other_table} 为附件表或归档表）
+REFERENCE_QUERY = 'SELECT 1 FROM {table} WHERE file_path = ? LIMIT 1'
+DUPLICATES_QUERY = '''SELECT a.content_hash, o.app_number FROM {table} a
+                      JOIN {other_table} o ON o.content_hash = a.content_hash AND o.app_number != a.app_number
+                      WHERE a.app_number = ? AND a.content_hash IS NOT NULL'''
+
+
+def is_referenced(c, file_path):
+    for table in archive.ATTACHMENT_TABLES:
+        c.execute(REFERENCE_QUERY.format(table=table), (file_path,))
+        if c.fetchone() is not None:
+            return True
+    return False
+
+
+# 在一个新的写事务中删除 paths 中没有被任何附件引用的文件，返回删除的文件数（删除失败的记录日志）
+def remove_unreferenced(conn, paths):
+    paths = sorted(set(paths))
+    if not paths:
+        return 0
+    removed = 0
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        _lock_paths(c, paths)
+        for path in paths:
+            if is_referenced(c, path) or not os.path.exists(path):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"删除文件失败: {path}, 错误: {e}")
+    finally:
+        conn.commit()
+    return removed
+
+
+# 一个写事务中的附件文件变更，与数据库连接一起使用（连接先退出，提交或回滚之后再处理文件）:
+#     with storage.FileChanges(folder, get_db) as files, get_db() as conn:
+#         ... files.place(c, staged) / files.release(file_path) ...
+# 块内出现异常视为事务未提交，正常结束视为已提交
+class FileChanges:
+    def __init__(self, folder, get_conn):
+        self.folder = folder
+        self.get_conn = get_conn
+        # 本事务新建的文件、本事务删除了附件记录的文件
+        self.created = []
+        self.released = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        paths = self.created if exc_type is not None else self.released
+        self.created, self.released = [], []
+        if paths:
+            try:
+                remove_unreferenced(self.get_conn(), paths)
+            except Exception:
+                if exc_type is None:
+                    raise
+                logger.exception('清理未提交事务的附件文件失败')
+        return False
+
+    # 把暂存文件放到内容寻址路径；内容已存在时直接复用并删除临时文件。
+    # 必须在插入附件记录的写事务内调用
+    def place(self, c, staged):
+        path = blob_path(self.folder, staged.content_hash, staged.ext)
+        _lock_paths(c, [path])
+        if _link(staged.tmp_path, path):
+            self.created.append(path)
+        if os.path.exists(staged.tmp_path):
+            os.remove(staged.tmp_path)
+        return path
+
+    # 删除附件记录后调用；事务提交后文件不再被任何附件引用时删除
+    def release(self, file_path):
+        self.released.append(file_path)
+
+
+# 查找与指定申请的附件内容相同的其他申请（包括已归档的申请），返回 {内容哈希: [申请编号, ...]}
+# archived=True 表示指定的申请本身已归档
+def find_duplicates(c, app_number, archived=False):
+    table = archive.ATTACHMENT_ARCHIVE_TABLE if archived else 'attachments'
+    duplicates = {}
+    for other_table in archive.ATTACHMENT_TABLES:
+        c.execute(DUPLICATES_QUERY.format(table=table, other_table=other_table), (app_number,))
+        for content_hash, other in c.fetchall():
+            duplicates.setdefault(content_hash, set()).add(other)
+    return {content_hash: sorted(others) for content_hash, others in duplicates.items()}
+
+
+# 把旧的平铺上传目录迁移到分级内容寻址目录，并改写 attachments（及归档表）的 file_path（同时补算内容哈希）。
+# 每批先在新位置建立硬链接、提交数据库后再删除旧文件，中途中断可重新执行；
+# 内容相同的旧文件合并为一个文件。返回统计信息
+def migrate_flat_uploads(conn, folder, batch_size=200, dry_run=False):
+    stats = {'files': 0, 'moved': 0, 'deduplicated': 0, 'missing': 0, 'rows': 0, 'orphans': 0}
+    c = conn.cursor()
+    c.execute(' UNION '.join(f'SELECT file_path FROM {table}' for table in archive.ATTACHMENT_TABLES))
+    pending = [path for (path,) in c.fetchall()
+               if os.path.dirname(os.path.relpath(path, folder)) == '']
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        moves = []
+        for old_path in batch:
+            stats['files'] += 1
+            if not os.path.exists(old_path):
+                stats['missing'] += 1
+                continue
+            content_hash = hash_file(old_path)
+            new_path = blob_path(folder, content_hash, os.path.splitext(old_path)[1])
+            if dry_run:
+                created = not os.path.exists(new_path)
+            else:
+                created = _link(old_path, new_path)
+            stats['moved' if created else 'deduplicated'] += 1
+            moves.append((old_path, new_path, content_hash))
+        if dry_run:
+            continue
+        with conn:
+            for old_path, new_path, content_hash in moves:
+                for table in archive.ATTACHMENT_TABLES:
+                    c.execute(f'UPDATE {table} SET file_path = ?, content_hash = ? WHERE file_path = ?',
+                              (new_path, content_hash, old_path))
+                    stats['rows'] += c.rowcount
+        for old_path, _, _ in moves:
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    # 上传目录根下没有被任何附件引用的文件（只统计，不自动删除）
+    referenced = {os.path.normpath(path) for path in pending}
+    for entry in os.scandir(folder):
+        if (entry.is_file() and not entry.name.startswith('.')
+                and os.path.normpath(os.path.join(folder, entry.name)) not in referenced):
+            stats['orphans'] += 1
+    return stats
@@ -0,0 +1,110 @@
+# 后台统计汇总
+# application_summary 表按状态和使用途径保存申请数量与发票金额合计，由 applications 表上的
+# 触发器增量维护，后台读取计数只需读几行汇总数据而不必扫描 applications。
+# 金额以“分”为单位的整数累加，避免浮点数反复加减产生误差
+SUMMARY_DIMENSIONS = ('status', 'usage_type')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS application_summary (
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    app_count INTEGER NOT NULL DEFAULT 0,
+    amount_cents INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, value)
+) WITHOUT ROWID
+'''
+
+
+def _cents(expr):
+    return f'CAST(ROUND({expr} * 100) AS INTEGER)'
+
+
+# 生成对某一行（NEW 或 OLD）加/减计数的触发器语句
+def _apply_row_sql(row, sign):
+    statements = []
+    for dimension in SUMMARY_DIMENSIONS:
+        value = f"COALESCE({row}.{dimension}, '')"
+        statements.append(
+            f"INSERT OR IGNORE INTO application_summary (dimension, value) VALUES ('{dimension}', {value});")
+        statements.append(
+            f"UPDATE application_summary SET app_count = app_count {sign} 1, "
+            f"amount_cents = amount_cents {sign} {_cents(f'{row}.invoice_amount')} "
+            f"WHERE dimension = '{dimension}' AND value = {value};")
+    return '\n    '.join(statements)
+
+
+TRIGGERS = {
+    'trg_summary_insert': f'''
+CREATE TRIGGER IF NOT EXISTS trg_summary_insert AFTER INSERT ON applications
+BEGIN
+    {_apply_row_sql('NEW', '+')}
+END''',
+    'trg_summary_delete': f'''
+CREATE TRIGGER IF NOT EXISTS trg_summary_delete AFTER DELETE ON applications
+BEGIN
+    {_apply_row_sql('OLD', '-')}
+END''',
+    'trg_summary_update': f'''
+CREATE TRIGGER IF NOT EXISTS trg_summary_update
+AFTER UPDATE OF status, usage_type, invoice_amount ON applications
+BEGIN
+    {_apply_row_sql('OLD', '-')}
+    {_apply_row_sql('NEW', '+')}
+END''',
+}
+
+
+# 创建汇总表和触发器（由迁移调用）
+def create_schema(c):
+    c.execute(SCHEMA)
+    for sql in TRIGGERS.values():
+        c.execute(sql)
+
+
+# 按 applications 当前数据计算的汇总结果 {(dimension, value): (count, amount_cents)}
+def _compute(c):
+    result = {}
+    for dimension in SUMMARY_DIMENSIONS:
+        c.execute(f"SELECT COALESCE({dimension}, ''), COUNT(*), "
+                  f"COALESCE(SUM({_cents('invoice_amount')}), 0) FROM applications GROUP BY 1")
+        for value, count, cents in c.fetchall():
+            result[(dimension, value)] = (count, cents)
+    return result
+
+
+def _stored(c):
+    c.execute('SELECT dimension, value, app_count, amount_cents FROM application_summary')
+    return {(dimension, value): (count, cents) for dimension, value, count, cents in c.fetchall()
+            if count or cents}
+
+
+# 从 applications 全量重建汇总表（在调用方的事务中执行）
+def rebuild(c):
+    c.execute('DELETE FROM application_summary')
+    c.executemany(
+        'INSERT INTO application_summary (dimension, value, app_count, amount_cents) VALUES (?, ?, ?, ?)',
+        [(dimension, value, count, cents) for (dimension, value), (count, cents) in _compute(c).items()])
+
+
+# 一致性检查，返回不一致的项 [(dimension, value, 汇总表中的值, 实际值)]，为空表示一致
+def check(c):
+    expected = _compute(c)
+    stored = _stored(c)
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        if expected.get(key, (0, 0)) != stored.get(key, (0, 0)):
+            mismatches.append((key[0], key[1], stored.get(key, (0, 0)), expected.get(key, (0, 0))))
+    return mismatches
+
+
+# 读取汇总数据: {'status': {值: {'count', 'amount'}}, 'usage_type': {...}, 'total': {...}}
+def get_summary(c):
+    summary = {dimension: {} for dimension in SUMMARY_DIMENSIONS}
+    for (dimension, value), (count, cents) in sorted(_stored(c).items()):
+        summary[dimension][value] = {'count': count, 'amount': cents / 100}
+    status_rows = summary['status'].values()
+    summary['total'] = {
+        'count': sum(item['count'] for item in status_rows),
+        'amount': sum(round(item['amount'] * 100) for item in status_rows) / 100,
+    }
+    return summary
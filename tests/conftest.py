@@ -0,0 +1,163 @@
+# 测试公共夹具
+# database 夹具按 sqlite / postgresql 参数化，每个用例使用一个新的空数据库:
+#   - sqlite: 临时目录中的数据库文件
+#   - postgresql: TEST_DATABASE_URL 指定的服务器；未指定时用 pgserver 在临时目录中启动一次性实例（测试结束后删除）。
+#     每个用例在服务器上新建一个数据库，用例结束后删除；服务器不可用时跳过 PostgreSQL 用例
+# app 模块在导入时读取环境变量，这里先切换到临时工作目录（uploads、logs、exports 等相对路径都在其中）
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='invoice-tests-')
+os.environ.pop('DATABASE_URL', None)
+os.environ['DATABASE_PATH'] = os.path.join(WORKDIR, 'reimbursement.db')
+os.environ.setdefault('LOG_QUEUE', '0')
+os.environ.setdefault('IO_OFFLOAD', '0')
+
+import db  # noqa: E402
+import postgres  # noqa: E402
+
+
+def pytest_configure(config):
+    os.chdir(WORKDIR)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(PROJECT_ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def pg_server_url(tmp_path_factory):
+    url = os.environ.get('TEST_DATABASE_URL')
+    if url:
+        yield url
+        return
+    try:
+        import pgserver
+    except ImportError:
+        pytest.skip('未设置 TEST_DATABASE_URL，且未安装 pgserver')
+    try:
+        server = pgserver.get_server(tmp_path_factory.mktemp('pgdata'), cleanup_mode='delete')
+    except Exception as e:
+        pytest.skip(f'无法启动 PostgreSQL: {e}')
+    yield server.get_uri('postgres')
+    server.cleanup()
+
+
+def _admin_execute(server_url, sql):
+    import psycopg
+    with psycopg.connect(server_url, autocommit=True) as conn:
+        conn.execute(sql)
+
+
+def _database_url(server_url, name):
+    base, sep, query = server_url.partition('?')
+    return f"{base.rsplit('/', 1)[0]}/{name}{sep}{query}"
+
+
+@pytest.fixture
+def pg_database(request):
+    server_url = request.getfixturevalue('pg_server_url')
+    name = f'test_{uuid.uuid4().hex[:12]}'
+    _admin_execute(server_url, f'CREATE DATABASE {name}')
+    url = _database_url(server_url, name)
+    yield url
+    engine = postgres._engines.pop(url, None)
+    if engine is not None:
+        engine.dispose()
+    _admin_execute(server_url, f'DROP DATABASE IF EXISTS {name} WITH (FORCE)')
+
+
+# 新的空数据库（SQLite 文件路径或 PostgreSQL URL）
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database(request, tmp_path):
+    if request.param == 'sqlite':
+        return str(tmp_path / 'test.db')
+    return request.getfixturevalue('pg_database')
+
+
+# 在 database 上执行 init_db（建表、全部迁移和默认管理员）
+def init_database(database):
+    import app as app_module
+    config = app_module.app.config
+    saved = config['DATABASE']
+    config['DATABASE'] = database
+    try:
+        app_module.init_db()
+    finally:
+        config['DATABASE'] = saved
+
+
+APPLICATION_DEFAULTS = {
+    'purchaser': '张三',
+    'purchase_details': '办公使用',
+    'item_name': '键盘',
+    'product_link': '',
+    'usage_type': '个人使用',
+    'item_type': '电子产品',
+    'quantity': 1,
+    'purchase_time': '2025-03-01',
+    'invoice_amount': 100.0,
+    'invoice_date': '2025-03-01',
+    'status': '待审批',
+}
+
+
+# 插入一条申请，返回其 id
+def insert_application(c, app_number, invoice_number, table='applications', **fields):
+    values = dict(APPLICATION_DEFAULTS, app_number=app_number, invoice_number=invoice_number, **fields)
+    c.execute(f"INSERT INTO {table} ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+              list(values.values()))
+    c.execute(f'SELECT id FROM {table} WHERE app_number = ?', (app_number,))
+    return c.fetchone()[0]
+
+
+def make_pool(database):
+    if db.is_postgres(database):
+        return postgres.PostgresPool(database, size=2)
+    return db.ConnectionPool(database, size=2)
+
+
+# 指向新数据库并已执行 init_db（建表和全部迁移）的 Flask 应用
+@pytest.fixture
+def app(database, tmp_path, monkeypatch):
+    import app as app_module
+    import export_jobs
+    import invoices
+    flask_app = app_module.app
+    saved = {key: flask_app.config[key] for key in ('DATABASE', 'UPLOAD_FOLDER', 'EXPORT_FOLDER', 'TESTING')
+             if key in flask_app.config}
+    saved_extensions = dict(flask_app.extensions)
+    flask_app.config.update(DATABASE=database, UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+                            EXPORT_FOLDER=str(tmp_path / 'exports'), TESTING=True)
+    os.makedirs(flask_app.config['UPLOAD_FOLDER'])
+    pool = make_pool(database)
+    flask_app.extensions['db_pool'] = pool
+    export_jobs.init_app(flask_app)
+    init_database(database)
+    if app_module.invoice_index is not None:
+        monkeypatch.setattr(app_module, 'invoice_index', invoices.InvoiceIndex(
+            error_rate=flask_app.config['INVOICE_INDEX_ERROR_RATE'],
+            max_age=flask_app.config['INVOICE_INDEX_MAX_AGE']))
+    if app_module.response_cache is not None:
+        app_module.response_cache.clear()
+    app_module.count_cache.clear()
+    yield flask_app
+    pool.close_all()
+    flask_app.config.update(saved)
+    flask_app.extensions.clear()
+    flask_app.extensions.update(saved_extensions)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
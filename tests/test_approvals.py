@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+import approvals
+import db
+from conftest import init_database, insert_application
+
+
+@pytest.fixture
+def connect(database):
+    init_database(database)
+    opened = []
+
+    def connect():
+        conn = db.connect(database)
+        opened.append(conn)
+        return conn
+    yield connect
+    for conn in opened:
+        conn.close()
+
+
+def _status(conn, app_number):
+    c = conn.cursor()
+    c.execute('SELECT status FROM applications WHERE app_number = ?', (app_number,))
+    status = c.fetchone()[0]
+    conn.commit()
+    return status
+
+
+def test_bulk_update_checks_transitions(connect):
+    conn = connect()
+    with conn:
+        c = conn.cursor()
+        insert_application(c, 'A1', 'INV-1')
+        insert_application(c, 'A2', 'INV-2', status='已报销')
+        insert_application(c, 'A3', 'INV-3', status='驳回')
+    results = approvals.bulk_update_status(conn, ['A1', 'A2', 'A1', 'missing', 'A3'], '报销中', '同意',
+                                           '2025-03-02 10:00:00')
+    assert results == [('A1', approvals.RESULT_UPDATED, '待审批'),
+                       ('A2', approvals.RESULT_INVALID_TRANSITION, '已报销'),
+                       ('missing', approvals.RESULT_NOT_FOUND, None),
+                       ('A3', approvals.RESULT_UPDATED, '驳回')]
+    assert [_status(conn, n) for n in ('A1', 'A2', 'A3')] == ['报销中', '已报销', '报销中']
+
+    results = approvals.bulk_update_status(conn, ['A2'], '驳回', '', '2025-03-02 10:00:00',
+                                           enforce_transitions=False)
+    assert results == [('A2', approvals.RESULT_UPDATED, '已报销')]
+    assert _status(conn, 'A2') == '驳回'
+
+
+# 其他事务在批量审批读取状态之前修改了申请（尚未提交）: 批量审批按修改后的状态检查流转，
+# 不能按旧状态通过检查后覆盖已报销的申请
+def test_bulk_update_sees_concurrent_change(connect):
+    writer, approver = connect(), connect()
+    with writer:
+        insert_application(writer.cursor(), 'A1', 'INV-1')
+    writer.cursor().execute("UPDATE applications SET status = '已报销' WHERE app_number = 'A1'")
+
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(
+        approvals.bulk_update_status(approver, ['A1'], '驳回', '', '2025-03-02 10:00:00')))
+    thread.start()
+    time.sleep(0.5)
+    writer.commit()
+    thread.join(30)
+    assert results == [('A1', approvals.RESULT_INVALID_TRANSITION, '已报销')]
+    assert _status(writer, 'A1') == '已报销'
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+
+import pytest
+
+import archive
+import db
+import invoices
+import search
+import storage
+import summary
+from conftest import init_database, insert_application
+
+CUTOFF = '2025-01-01 00:00:00'
+SETTLED = {'status': '已报销', 'updated_at': '2024-06-01 00:00:00'}
+
+
+@pytest.fixture
+def connect(database):
+    init_database(database)
+    opened = []
+
+    def connect():
+        conn = db.connect(database)
+        opened.append(conn)
+        return conn
+    yield connect
+    for conn in opened:
+        conn.close()
+
+
+def _fetch(conn, sql, params=()):
+    c = conn.cursor()
+    c.execute(sql, params)
+    rows = c.fetchall()
+    conn.commit()
+    return [tuple(row) for row in rows]
+
+
+def _attach(c, app_number, name, path, content_hash=None):
+    c.execute('''INSERT INTO attachments (app_number, original_filename, stored_filename, file_path, content_hash)
+                 VALUES (?, ?, ?, ?, ?)''', (app_number, name, f'{app_number}_{name}', path, content_hash))
+
+
+# 已报销且更新早于截止时间的申请连同全部附件记录移入归档表（id 不变），其余申请和附件不动；移回后恢复原状
+def test_archive_moves_application_with_attachments(connect):
+    conn = connect()
+    with conn:
+        c = conn.cursor()
+        insert_application(c, 'A1', 'INV-1', **SETTLED)
+        insert_application(c, 'A2', 'INV-2', status='已报销', updated_at='2025-06-01 00:00:00')
+        insert_application(c, 'A3', 'INV-3')
+        for app_number, name in (('A1', 'invoice.pdf'), ('A1', 'photo.jpg'), ('A2', 'invoice.pdf'), ('A3', 'a.pdf')):
+            _attach(c, app_number, name, f'/blobs/{app_number}-{name}')
+    attachments = _fetch(conn, "SELECT * FROM attachments WHERE app_number = 'A1' ORDER BY id")
+    app_id = _fetch(conn, "SELECT id FROM applications WHERE app_number = 'A1'")[0][0]
+    progress = []
+
+    totals = archive.archive_settled(conn, CUTOFF, '2025-03-01 00:00:00', batch_size=1,
+                                     progress=lambda *counts: progress.append(counts))
+    assert totals == {'applications': 1, 'attachments': 2}
+    assert progress == [(1, 2)]
+    assert _fetch(conn, f'SELECT id, app_number, archived_at FROM {archive.ARCHIVE_TABLE}') == \
+        [(app_id, 'A1', '2025-03-01 00:00:00')]
+    assert _fetch(conn, f'SELECT * FROM {archive.ATTACHMENT_ARCHIVE_TABLE} ORDER BY id') == attachments
+    assert _fetch(conn, 'SELECT app_number FROM applications ORDER BY app_number') == [('A2',), ('A3',)]
+    assert _fetch(conn, 'SELECT DISTINCT app_number FROM attachments ORDER BY app_number') == [('A2',), ('A3',)]
+
+    c = conn.cursor()
+    row, archived = archive.find_application(c, 'app_number', 'A1')
+    assert archived and row[0] == app_id
+    assert [tuple(row) for row in archive.find_attachments(c, 'A1', archived)] == attachments
+    assert tuple(archive.find_download(c, 'A1_photo.jpg')) == ('/blobs/A1-photo.jpg', 'photo.jpg', None)
+    conn.commit()
+    assert archive.count_pending(conn.cursor(), CUTOFF) == 0
+    conn.commit()
+
+    assert archive.restore(conn, ['A1', 'MISSING']) == ['A1']
+    assert _fetch(conn, "SELECT * FROM attachments WHERE app_number = 'A1' ORDER BY id") == attachments
+    assert _fetch(conn, f'SELECT COUNT(*) FROM {archive.ARCHIVE_TABLE}') == [(0,)]
+    assert _fetch(conn, f'SELECT COUNT(*) FROM {archive.ATTACHMENT_ARCHIVE_TABLE}') == [(0,)]
+
+
+# 归档后统计汇总与 applications 一致、全文索引与内容一致，发票号码检查和唯一性仍然包括已归档的号码
+def test_archive_keeps_summary_search_and_invoice_checks_consistent(connect):
+    conn, other = connect(), connect()
+    with conn:
+        c = conn.cursor()
+        insert_application(c, 'A1', 'INV-1', item_name='机械键盘', invoice_amount=300.0, **SETTLED)
+        insert_application(c, 'A2', 'INV-2', item_name='无线鼠标', invoice_amount=80.0, **SETTLED)
+        insert_application(c, 'A3', 'INV-3', item_name='机械键盘', invoice_amount=50.0)
+    index = invoices.InvoiceIndex()
+    assert index.existing(lambda: other, ['INV-1', 'INV-3']) == {'INV-1', 'INV-3'}
+
+    archive.archive_settled(conn, CUTOFF, '2025-03-01 00:00:00')
+    c = conn.cursor()
+    assert summary.check(c) == []
+    stats = summary.get_summary(c)
+    conn.commit()
+    assert stats['total'] == {'count': 1, 'amount': 50.0}
+    assert stats['status'].get('已报销', {'count': 0})['count'] == 0
+
+    if search.is_available(conn.cursor()):
+        c = conn.cursor()
+        c.execute(f"INSERT INTO {search.FTS_TABLE} ({search.FTS_TABLE}) VALUES ('integrity-check')")
+        c.execute(f'SELECT rowid FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} MATCH ?',
+                  (search.match_expression(['机械键盘']),))
+        assert [row[0] for row in c.fetchall()] == [_fetch(conn, "SELECT id FROM applications")[0][0]]
+        conn.commit()
+
+    assert invoices.query_existing(conn.cursor(), ['INV-1', 'INV-2', 'INV-3', 'INV-4']) == {'INV-1', 'INV-2', 'INV-3'}
+    conn.commit()
+    assert index.existing(lambda: other, ['INV-1', 'INV-2', 'INV-4']) == {'INV-1', 'INV-2'}
+    assert invoices.InvoiceIndex().existing(lambda: other, ['INV-2', 'INV-4']) == {'INV-2'}
+    with pytest.raises(Exception) as excinfo:
+        with conn:
+            insert_application(conn.cursor(), 'A4', 'INV-1')
+    assert db.is_integrity_error(excinfo.value)
+
+
+# 已归档和未归档的申请共用同一个内容寻址文件: 删除未归档申请的附件时文件仍被归档表引用，保留；
+# 归档的附件记录也删除后文件才删除
+def test_shared_blob_kept_while_archive_references_it(connect, tmp_path):
+    conn = connect()
+    folder = str(tmp_path / 'uploads')
+    os.makedirs(folder)
+    path = os.path.join(folder, 'shared.pdf')
+    with open(path, 'wb') as f:
+        f.write(b'shared')
+    with conn:
+        c = conn.cursor()
+        insert_application(c, 'A1', 'INV-1', **SETTLED)
+        insert_application(c, 'A2', 'INV-2')
+        _attach(c, 'A1', 'invoice.pdf', path, 'hash-shared')
+        _attach(c, 'A2', 'invoice.pdf', path, 'hash-shared')
+    archive.archive_settled(conn, CUTOFF, '2025-03-01 00:00:00')
+    assert storage.find_duplicates(conn.cursor(), 'A2') == {'hash-shared': ['A1']}
+    assert storage.find_duplicates(conn.cursor(), 'A1', archived=True) == {'hash-shared': ['A2']}
+    conn.commit()
+
+    with storage.FileChanges(folder, lambda: conn) as files, conn:
+        conn.cursor().execute("DELETE FROM attachments WHERE app_number = 'A2'")
+        files.release(path)
+    assert os.path.exists(path)
+
+    with storage.FileChanges(folder, lambda: conn) as files, conn:
+        conn.cursor().execute(f"DELETE FROM {archive.ATTACHMENT_ARCHIVE_TABLE} WHERE app_number = 'A1'")
+        files.release(path)
+    assert not os.path.exists(path)
+
+
+# 归档读取本批申请时另一事务正在修改其中一条（尚未提交）: 提交后归档的是修改后的内容，修改不会丢失
+def test_archive_waits_for_concurrent_edit(connect):
+    writer, archiver = connect(), connect()
+    with writer:
+        insert_application(writer.cursor(), 'A1', 'INV-1', **SETTLED)
+    writer.cursor().execute("UPDATE applications SET item_name = '显示器' WHERE app_number = 'A1'")
+
+    totals = {}
+    thread = threading.Thread(target=lambda: totals.update(
+        archive.archive_settled(archiver, CUTOFF, '2025-03-01 00:00:00')))
+    thread.start()
+    time.sleep(0.5)
+    writer.commit()
+    thread.join(30)
+    assert totals['applications'] == 1
+    assert _fetch(writer, f'SELECT item_name FROM {archive.ARCHIVE_TABLE}') == [('显示器',)]
+    assert _fetch(writer, 'SELECT COUNT(*) FROM applications') == [(0,)]
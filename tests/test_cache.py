@@ -0,0 +1,216 @@
+import threading
+import time
+
+import fakeredis
+import pytest
+import redis
+from itsdangerous import Signer
+
+import app as app_module
+import cache_backend
+import sessions
+
+REDIS_URL = 'redis://cache.test:6379/0'
+
+
+# RedisBackend 通过 redis.Redis.from_url 建立连接，这里改为连接同一个进程内的 fakeredis 服务器，
+# 多个后端实例相当于多个 worker 共用一个 Redis
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url',
+                        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server)))
+    return server
+
+
+@pytest.fixture
+def make_backend(redis_server):
+    backends = []
+
+    def make():
+        backend = cache_backend.create_backend(REDIS_URL, prefix='test:')
+        backends.append(backend)
+        return backend
+    yield make
+    for backend in backends:
+        backend.close()
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def backend(request):
+    if request.param == 'memory':
+        return cache_backend.create_backend('memory', prefix='test:')
+    return request.getfixturevalue('make_backend')()
+
+
+def test_get_set_delete(backend):
+    assert backend.get('missing') is None
+    backend.set('key', b'value')
+    assert backend.get('key') == b'value'
+    backend.set('key', b'other')
+    assert backend.get('key') == b'other'
+    backend.delete('key')
+    assert backend.get('key') is None
+    backend.delete('key')
+
+
+def test_memory_ttl():
+    backend = cache_backend.MemoryBackend()
+    backend.set('short', b'1', ttl=0.05)
+    backend.set('forever', b'2')
+    assert backend.get('short') == b'1'
+    time.sleep(0.1)
+    assert backend.get('short') is None
+    assert backend.get('forever') == b'2'
+
+
+def test_redis_ttl(make_backend):
+    backend = make_backend()
+    backend.set('short', b'1', ttl=30)
+    backend.set('tiny', b'2', ttl=0.2)
+    backend.set('forever', b'3')
+    assert 0 < backend.client.ttl('test:short') <= 30
+    # Redis 的过期时间以秒为单位，不足 1 秒按 1 秒
+    assert backend.client.ttl('test:tiny') == 1
+    assert backend.client.ttl('test:forever') == -1
+
+
+def test_memory_evicts_least_recently_used():
+    backend = cache_backend.MemoryBackend(max_entries=2)
+    backend.set('a', b'1')
+    backend.set('b', b'2')
+    backend.get('a')
+    backend.set('c', b'3')
+    assert backend.get('a') == b'1'
+    assert backend.get('b') is None
+    assert backend.get('c') == b'3'
+
+
+def test_redis_errors_are_misses(make_backend, redis_server):
+    backend = make_backend()
+    redis_server.connected = False
+    assert backend.get('key') is None
+    backend.set('key', b'value')
+    assert backend.errors == 2
+
+
+# 一个 worker 发布的失效通知送达另一个 worker 的订阅者；订阅建立时先收到 None（清空全部本地缓存）
+def test_invalidation_reaches_other_backend(make_backend):
+    publisher, listener = make_backend(), make_backend()
+    received = []
+    arrived = threading.Condition()
+
+    def handler(message):
+        with arrived:
+            received.append(message)
+            arrived.notify_all()
+
+    def wait_for(count):
+        with arrived:
+            assert arrived.wait_for(lambda: len(received) >= count, timeout=5)
+
+    listener.subscribe('downloads', handler)
+    listener.ensure_listening()
+    wait_for(1)
+    assert received == [None]
+    publisher.publish('downloads', 'app-1')
+    publisher.publish('other', 'ignored')
+    publisher.publish('downloads', 'app-2')
+    wait_for(3)
+    assert received == [None, 'app-1', 'app-2']
+    assert listener.stats()['listening']
+    assert listener.messages == 2
+
+
+def test_memory_publish_is_local():
+    first, second = cache_backend.MemoryBackend(), cache_backend.MemoryBackend()
+    received = []
+    first.subscribe('downloads', received.append)
+    second.subscribe('downloads', lambda message: pytest.fail('其他进程不应收到通知'))
+    first.publish('downloads', 'app-1')
+    assert received == ['app-1']
+
+
+@pytest.fixture
+def session_client(app, backend, monkeypatch):
+    monkeypatch.setattr(app, 'session_interface', sessions.BackendSessionInterface(backend))
+    return app.test_client(), backend
+
+
+def _sid(app, client):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return Signer(app.secret_key, salt='server-session').unsign(cookie.value).decode()
+
+
+def _login(client):
+    return client.post('/admin/auth', data={'username': 'admin', 'password': 'admin123'})
+
+
+def _is_logged_in(client):
+    response = client.get('/admin/dashboard')
+    return response.status_code == 200
+
+
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_login_rotates_session_id(app, session_client):
+    client, backend = session_client
+    with client.session_transaction() as session:
+        session['theme'] = 'dark'
+    old_sid = _sid(app, client)
+    old_cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+    assert backend.get('session:' + old_sid) is not None
+
+    assert _login(client).status_code == 302
+    new_sid = _sid(app, client)
+    assert new_sid != old_sid
+    assert backend.get('session:' + old_sid) is None
+    assert backend.get('session:' + new_sid) is not None
+    assert _is_logged_in(client)
+    with client.session_transaction() as session:
+        assert session['theme'] == 'dark'
+
+    # 登录前的 cookie（可能被他人设置或获取）不能用于登录后的会话
+    client.set_cookie(app.config['SESSION_COOKIE_NAME'], old_cookie)
+    assert not _is_logged_in(client)
+
+
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_logout_revokes_session(app, session_client):
+    client, backend = session_client
+    _login(client)
+    assert _is_logged_in(client)
+    sid = _sid(app, client)
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+
+    client.get('/admin/logout')
+    assert backend.get('session:' + sid) is None
+    assert not _is_logged_in(client)
+    # 退出前复制的 cookie 也已失效
+    client.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie)
+    assert not _is_logged_in(client)
+
+
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_tampered_session_cookie_starts_new_session(app, session_client):
+    client, _ = session_client
+    _login(client)
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+    client.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie[:-2] + 'xx')
+    assert not _is_logged_in(client)
+
+
+# 内存会话在多个 worker 之间不共享，create_app 拒绝这种配置
+def test_create_app_refuses_memory_sessions_with_workers(monkeypatch, make_backend):
+    monkeypatch.setattr(app_module, '_app_initialized', True)
+    monkeypatch.setitem(app_module.app.config, 'SESSION_STORE', 'server')
+    monkeypatch.setattr(app_module, 'cache', cache_backend.MemoryBackend())
+    assert app_module.create_app(workers=1) is app_module.app
+    with pytest.raises(RuntimeError, match='SESSION_STORE=server'):
+        app_module.create_app(workers=2)
+
+    monkeypatch.setattr(app_module, 'cache', make_backend())
+    assert app_module.create_app(workers=4) is app_module.app
+
+    monkeypatch.setitem(app_module.app.config, 'SESSION_STORE', 'cookie')
+    monkeypatch.setattr(app_module, 'cache', cache_backend.MemoryBackend())
+    assert app_module.create_app(workers=4) is app_module.app
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+import export_jobs
+from conftest import init_database, insert_application, make_pool
+
+QUERY = 'SELECT app_number, invoice_number FROM applications ORDER BY app_number'
+STALE_AFTER = 0.6
+
+
+@pytest.fixture
+def manager(database, tmp_path):
+    init_database(database)
+    pool = make_pool(database)
+    conn = pool.acquire()
+    with conn:
+        c = conn.cursor()
+        for i in range(3):
+            insert_application(c, f'FB{i:04d}', f'INV-{i}')
+    pool.release(conn)
+    yield export_jobs.ExportJobManager(pool, str(tmp_path / 'exports'), stale_after=STALE_AFTER)
+    pool.close_all()
+
+
+def _wait_for(manager, job_id, status, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'任务状态为 {job["status"]}，未变为 {status}')
+
+
+def test_export_job_completes(manager):
+    job = manager.submit({'status': ''}, QUERY, [], 'csv', 'export.csv')
+    assert not job['cached']
+    done = _wait_for(manager, job['id'], 'done')
+    assert done['total_rows'] == 3
+    with open(done['file_path'], encoding='utf-8-sig') as f:
+        assert 'INV-2' in f.read()
+    assert manager.submit({'status': ''}, QUERY, [], 'csv', 'export.csv')['cached']
+
+
+# 保存 Excel 等长时间不产生进度的步骤中心跳照常刷新，任务不会被误判为中断
+def test_slow_job_keeps_heartbeat(manager, monkeypatch):
+    saving = threading.Event()
+    release = threading.Event()
+
+    def slow_write_xlsx(rows, path):
+        list(rows)
+        saving.set()
+        release.wait(10)
+        with open(path, 'wb') as f:
+            f.write(b'xlsx')
+    monkeypatch.setattr(export_jobs.exporter, 'write_xlsx', slow_write_xlsx)
+
+    job = manager.submit({}, QUERY, [], 'xlsx', 'export.xlsx')
+    try:
+        assert saving.wait(10)
+        time.sleep(STALE_AFTER * 3)
+        assert manager.get(job['id'])['status'] == 'running'
+    finally:
+        release.set()
+    _wait_for(manager, job['id'], 'done')
+
+
+# 所在进程退出（心跳停止）的任务查询时标记为失败
+def test_job_without_heartbeat_is_failed(manager):
+    conn = manager.pool.acquire()
+    with conn:
+        conn.execute('''INSERT INTO export_jobs (id, cache_key, format, filename, status, data_version,
+                                                 created_at, heartbeat_at)
+                        VALUES ('orphan', 'key', 'csv', 'export.csv', 'running', 0, ?, ?)''',
+                     (time.time() - 60, time.time() - 60))
+    manager.pool.release(conn)
+    job = manager.get('orphan')
+    assert job['status'] == 'failed'
+    assert '中断' in job['error']
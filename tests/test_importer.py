@@ -0,0 +1,190 @@
+import csv
+import io
+from datetime import datetime
+
+import pytest
+
+import db
+import importer
+from conftest import init_database, insert_application
+
+NOW = '2025-06-01 12:00:00'
+HEADERS = ['申请编号', '购买人', '物品名称', '使用途径', '物品类型', '数量', '购买时间', '发票号码', '发票金额', '开票日期']
+
+
+@pytest.fixture
+def conn(database):
+    init_database(database)
+    conn = db.connect(database)
+    yield conn
+    conn.close()
+
+
+# 依次返回给定编号的生成函数
+def _numbers(*numbers):
+    pending = iter(numbers)
+    return lambda: next(pending)
+
+
+def _row(invoice_number, app_number='', **fields):
+    values = {'申请编号': app_number, '购买人': '张三', '物品名称': '键盘', '使用途径': '个人使用',
+              '物品类型': '电子产品', '数量': '1', '购买时间': '2025-03-01', '发票号码': invoice_number,
+              '发票金额': '100.5', '开票日期': '2025-03-01'}
+    values.update(fields)
+    return [values[header] for header in HEADERS]
+
+
+def _rows(*rows, headers=HEADERS):
+    return enumerate([list(headers), *rows], start=1)
+
+
+def _imported(conn):
+    c = conn.cursor()
+    c.execute('SELECT app_number, invoice_number FROM applications ORDER BY invoice_number')
+    rows = c.fetchall()
+    conn.commit()
+    return [tuple(row) for row in rows]
+
+
+def test_row_validation_errors(conn):
+    result = importer.import_rows(conn, _rows(
+        _row('INV-1', 'A1'),
+        _row('INV-2', 'A2', 购买人=''),
+        _row('INV-3', 'A3', 数量='1.5'),
+        _row('INV-4', 'A4', 发票金额='-1'),
+        _row('INV-5', 'A5', 开票日期='2025-13-01'),
+        _row('INV-6', 'A6', 数量='两个'),
+        ['', '', '', '', '', '', '', '', '', ''],
+    ), _numbers(), NOW)
+    assert result['total'] == 6
+    assert result['imported'] == 1
+    assert [(line, message.split(':')[0]) for line, message in result['errors']] == [
+        (3, '缺少购买人'),
+        (4, '数量应为正整数'),
+        (5, '发票金额无效'),
+        (6, '开票日期格式应为 YYYY-MM-DD'),
+        (7, '数量不是数字'),
+    ]
+    assert _imported(conn) == [('A1', 'INV-1')]
+
+
+def test_missing_required_column(conn):
+    with pytest.raises(ValueError, match='发票号码'):
+        importer.import_rows(conn, _rows(headers=[header for header in HEADERS if header != '发票号码']),
+                             _numbers(), NOW)
+
+
+def test_duplicates_within_file(conn):
+    result = importer.import_rows(conn, _rows(
+        _row('INV-1', 'A1'),
+        _row('INV-1', 'A2'),
+        _row('INV-3', 'A1'),
+    ), _numbers(), NOW)
+    assert result['imported'] == 1
+    assert result['errors'] == [(3, '发票号码与第 2 行重复: INV-1'), (4, '申请编号与第 2 行重复: A1')]
+
+
+# 与 applications 和归档表中已有的号码重复的行不导入
+def test_duplicates_against_existing_and_archived(conn):
+    with conn:
+        c = conn.cursor()
+        insert_application(c, 'OLD-1', 'INV-LIVE')
+        insert_application(c, 'OLD-2', 'INV-ARCH', table='applications_archive', id=1000,
+                           archived_at='2025-01-01 00:00:00', status='已报销')
+    result = importer.import_rows(conn, _rows(
+        _row('INV-LIVE', 'A1'),
+        _row('INV-ARCH', 'A2'),
+        _row('INV-3', 'OLD-2'),
+        _row('INV-4', 'A4'),
+    ), _numbers(), NOW)
+    assert result['imported'] == 1
+    assert result['errors'] == [(2, '发票号码已存在: INV-LIVE'), (3, '发票号码已存在: INV-ARCH'),
+                                (4, '申请编号已存在: OLD-2')]
+    assert _imported(conn) == [('A4', 'INV-4'), ('OLD-1', 'INV-LIVE')]
+
+
+# 生成的编号已存在时重新生成，重新生成的编号同样不能与文件中的编号重复
+def test_regenerated_app_number_skips_numbers_in_file(conn):
+    with conn:
+        insert_application(conn.cursor(), 'GEN-1', 'INV-OLD', table='applications_archive', id=1000,
+                           archived_at='2025-01-01 00:00:00', status='已报销')
+    result = importer.import_rows(conn, _rows(
+        _row('INV-1'),
+        _row('INV-2', 'GEN-2'),
+    ), _numbers('GEN-1', 'GEN-2', 'GEN-3'), NOW)
+    assert result['errors'] == []
+    assert _imported(conn) == [('GEN-3', 'INV-1'), ('GEN-2', 'INV-2')]
+
+
+# 检查之后、插入之前其他连接写入了相同的号码: 该块回滚后在写事务中重新检查，只跳过冲突的行
+def test_integrity_error_rechecks_chunk(conn, database, monkeypatch):
+    real_insert = importer._insert_chunk
+    calls = []
+
+    def insert_after_race(c, chunk, errors, recheck=None):
+        calls.append(recheck is not None)
+        if len(calls) == 1:
+            other = db.connect(database)
+            with other:
+                insert_application(other.cursor(), 'OTHER', 'INV-2')
+                insert_application(other.cursor(), 'GEN-1', 'INV-OTHER')
+            other.close()
+        return real_insert(c, chunk, errors, recheck)
+    monkeypatch.setattr(importer, '_insert_chunk', insert_after_race)
+    result = importer.import_rows(conn, _rows(
+        _row('INV-1'),
+        _row('INV-2', 'A2'),
+        _row('INV-3', 'GEN-2'),
+    ), _numbers('GEN-1', 'GEN-2', 'GEN-3'), NOW)
+    assert calls == [False, True]
+    assert result['imported'] == 2
+    assert result['errors'] == [(3, '发票号码已存在: INV-2')]
+    assert _imported(conn) == [('GEN-3', 'INV-1'), ('OTHER', 'INV-2'), ('GEN-2', 'INV-3'), ('GEN-1', 'INV-OTHER')]
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    csv.writer(buffer).writerows(rows)
+    return io.BytesIO(buffer.getvalue().encode('utf-8'))
+
+
+def _xlsx(rows):
+    from openpyxl import Workbook
+    wb = Workbook()
+    for row in rows:
+        wb.active.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+# 表头按名称对应列（顺序不限），ID 列和无关的列忽略；Excel 的日期和数字单元格按导出时的文本格式还原
+@pytest.mark.parametrize('fmt', ['csv', 'xlsx'])
+def test_header_mapping(conn, fmt):
+    headers = ['发票金额', 'ID', '备注', '开票日期', '发票号码', '购买时间', '数量', '物品类型', '使用途径',
+               '物品名称', '购买人', '申请编号', '状态']
+    if fmt == 'csv':
+        stream = _csv([headers, ['88.8', '7', '无关', '2025/03/02', 'INV-1', '2025-03-01 10:00:00', '2', '办公用品',
+                                 '公司使用', '鼠标', '李四', 'A1', '报销中']])
+    else:
+        stream = _xlsx([headers, [88.8, 7, '无关', datetime(2025, 3, 2), 'INV-1', datetime(2025, 3, 1, 10, 0), 2.0,
+                                  '办公用品', '公司使用', '鼠标', '李四', 'A1', '报销中']])
+    result = importer.import_rows(conn, importer.read_rows(stream, fmt), _numbers(), NOW)
+    assert result['errors'] == []
+    c = conn.cursor()
+    c.execute('''SELECT id, app_number, purchaser, item_name, usage_type, item_type, quantity, purchase_time,
+                        invoice_number, invoice_amount, invoice_date, status, created_at FROM applications''')
+    row = tuple(c.fetchone())
+    conn.commit()
+    assert row[0] != 7
+    assert row[1:] == ('A1', '李四', '鼠标', '公司使用', '办公用品', 2, '2025-03-01', 'INV-1', 88.8, '2025-03-02',
+                       '报销中', NOW)
+
+
+def test_detect_format():
+    assert importer.detect_format('申请.XLSX') == 'xlsx'
+    assert importer.detect_format('申请.csv') == 'csv'
+    assert importer.detect_format('申请.xls') is None
+    assert importer.detect_format(None) is None
@@ -0,0 +1,119 @@
+import pytest
+
+import db
+import invoices
+from conftest import init_database, insert_application
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = invoices.BloomFilter(1000, 0.01)
+    numbers = [f'INV-{i}' for i in range(1000)]
+    for number in numbers:
+        bloom.add(number)
+    assert all(number in bloom for number in numbers)
+    false_positives = sum(f'OTHER-{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+@pytest.fixture
+def connections(database):
+    init_database(database)
+    opened = []
+
+    def open_connection():
+        conn = db.connect(database)
+        opened.append(conn)
+        return conn
+    yield open_connection
+    for conn in opened:
+        conn.close()
+
+
+def _commit_application(conn, app_number, invoice_number, **fields):
+    with conn:
+        return insert_application(conn.cursor(), app_number, invoice_number, **fields)
+
+
+def test_index_follows_other_writers(connections):
+    reader, writer = connections(), connections()
+    index = invoices.InvoiceIndex()
+    _commit_application(writer, 'A1', 'INV-1')
+    assert index.existing(lambda: reader, ['INV-1', 'INV-2']) == {'INV-1'}
+    _commit_application(writer, 'A2', 'INV-2')
+    assert index.existing(lambda: reader, ['INV-1', 'INV-2']) == {'INV-1', 'INV-2'}
+    # 修改发票号码后重建
+    with writer:
+        writer.cursor().execute("UPDATE applications SET invoice_number = 'INV-3' WHERE app_number = 'A1'")
+    assert index.existing(lambda: reader, ['INV-1', 'INV-3']) == {'INV-3'}
+
+
+def test_unchanged_version_skips_loading(connections, monkeypatch):
+    reader, writer = connections(), connections()
+    index = invoices.InvoiceIndex()
+    _commit_application(writer, 'A1', 'INV-1')
+    index.refresh(lambda: reader)
+    monkeypatch.setattr(index, '_load_new', lambda c: pytest.fail('版本号未变化时不应加载'))
+    monkeypatch.setattr(index, '_rebuild', lambda c: pytest.fail('版本号未变化时不应重建'))
+    assert index.existing(lambda: reader, ['INV-2']) == set()
+
+
+def test_max_age_throttles_version_checks(connections):
+    reader, writer = connections(), connections()
+    index = invoices.InvoiceIndex(max_age=3600)
+    index.refresh(lambda: reader)
+    _commit_application(writer, 'A1', 'INV-1')
+    assert index.existing(lambda: reader, ['INV-1']) == set()
+    index.max_age = 0
+    assert index.existing(lambda: reader, ['INV-1']) == {'INV-1'}
+
+
+def test_rows_committed_out_of_id_order(pg_database):
+    # PostgreSQL 中先分配 id 的事务可能后提交，过滤器不能因此漏掉号码
+    init_database(pg_database)
+    reader, slow, fast = (db.connect(pg_database) for _ in range(3))
+    try:
+        index = invoices.InvoiceIndex()
+        index.refresh(lambda: reader)
+        slow_id = insert_application(slow.cursor(), 'SLOW', 'INV-SLOW', status='驳回', usage_type='公共使用')
+        fast_id = _commit_application(fast, 'FAST', 'INV-FAST')
+        assert fast_id > slow_id
+        assert index.existing(lambda: reader, ['INV-SLOW', 'INV-FAST']) == {'INV-FAST'}
+        slow.commit()
+        assert index.existing(lambda: reader, ['INV-SLOW', 'INV-FAST']) == {'INV-SLOW', 'INV-FAST'}
+    finally:
+        for conn in (reader, slow, fast):
+            conn.close()
+
+
+def test_uncommitted_ids_at_rebuild_are_rechecked(pg_database):
+    init_database(pg_database)
+    reader, slow, fast = (db.connect(pg_database) for _ in range(3))
+    try:
+        insert_application(slow.cursor(), 'SLOW', 'INV-SLOW', status='驳回', usage_type='公共使用')
+        _commit_application(fast, 'FAST', 'INV-FAST')
+        index = invoices.InvoiceIndex()
+        assert index.existing(lambda: reader, ['INV-SLOW']) == set()
+        slow.commit()
+        assert index.existing(lambda: reader, ['INV-SLOW']) == {'INV-SLOW'}
+        assert not index._pending
+    finally:
+        for conn in (reader, slow, fast):
+            conn.close()
+
+
+def test_rolled_back_ids_expire(connections, monkeypatch):
+    reader, writer = connections(), connections()
+    index = invoices.InvoiceIndex()
+    index.refresh(lambda: reader)
+    with pytest.raises(RuntimeError):
+        with writer:
+            insert_application(writer.cursor(), 'GONE', 'INV-GONE')
+            raise RuntimeError
+    _commit_application(writer, 'A2', 'INV-2')
+    index.refresh(lambda: reader)
+    if db.dialect(writer) == 'postgresql':
+        assert index._pending
+    monkeypatch.setattr(invoices, 'PENDING_TTL', -1)
+    _commit_application(writer, 'A3', 'INV-3')
+    assert index.existing(lambda: reader, ['INV-2', 'INV-3']) == {'INV-2', 'INV-3'}
+    assert not index._pending
@@ -0,0 +1,34 @@
+import pytest
+
+import db
+import migrations
+from conftest import init_database
+
+
+@pytest.fixture
+def sqlite_conn(tmp_path):
+    path = str(tmp_path / 'test.db')
+    init_database(path)
+    conn = db.connect(path)
+    yield conn
+    conn.close()
+
+
+def test_explain_flags_full_scan(sqlite_conn):
+    results = migrations.explain_route_queries(
+        sqlite_conn, {'scan': ('SELECT * FROM applications WHERE purchase_details = ?', ('x',))})
+    assert results['scan'][0] is False
+
+
+# 子查询结果和临时表的扫描、DISTINCT 和全文检索相关度的临时排序不算未走索引
+def test_plan_uses_index_rules():
+    assert migrations.plan_uses_index(['CO-ROUTINE capped', 'SCAN applications USING COVERING INDEX idx', 'SCAN capped'])
+    assert migrations.plan_uses_index(['SCAN bulk_app_numbers', 'SEARCH applications USING INDEX idx (app_number=?)'],
+                                      temp_tables=['bulk_app_numbers'])
+    assert not migrations.plan_uses_index(['SCAN bulk_app_numbers'])
+    assert migrations.plan_uses_index(['SEARCH attachments USING INDEX idx (app_number=?)',
+                                       'USE TEMP B-TREE FOR DISTINCT'])
+    assert not migrations.plan_uses_index(['SEARCH applications USING INDEX idx (status=?)',
+                                           'USE TEMP B-TREE FOR ORDER BY'])
+    assert migrations.plan_uses_index(['SCAN applications_fts VIRTUAL TABLE INDEX 0:M3',
+                                       'USE TEMP B-TREE FOR ORDER BY'], fts=True)
@@ -0,0 +1,68 @@
+import io
+import logging
+import random
+
+import pytest
+
+import oplog
+
+
+def _events(caplog):
+    return [record.event for record in caplog.records if hasattr(record, 'event')]
+
+
+def test_form_summary_truncates_and_masks():
+    summary = oplog.form_summary({'password': 'secret', 'note': 'x' * 1000, 'name': '张三'}, max_length=10)
+    assert summary == {'password': '***', 'note': 'x' * 10 + '…(1000 字符)', 'name': '张三'}
+
+
+def test_parse_sample_rates():
+    assert oplog.parse_sample_rates('check_invoice_number=0, query_status=0.5,bad,x=2') == {
+        'check_invoice_number': 0.0, 'query_status': 0.5, 'x': 1.0}
+
+
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_check_invoice_number_not_logged_by_default(client, caplog, monkeypatch):
+    caplog.set_level(logging.INFO)
+    # 采样率大于 0 时一定会被抽中
+    monkeypatch.setattr(random, 'random', lambda: 0.0)
+    assert client.get('/check_invoice/INV-1').status_code == 200
+    assert client.get('/admin/login').status_code == 200
+    routes = [e['route'] for e in _events(caplog)]
+    assert 'check_invoice_number' not in routes
+    assert 'admin_login' in routes
+
+
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_logged_form_values_are_truncated(client, caplog):
+    caplog.set_level(logging.INFO)
+    client.post('/submit', data={'purchaser': '张三', 'purchase_details': '很长的说明' * 2000,
+                                 'invoice_number': 'INV-1'})
+    client.post('/admin/auth', data={'username': 'admin', 'password': 'admin123'})
+    events = {e['route']: e for e in _events(caplog)}
+    form = events['submit_application']['form']
+    assert form['purchaser'] == '张三'
+    assert len(form['purchase_details']) < 100
+    assert form['purchase_details'].endswith('(10000 字符)')
+    assert events['admin_auth']['form'] == {'username': 'admin', 'password': '***'}
+
+
+# 返回 (响应, 4xx) 的已处理失败记为 error 并带状态码，不受采样率影响
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_handled_failures_are_always_logged(app, client, caplog, monkeypatch):
+    caplog.set_level(logging.INFO)
+    monkeypatch.setitem(app.config, 'LOG_SAMPLE_RATES', {'import_applications': 0.0, 'check_invoice_number': 0.0})
+    monkeypatch.setattr(random, 'random', lambda: 0.99)
+    client.post('/admin/auth', data={'username': 'admin', 'password': 'admin123'})
+    response = client.post('/admin/import', data={})
+    assert response.status_code == 400
+    response = client.post('/admin/import', data={'file': (io.BytesIO(b'\xff\xfe\xfa'), 'bad.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert client.get('/check_invoice/INV-1').status_code == 200
+
+    events = [e for e in _events(caplog) if e['route'] in ('import_applications', 'check_invoice_number')]
+    assert [(e['route'], e['outcome'], e['status']) for e in events] == [
+        ('import_applications', 'error', 400), ('import_applications', 'error', 400)]
+    login = [e for e in _events(caplog) if e['route'] == 'admin_auth']
+    assert login[0]['outcome'] == 'success' and login[0]['status'] == 302
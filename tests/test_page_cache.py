@@ -0,0 +1,64 @@
+import gzip
+
+import pytest
+
+import compression
+import page_cache
+
+
+def test_variants_follow_entry():
+    cache = page_cache.ResponseCache()
+    etag = cache.set('key', 1, b'page')
+    assert cache.get_variant('key', etag, 'gzip') is None
+    cache.set_variant('key', etag, 'gzip', b'gz')
+    assert cache.get_variant('key', etag, 'gzip') == b'gz'
+    assert cache.get_variant('key', etag, 'br') is None
+    assert cache.stats()['bytes'] == len(b'page') + len(b'gz')
+
+    # 页面重新渲染后旧的压缩结果作废，按旧 ETag 压缩的内容不会存入新缓存项
+    new_etag = cache.set('key', 2, b'new page')
+    assert cache.get_variant('key', new_etag, 'gzip') is None
+    cache.set_variant('key', etag, 'gzip', b'stale')
+    assert cache.get_variant('key', new_etag, 'gzip') is None
+    assert cache.stats()['bytes'] == len(b'new page')
+
+
+def test_variants_count_towards_size_limit():
+    cache = page_cache.ResponseCache(max_bytes=8 * 100)
+    first = cache.set('first', 1, b'a' * 60)
+    cache.set('second', 1, b'b' * 60)
+    cache.set_variant('first', first, 'gzip', b'x' * 700)
+    assert cache.get('second', 1) is None
+    assert cache.get_variant('first', first, 'gzip') == b'x' * 700
+    assert cache.stats()['bytes'] == 760
+
+
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_cache_hit_serves_precompressed_page(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'COMPRESS_RESPONSES', True)
+    client.post('/admin/auth', data={'username': 'admin', 'password': 'admin123'})
+    plain = client.get('/admin/dashboard', headers={'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+
+    calls = []
+    original = compression.compress
+
+    def counting_compress(data, encoding, level=6):
+        calls.append(encoding)
+        return original(data, encoding, level)
+    monkeypatch.setattr(compression, 'compress', counting_compress)
+
+    responses = [client.get('/admin/dashboard', headers={'Accept-Encoding': 'gzip'}) for _ in range(3)]
+    assert calls == ['gzip']
+    for response in responses:
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.get_data()) == plain.get_data()
+        assert response.get_etag() == (plain.get_etag()[0], True)
+
+    revalidated = client.get('/admin/dashboard', headers={'Accept-Encoding': 'gzip',
+                                                          'If-None-Match': responses[0].headers['ETag']})
+    assert revalidated.status_code == 304
+    assert calls == ['gzip']
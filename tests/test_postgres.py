@@ -0,0 +1,356 @@
+import sqlite3
+
+import pytest
+
+import db
+import migrations
+import postgres
+import summary
+from conftest import init_database, insert_application
+
+
+# ---- 方言转换 ----
+
+def test_translate_placeholders():
+    assert postgres.translate('SELECT * FROM t WHERE a = ? AND b = ?') == 'SELECT * FROM t WHERE a = %s AND b = %s'
+
+
+def test_translate_escapes_percent_only_with_params():
+    assert postgres.translate("SELECT 5 % 2, a FROM t WHERE b = ?") == 'SELECT 5 %% 2, a FROM t WHERE b = %s'
+    assert postgres.translate('SELECT 5 % 2', has_params=False) == 'SELECT 5 % 2'
+
+
+def test_translate_leaves_literals_alone():
+    sql = "SELECT 'a?b LIKE %' FROM t WHERE name LIKE ? AND note = 'x'"
+    assert postgres.translate(sql) == "SELECT 'a?b LIKE %' FROM t WHERE name ILIKE %s AND note = 'x'"
+
+
+def test_translate_insert_or_ignore():
+    assert (postgres.translate('INSERT OR IGNORE INTO meta (key, value) VALUES (?, 0);')
+            == 'INSERT INTO meta (key, value) VALUES (%s, 0) ON CONFLICT DO NOTHING')
+    assert postgres.translate('insert  or ignore into t (a) values (?)').endswith('ON CONFLICT DO NOTHING')
+
+
+@pytest.mark.parametrize('sql, action', [
+    ('BEGIN', 'noop'),
+    ('BEGIN IMMEDIATE', 'noop'),
+    ('  begin;', 'noop'),
+    ('PRAGMA optimize', 'noop'),
+    ('PRAGMA user_version = 3', 'noop'),
+    ('COMMIT', 'commit'),
+    ('END;', 'commit'),
+    ('rollback', 'rollback'),
+    ('ROLLBACK TO SAVEPOINT s', None),
+    ('SELECT 1', None),
+    ('', None),
+])
+def test_session_statement(sql, action):
+    assert postgres._session_statement(sql) == action
+
+
+# ---- PgConnection / PgCursor ----
+
+@pytest.fixture
+def pg(pg_database):
+    conn = postgres.connect(pg_database)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _count(url):
+    conn = postgres.connect(url)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_noop_statements_are_not_sent(pg):
+    c = pg.cursor()
+    for sql in ('BEGIN IMMEDIATE', 'PRAGMA journal_mode=WAL'):
+        assert c.execute(sql) is c
+        assert c.fetchone() is None
+        assert c.fetchall() == []
+        assert list(c) == []
+        assert c.rowcount == -1
+        assert c.description is None
+    assert not pg.in_transaction
+    c.execute('SELECT 42')
+    assert c.fetchone() == (42,)
+
+
+def test_commit_statement(pg, pg_database):
+    c = pg.cursor()
+    c.execute('BEGIN')
+    c.execute('INSERT INTO items (id, name) VALUES (?, ?)', (1, 'a'))
+    assert pg.in_transaction
+    assert _count(pg_database) == 0
+    c.execute('COMMIT')
+    assert not pg.in_transaction
+    assert _count(pg_database) == 1
+
+
+def test_rollback_statement(pg, pg_database):
+    c = pg.cursor()
+    c.execute('BEGIN')
+    c.execute('INSERT INTO items (id, name) VALUES (?, ?)', (1, 'a'))
+    c.execute('ROLLBACK')
+    assert not pg.in_transaction
+    assert _count(pg_database) == 0
+
+
+def test_context_manager_commits_or_rolls_back(pg, pg_database):
+    with pg:
+        pg.execute('INSERT INTO items (id, name) VALUES (?, ?)', (1, 'a'))
+    assert _count(pg_database) == 1
+    with pytest.raises(RuntimeError):
+        with pg:
+            pg.execute('INSERT INTO items (id, name) VALUES (?, ?)', (2, 'b'))
+            raise RuntimeError
+    assert _count(pg_database) == 1
+
+
+def test_insert_or_ignore_and_integrity_error(pg):
+    pg.executemany('INSERT INTO items (id, name) VALUES (?, ?)', [(1, 'a'), (2, 'b')])
+    pg.execute('INSERT OR IGNORE INTO items (id, name) VALUES (?, ?)', (1, 'dup'))
+    assert pg.execute('SELECT name FROM items WHERE id = 1').fetchone() == ('a',)
+    with pytest.raises(Exception) as excinfo:
+        pg.execute('INSERT INTO items (id, name) VALUES (?, ?)', (1, 'dup'))
+    assert db.is_integrity_error(excinfo.value)
+    pg.rollback()
+
+
+def test_streaming_cursor(pg):
+    pg.executemany('INSERT INTO items (id, name) VALUES (?, ?)', [(i, f'n{i}') for i in range(2500)])
+    c = db.streaming_cursor(pg)
+    c.execute('SELECT id FROM items WHERE name LIKE ? ORDER BY id', ('N%',))
+    assert [row[0] for row in c] == list(range(2500))
+    c.close()
+    pg.rollback()
+
+
+# ---- 迁移 ----
+
+def _latest_version(database):
+    return postgres.SCHEMA_VERSION if db.is_postgres(database) else migrations.MIGRATIONS[-1][0]
+
+
+def test_migrations_reach_latest_version(database):
+    init_database(database)
+    conn = db.connect(database)
+    try:
+        assert migrations.get_version(conn) == _latest_version(database)
+        # 重复执行不做任何变更
+        assert migrations.run_migrations(conn) == _latest_version(database)
+        c = conn.cursor()
+        c.execute('SELECT COUNT(*) FROM admins')
+        assert c.fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+def test_migrated_schema_triggers(database):
+    init_database(database)
+    conn = db.connect(database)
+    try:
+        c = conn.cursor()
+        before = db.get_data_version(c)
+        with conn:
+            insert_application(c, 'A1', 'INV-1')
+            c.execute("INSERT INTO attachments (app_number, original_filename, stored_filename, file_path) "
+                      "VALUES ('A1', 'a.pdf', 'a.pdf', '/tmp/a.pdf')")
+        assert db.get_data_version(c) > before
+        # 汇总表和支出分析汇总表由触发器维护
+        assert summary.check(c) == []
+        assert summary.get_summary(c)['total']['count'] == 1
+        # 发票号码唯一
+        with pytest.raises(Exception) as excinfo:
+            with conn:
+                insert_application(c, 'A2', 'INV-1')
+        assert db.is_integrity_error(excinfo.value)
+    finally:
+        conn.close()
+
+
+# 迁移之前（版本 0）的 SQLite 表结构
+LEGACY_SQLITE_SCHEMA = '''
+CREATE TABLE applications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, app_number TEXT UNIQUE NOT NULL, purchaser TEXT NOT NULL,
+    purchase_details TEXT, item_name TEXT NOT NULL, product_link TEXT, usage_type TEXT NOT NULL,
+    item_type TEXT NOT NULL, quantity INTEGER NOT NULL, purchase_time DATE NOT NULL, invoice_number TEXT NOT NULL,
+    invoice_amount REAL NOT NULL, invoice_date DATE NOT NULL, status TEXT DEFAULT '待审批', approval_comment TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE attachments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, app_number TEXT NOT NULL, original_filename TEXT NOT NULL,
+    stored_filename TEXT NOT NULL, file_path TEXT NOT NULL);
+'''
+
+
+def test_migrations_with_duplicate_invoice_numbers(database):
+    # 已有重复发票号码时发票号码索引退化为普通索引，迁移仍能完成
+    if db.is_postgres(database):
+        conn = db.connect(database)
+        with conn:
+            c = conn.cursor()
+            postgres.create_tables(c)
+            insert_application(c, 'A1', 'DUP')
+            insert_application(c, 'A2', 'DUP')
+        conn.close()
+    else:
+        conn = sqlite3.connect(database)
+        with conn:
+            conn.executescript(LEGACY_SQLITE_SCHEMA)
+            insert_application(conn.cursor(), 'A1', 'DUP')
+            insert_application(conn.cursor(), 'A2', 'DUP')
+        conn.close()
+    init_database(database)
+    conn = db.connect(database)
+    try:
+        assert migrations.get_version(conn) == _latest_version(database)
+    finally:
+        conn.close()
+
+
+# ---- 版本号 ----
+
+def test_versions_follow_transactions(database):
+    init_database(database)
+    conn = db.connect(database)
+    try:
+        c = conn.cursor()
+        with conn:
+            insert_application(c, 'A1', 'INV-1')
+        data_version = db.get_data_version(c)
+        invoice_version = db.get_version(c, 'invoice_version')
+        with conn:
+            c.execute("UPDATE applications SET invoice_number = 'INV-2' WHERE app_number = 'A1'")
+        assert db.get_data_version(c) > data_version
+        assert db.get_version(c, 'invoice_version') == invoice_version + 1
+        # 回滚的写入不改变版本号
+        data_version = db.get_data_version(c)
+        with pytest.raises(RuntimeError):
+            with conn:
+                insert_application(c, 'A2', 'INV-3')
+                raise RuntimeError
+        assert db.get_data_version(c) == data_version
+    finally:
+        conn.close()
+
+
+def _backend_pid(conn):
+    return conn.execute('SELECT pg_backend_pid()').fetchone()[0]
+
+
+def test_concurrent_writers_do_not_share_version_row(pg_database):
+    init_database(pg_database)
+    first = postgres.connect(pg_database)
+    connections = [first]
+    try:
+        # 找一个与 first 落在不同分片的连接
+        shard = _backend_pid(first) % postgres.VERSION_SHARDS
+        first.rollback()
+        while True:
+            second = postgres.connect(pg_database)
+            connections.append(second)
+            if _backend_pid(second) % postgres.VERSION_SHARDS != shard:
+                second.rollback()
+                break
+        before = db.get_data_version(first.cursor())
+        first.rollback()
+        insert_application(first.cursor(), 'A1', 'INV-1')
+        # first 的事务未提交时，second 的写入不等待版本号的行锁（汇总表按维度值分行，这里使用不同的维度值）
+        second.execute("SET lock_timeout = '2s'")
+        insert_application(second.cursor(), 'A2', 'INV-2', status='驳回', usage_type='公共使用')
+        second.commit()
+        first.commit()
+        assert db.get_data_version(first.cursor()) == before + 2
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+def test_versions_migrate_from_meta(pg_database):
+    init_database(pg_database)
+    conn = postgres.connect(pg_database)
+    try:
+        c = conn.cursor()
+        # 模拟结构版本 10: 版本号保存在 meta 中
+        with conn:
+            c.execute('DROP TABLE version_counters')
+            c.execute("INSERT INTO meta (key, value) VALUES ('data_version', 41), ('invoice_version', 7)")
+            c.execute("UPDATE meta SET value = 10 WHERE key = 'schema_version'")
+        assert migrations.run_migrations(conn) == postgres.SCHEMA_VERSION
+        assert db.get_data_version(c) == 41
+        assert db.get_version(c, 'invoice_version') == 7
+        c.execute("SELECT COUNT(*) FROM meta WHERE key IN ('data_version', 'invoice_version')")
+        assert c.fetchone()[0] == 0
+        with conn:
+            insert_application(c, 'A1', 'INV-1')
+        assert db.get_data_version(c) == 42
+    finally:
+        conn.close()
+
+
+# ---- 从 SQLite 复制 ----
+
+@pytest.fixture
+def sqlite_source(tmp_path):
+    path = str(tmp_path / 'source.db')
+    init_database(path)
+    conn = sqlite3.connect(path)
+    with conn:
+        c = conn.cursor()
+        for i in range(1, 8):
+            insert_application(c, f'A{i}', f'INV-{i}', invoice_amount=10.0 * i,
+                               status='已报销' if i % 2 else '待审批')
+            c.execute('INSERT INTO attachments (app_number, original_filename, stored_filename, file_path) '
+                      'VALUES (?, ?, ?, ?)', (f'A{i}', f'{i}.pdf', f'INV-{i}.pdf', f'/tmp/{i}.pdf'))
+        insert_application(c, 'ARCH1', 'INV-ARCH', table='applications_archive', id=100, status='已报销',
+                           archived_at='2025-01-01 00:00:00')
+        c.execute("UPDATE applications SET invoice_number = 'INV-1B' WHERE app_number = 'A1'")
+        c.execute("DELETE FROM applications WHERE app_number = 'A3'")
+        c.execute("DELETE FROM attachments WHERE app_number = 'A3'")
+    conn.close()
+    return path
+
+
+def test_copy_from_sqlite(sqlite_source, pg_database):
+    counts = postgres.copy_from_sqlite(sqlite_source, pg_database, batch_size=2)
+    src = sqlite3.connect(sqlite_source)
+    conn = postgres.connect(pg_database)
+    try:
+        c = conn.cursor()
+        for table in postgres.COPY_TABLES:
+            expected = src.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            assert counts[table] == expected
+            c.execute(f'SELECT COUNT(*) FROM {table}')
+            assert c.fetchone()[0] == expected
+        assert (sorted(src.execute('SELECT id, app_number, invoice_number FROM applications'))
+                == sorted(c.execute('SELECT id, app_number, invoice_number FROM applications').fetchall()))
+        for key in postgres.VERSION_KEYS:
+            expected = src.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()[0]
+            assert db.get_version(c, key) == expected
+        assert migrations.get_version(conn) == postgres.SCHEMA_VERSION
+        assert summary.check(c) == []
+        conn.rollback()
+
+        # 自增序列已调到最大 id 之后，触发器已恢复
+        with conn:
+            new_id = insert_application(c, 'NEW', 'INV-NEW')
+        assert new_id > src.execute('SELECT MAX(id) FROM applications').fetchone()[0]
+        assert summary.check(c) == []
+        with pytest.raises(Exception) as excinfo:
+            with conn:
+                insert_application(c, 'NEW2', 'INV-ARCH')
+        assert db.is_integrity_error(excinfo.value)
+    finally:
+        conn.close()
+        src.close()
+
+
+def test_copy_from_sqlite_requires_empty_target(sqlite_source, pg_database):
+    postgres.copy_from_sqlite(sqlite_source, pg_database)
+    with pytest.raises(ValueError):
+        postgres.copy_from_sqlite(sqlite_source, pg_database)
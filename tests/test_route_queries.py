@@ -0,0 +1,109 @@
+import re
+
+import pytest
+
+import approvals
+import db
+import migrations
+from conftest import insert_application
+
+ROWS = 30
+ARCHIVED = 2
+DATA_TABLES = re.compile(r'\b(applications|attachments)(_archive)?\b')
+
+
+def _normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+# 记录请求期间执行的语句: 模板（带 ? 占位符，经 db 的语句观察者）和代入参数后的语句（SQLite 跟踪回调）
+@pytest.fixture
+def captured(monkeypatch):
+    templates, expanded = [], []
+    monkeypatch.setattr(db, '_statement_observer', lambda sql, seconds: templates.append(_normalize(sql)))
+    connect = db.connect
+
+    def traced(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(expanded.append)
+        return conn
+    monkeypatch.setattr(db, 'connect', traced)
+    return templates, expanded
+
+
+def _add_attachment(c, app_number, name, content_hash):
+    c.execute('''INSERT INTO attachments (app_number, original_filename, stored_filename, file_path, content_hash)
+                 VALUES (?, ?, ?, ?, ?)''', (app_number, name, f'{app_number}_{name}', f'/blobs/{content_hash}', content_hash))
+
+
+# 以 DASHBOARD_INDEX_CASES 和各路由覆盖 route_queries 的查询：
+# A000-A001 已报销且很久未更新（由 archive-applications 归档），其余待审批；每条申请一个附件，A000 与 A002 内容相同
+@pytest.fixture
+def traffic(app, client, captured):
+    import app as app_module
+    conn = db.connect(app.config['DATABASE'])
+    with conn:
+        c = conn.cursor()
+        for i in range(ROWS):
+            settled = {'status': '已报销', 'updated_at': '2024-06-01 00:00:00'} if i < ARCHIVED else {}
+            insert_application(c, f'A{i:03d}', f'INV-{i}', item_name='键盘鼠标套装',
+                               invoice_amount=50.0 + i, **settled)
+            _add_attachment(c, f'A{i:03d}', 'invoice.pdf', 'shared' if i in (0, 2) else f'hash{i}')
+    conn.close()
+    templates, expanded = captured
+    del templates[:], expanded[:]
+
+    result = app.test_cli_runner().invoke(app_module.archive_applications_command, ['--older-than-days', '0'])
+    assert result.exit_code == 0, result.output
+    client.post('/admin/auth', data={'username': 'admin', 'password': 'admin123'})
+    for args in app_module.DASHBOARD_INDEX_CASES.values():
+        assert client.get('/admin/dashboard', query_string=dict(args, per_page=25)).status_code == 200
+    assert client.get('/check_invoice/INV-5').status_code == 200
+    assert client.post('/check_invoices', json={'invoice_numbers': ['INV-0', 'INV-1']}).get_json()['existing'] \
+        == ['INV-0', 'INV-1']
+    client.post('/query_status', data={'query_invoice_number': 'INV-0'})
+    client.get('/success/A000')
+    for app_number in ('A000', 'A002'):
+        assert client.get(f'/admin/application/{app_number}').status_code == 200
+        assert client.get(f'/api/applications/{app_number}/attachments').status_code == 200
+    client.get('/download/A000_invoice.pdf')
+    assert client.post('/admin/batch_approve', json={'status': '报销中', 'app_numbers': ['A010', 'A011']}) \
+        .get_json()['success']
+    # 审批不改变发票号码，号码索引增量加载
+    assert client.get('/check_invoice/INV-5').status_code == 200
+    client.post('/admin/delete/A003')
+    return templates, expanded
+
+
+# check-indexes 检查的每条语句确实是路由执行的语句（与路由代码不一致时检查就没有意义）
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_route_queries_are_executed(traffic):
+    import app as app_module
+    executed = set(traffic[0])
+    missing = {name: _normalize(sql) for name, (sql, _) in app_module.route_queries().items()
+               if _normalize(sql) not in executed}
+    assert not missing
+
+
+# 请求期间对申请 / 附件表执行的每条查询都走索引
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_executed_queries_use_index(app, traffic):
+    statements = {_normalize(sql) for sql in traffic[1]
+                  if re.match(r'\s*(SELECT|UPDATE|DELETE)\b', sql, re.IGNORECASE) and DATA_TABLES.search(sql)}
+    assert len(statements) > 20
+    conn = db.connect(app.config['DATABASE'])
+    try:
+        results = migrations.explain_route_queries(conn, {sql: (sql, ()) for sql in sorted(statements)},
+                                                   setup=[approvals.BULK_TABLE])
+    finally:
+        conn.close()
+    assert {sql: plan for sql, (uses_index, plan) in results.items() if not uses_index} == {}
+
+
+@pytest.mark.parametrize('database', ['sqlite'], indirect=True)
+def test_check_indexes_command(app):
+    import app as app_module
+    result = app.test_cli_runner().invoke(app_module.check_indexes_command)
+    assert result.exit_code == 0, result.output
+    assert '[OK] batch_approve:' in result.output
+    assert '[SCAN]' not in result.output
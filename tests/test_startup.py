@@ -0,0 +1,41 @@
+import json
+import os
+import platform
+
+import pytest
+
+from benchmarks import bench_startup
+from benchmarks.workload import baseline_path
+
+# 与 benchmarks/baselines/startup.json 对比导入耗时和内存时允许的上升比例。
+# 测试与其他进程并行运行时耗时波动较大，默认比基准脚本的 REGRESSION_THRESHOLD 宽松
+TOLERANCE = float(os.environ.get('STARTUP_TOLERANCE', 0.5))
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    with open(baseline_path('startup'), encoding='utf-8') as f:
+        baseline = json.load(f)
+    # 不同 Python 版本导入的标准库模块和内存占用不同，基线没有可比性
+    if baseline['meta']['python'].rsplit('.', 1)[0] != platform.python_version().rsplit('.', 1)[0]:
+        pytest.skip(f"基线由 Python {baseline['meta']['python']} 生成")
+    return baseline
+
+
+@pytest.fixture(scope='module')
+def workdir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('startup'))
+
+
+def test_import_within_baseline(baseline, workdir):
+    current = bench_startup.measure_import(workdir, eager=False, repeat=3)
+    regressions = bench_startup.compare({'scenarios': {'import': current}},
+                                        {'scenarios': {'import': baseline['scenarios']['import']}}, TOLERANCE)
+    assert not regressions
+    assert current['heavy_loaded'] == []
+
+
+# 按需导入的模块确实是导入 app 之后才加载的（否则上面的对比没有意义）
+def test_preload_modules_are_loaded_on_demand(workdir):
+    eager = bench_startup.measure_import(workdir, eager=True, repeat=1)
+    assert 'openpyxl' in eager['heavy_loaded']
@@ -0,0 +1,123 @@
+import io
+import os
+import threading
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import db
+import storage
+from conftest import init_database, insert_application
+
+
+@pytest.fixture
+def env(database, tmp_path):
+    init_database(database)
+    folder = str(tmp_path / 'uploads')
+    opened = []
+
+    def connect():
+        conn = db.connect(database)
+        opened.append(conn)
+        return conn
+    yield folder, connect
+    for conn in opened:
+        conn.close()
+
+
+def _stage(folder, content, filename='a.pdf'):
+    return storage.stage_upload(FileStorage(io.BytesIO(content), filename=filename), folder)
+
+
+def _attach(c, app_number, path):
+    c.execute('INSERT INTO attachments (app_number, original_filename, stored_filename, file_path) '
+              'VALUES (?, ?, ?, ?)', (app_number, 'a.pdf', f'{app_number}.pdf', path))
+
+
+def _submit(conn, folder, app_number, content):
+    with storage.FileChanges(folder, lambda: conn) as files, conn:
+        c = conn.cursor()
+        insert_application(c, app_number, f'INV-{app_number}')
+        path = files.place(c, _stage(folder, content))
+        _attach(c, app_number, path)
+    return path
+
+
+def test_place_deduplicates(env):
+    folder, connect = env
+    conn = connect()
+    first = _submit(conn, folder, 'A1', b'same')
+    second = _submit(conn, folder, 'A2', b'same')
+    assert first == second and os.path.exists(first)
+    assert [name for name in os.listdir(folder) if name.startswith('.upload-')] == []
+
+
+def test_rollback_removes_created_files(env):
+    folder, connect = env
+    conn = connect()
+    kept = _submit(conn, folder, 'A1', b'kept')
+    with pytest.raises(RuntimeError):
+        with storage.FileChanges(folder, lambda: conn) as files, conn:
+            c = conn.cursor()
+            insert_application(c, 'A2', 'INV-A2')
+            created = files.place(c, _stage(folder, b'new'))
+            reused = files.place(c, _stage(folder, b'kept'))
+            raise RuntimeError
+    assert not os.path.exists(created)
+    assert reused == kept and os.path.exists(kept)
+
+
+def test_release_waits_for_commit(env):
+    folder, connect = env
+    conn = connect()
+    path = _submit(conn, folder, 'A1', b'data')
+    # 事务回滚时附件记录恢复，文件保留
+    with pytest.raises(RuntimeError):
+        with storage.FileChanges(folder, lambda: conn) as files, conn:
+            conn.cursor().execute("DELETE FROM attachments WHERE app_number = 'A1'")
+            files.release(path)
+            assert os.path.exists(path)
+            raise RuntimeError
+    assert os.path.exists(path)
+    with storage.FileChanges(folder, lambda: conn) as files, conn:
+        conn.cursor().execute("DELETE FROM attachments WHERE app_number = 'A1'")
+        files.release(path)
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
+
+
+def test_release_keeps_shared_files(env):
+    folder, connect = env
+    conn = connect()
+    path = _submit(conn, folder, 'A1', b'shared')
+    _submit(conn, folder, 'A2', b'shared')
+    with storage.FileChanges(folder, lambda: conn) as files, conn:
+        conn.cursor().execute("DELETE FROM attachments WHERE app_number = 'A1'")
+        files.release(path)
+    assert os.path.exists(path)
+
+
+# 一个事务释放文件、另一个尚未提交的事务同时复用了它: 删除前的引用确认要等待后者结束
+def test_concurrent_place_is_not_deleted(env):
+    folder, connect = env
+    releaser, placer = connect(), connect()
+    path = _submit(releaser, folder, 'A1', b'contended')
+
+    c = placer.cursor()
+    insert_application(c, 'A2', 'INV-A2', status='驳回', usage_type='公共使用')
+    files = storage.FileChanges(folder, lambda: placer)
+    assert files.place(c, _stage(folder, b'contended')) == path
+    _attach(c, 'A2', path)
+
+    def release():
+        with storage.FileChanges(folder, lambda: releaser) as changes, releaser:
+            releaser.cursor().execute("DELETE FROM attachments WHERE app_number = 'A1'")
+            changes.release(path)
+    thread = threading.Thread(target=release)
+    thread.start()
+    thread.join(0.5)
+    assert thread.is_alive()
+    placer.commit()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert os.path.exists(path)
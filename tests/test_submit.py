@@ -0,0 +1,140 @@
+import io
+import os
+
+import pytest
+
+import db
+import invoices
+from conftest import insert_application
+
+
+def _form(invoice_number, **fields):
+    form = {
+        'purchaser': '张三',
+        'purchase_details': '办公使用',
+        'item_name': '键盘',
+        'product_link': '',
+        'usage_type': '个人使用',
+        'item_type': '电子产品',
+        'quantity': '1',
+        'purchase_time': '2025-03-01',
+        'invoice_number': invoice_number,
+        'invoice_amount': '100.5',
+        'invoice_date': '2025-03-01',
+    }
+    form.update(fields)
+    return form
+
+
+def _count(app, sql, params=()):
+    conn = db.connect(app.config['DATABASE'])
+    try:
+        c = conn.cursor()
+        c.execute(sql, params)
+        return c.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _flashes(client):
+    with client.session_transaction() as session:
+        return [message for _, message in session.get('_flashes', [])]
+
+
+def test_submit_creates_application(app, client):
+    form = _form('INV-1', attachments=(io.BytesIO(b'%PDF-1.4 test'), 'invoice.pdf'))
+    response = client.post('/submit', data=form, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert '/success/' in response.headers['Location']
+    assert _count(app, 'SELECT COUNT(*) FROM applications WHERE invoice_number = ?', ('INV-1',)) == 1
+    assert _count(app, 'SELECT COUNT(*) FROM attachments') == 1
+
+
+def test_submit_duplicate_invoice_number(app, client):
+    client.post('/submit', data=_form('INV-1'))
+    response = client.post('/submit', data=_form('INV-1'))
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/')
+    assert any('INV-1' in message and '已存在' in message for message in _flashes(client))
+    assert _count(app, 'SELECT COUNT(*) FROM applications') == 1
+
+
+# 检查之后、写入之前号码被其他请求使用: 唯一索引（或归档表触发器）拒绝写入，返回提示而不是 500
+@pytest.mark.parametrize('table', ['applications', 'applications_archive'])
+def test_submit_race_is_rejected_by_database(app, client, monkeypatch, table):
+    conn = db.connect(app.config['DATABASE'])
+    with conn:
+        extra = {'id': 1000, 'archived_at': '2025-01-01 00:00:00', 'status': '已报销'} \
+            if table == 'applications_archive' else {}
+        insert_application(conn.cursor(), 'OTHER', 'INV-RACE', table=table, **extra)
+    conn.close()
+    real_query_existing = invoices.query_existing
+    calls = []
+
+    def stale_first_check(c, numbers):
+        calls.append(numbers)
+        return set() if len(calls) == 1 else real_query_existing(c, numbers)
+    monkeypatch.setattr(invoices, 'query_existing', stale_first_check)
+    form = _form('INV-RACE', attachments=(io.BytesIO(b'%PDF-1.4 race'), 'race.pdf'))
+    response = client.post('/submit', data=form, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert any('INV-RACE' in message for message in _flashes(client))
+    assert _count(app, 'SELECT COUNT(*) FROM applications WHERE app_number != ?', ('OTHER',)) == 0
+    assert _count(app, 'SELECT COUNT(*) FROM attachments') == 0
+    # 未提交的事务放置的附件文件已删除
+    assert [files for _, _, files in os.walk(app.config['UPLOAD_FOLDER']) if files] == []
+
+
+def test_update_race_is_rejected_by_database(app, client):
+    conn = db.connect(app.config['DATABASE'])
+    with conn:
+        insert_application(conn.cursor(), 'A1', 'INV-1')
+    conn.close()
+
+    # 路由检查归档表之后、执行 UPDATE 之前，另一个连接把号码写入归档表（只有触发器能拒绝）
+    def archive_after_check(sql, seconds):
+        if sql.startswith('SELECT COUNT(*) FROM applications_archive') and not archived:
+            archived.append(True)
+            other = db.connect(app.config['DATABASE'])
+            with other:
+                insert_application(other.cursor(), 'ARCH', 'INV-ARCH', table='applications_archive', id=1000,
+                                   archived_at='2025-01-01 00:00:00', status='已报销')
+            other.close()
+    archived = []
+    db.set_statement_observer(archive_after_check)
+    try:
+        response = client.post('/update', data=_form('INV-ARCH', app_number='A1'))
+    finally:
+        db.set_statement_observer(None)
+    assert archived
+    assert response.status_code == 302
+    assert any('INV-ARCH' in message for message in _flashes(client))
+    assert _count(app, "SELECT COUNT(*) FROM applications WHERE invoice_number = 'INV-1'") == 1
+
+
+# 下载缓存在删除附件的事务提交之后才清除（提交前清除时，其他请求仍会读到被删除的附件并重新写入缓存）
+@pytest.mark.parametrize('route', ['update', 'delete'])
+def test_download_cache_invalidated_after_commit(app, client, monkeypatch, route):
+    import app as app_module
+    conn = db.connect(app.config['DATABASE'])
+    with conn:
+        c = conn.cursor()
+        insert_application(c, 'A1', 'INV-1')
+        c.execute('''INSERT INTO attachments (id, app_number, original_filename, stored_filename, file_path)
+                     VALUES (1, 'A1', 'invoice.pdf', 'INV-1_invoice.pdf', ?)''',
+                  (os.path.join(app.config['UPLOAD_FOLDER'], 'INV-1_invoice.pdf'),))
+    conn.close()
+    remaining = []
+    real_invalidate = app_module.invalidate_cache
+
+    def invalidate(name):
+        remaining.append(_count(app, "SELECT COUNT(*) FROM attachments WHERE app_number = 'A1'"))
+        real_invalidate(name)
+    monkeypatch.setattr(app_module, 'invalidate_cache', invalidate)
+    if route == 'update':
+        response = client.post('/update', data=_form('INV-1', app_number='A1', deleted_attachments='1'))
+    else:
+        client.post('/admin/auth', data={'username': 'admin', 'password': 'admin123'})
+        response = client.post('/admin/delete/A1')
+    assert response.status_code == 302
+    assert remaining == [0]